@@ -76,7 +76,7 @@ class DrawBox:
             pos=np.array(box.coords_of_cg, dtype=np.float32)[[1, 0, 2]] / 1000,
             center_of_mass=np.array([0, 0, 0]),
             mass=box.weight*1000,
-            dimensions=np.array(box.dimensions, dtype=np.float32)[[1, 0, 2]] / 1000
+            dimensions=np.array(box.floor_dimensions, dtype=np.float32)[[1, 0, 2]] / 1000
         )
         drawbox.pos[1] = platform.floor_length / 1000 / 2 - drawbox.pos[1]
         return drawbox
@@ -61,6 +61,10 @@ def _generate_pdf_figure(order, boxes: list[Box], carriage: Carriage) -> None:
     current_row_height = add_text(ax, "= " +report.s_side_surface_calculation, current_row_height=current_row_height)
     current_row_height = add_text(ax, ("Требуется ли проверка поперечной устойчивости груженого вагона: "+  "требуется" if report.is_transverse_need_check else "не требуется"), current_row_height=current_row_height)
 
+    current_row_height = add_text(ax, "4. Размещение грузов:", current_row_height=current_row_height)
+    rotated = sum(box.rotated for box in boxes)
+    current_row_height = add_text(ax, f"Развёрнуто на 90° поперёк вагона: {rotated} из {len(boxes)} грузов", current_row_height=current_row_height)
+
 
 def generate_pdf_report_bytes(**kwargs):
     _generate_pdf_figure(**kwargs)
@@ -0,0 +1,39 @@
+import time
+
+from topology.benchmark import synthetic_boxes, synthetic_platform
+from topology.constructive import _Half, first_fit_decreasing
+from topology.convert import build_arrays
+
+
+def test_first_fit_decreasing_prunes_extreme_points(monkeypatch):
+    # every candidate used to check 4 points a placed box against every placed box, O(N^3) in all;
+    # the points where no box fits any more are dropped, so there are only a few of them at a time
+    points = []
+    candidate = _Half.candidate
+
+    def counted(self, size):
+        points.append(len(self.points))
+        return candidate(self, size)
+
+    monkeypatch.setattr(_Half, "candidate", counted)
+    masses, bbox, main_bbox = build_arrays(synthetic_platform(), synthetic_boxes(600, seed=0, size=(150, 300)),
+                                           False, None)
+    start = time.perf_counter()
+    _, fits = first_fit_decreasing(masses, bbox, main_bbox)
+    elapsed = time.perf_counter() - start
+
+    assert max(points) <= 64
+    assert fits.sum() >= 570
+    assert elapsed < 5.0
+
+
+def test_first_fit_decreasing_places_without_overlaps():
+    masses, bbox, main_bbox = build_arrays(synthetic_platform(), synthetic_boxes(100, seed=1), False, None)
+    pos, fits = first_fit_decreasing(masses, bbox, main_bbox)
+    centers = pos[:, :2] + bbox[:, 0, :2]
+    size = bbox[:, 1, :2]
+    assert fits.all()
+    gap = abs(centers[:, None] - centers[None]) - (size[:, None] + size[None]) / 2
+    overlap = (gap < -1e-6).all(axis=-1)
+    overlap[range(len(pos)), range(len(pos))] = False
+    assert not overlap.any()
@@ -0,0 +1,20 @@
+import copy
+
+from topology.benchmark import synthetic_boxes, synthetic_platform
+from topology.main import calculate_optimal_placement
+from topology.options import PlacementOptions, split_options
+
+
+def test_split_options():
+    options, rest = split_options(PlacementOptions(seed=1, stacking=True), dict(seed=2, max_steps=10, workers=1))
+    assert options == PlacementOptions(seed=2, stacking=True, max_steps=10)
+    assert rest == dict(workers=1)
+    assert split_options(None, {}) == (PlacementOptions(), {})
+
+
+def test_options_and_overrides_give_the_same_layout():
+    platform, boxes = synthetic_platform(), synthetic_boxes(10, seed=0)
+    by_options, by_overrides = copy.deepcopy(boxes), copy.deepcopy(boxes)
+    calculate_optimal_placement(platform, by_options, PlacementOptions(seed=0), max_steps=50)
+    calculate_optimal_placement(platform, by_overrides, seed=0, max_steps=50)
+    assert [box.coords_of_cg for box in by_options] == [box.coords_of_cg for box in by_overrides]
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from topology.benchmark import MAIN_BBOX, _loss_and_grad, _loss_mismatch, synthetic_items
+
+NS = (4, 10, 20, 50)
+
+
+def positions(n, seed=0, starts=3):
+    # the layout of synthetic_items and a (starts, N, 3) batch of others
+    import torch
+
+    rng = np.random.default_rng(seed)
+    batch = rng.normal(size=(starts, n, 3)) * np.array([1, 1, 0]) * MAIN_BBOX[1] / 4
+    return synthetic_items(n, seed=seed).pos, torch.tensor(batch, dtype=torch.float32)
+
+
+def numpy_items(items):
+    from topology.numpy_backend import NumpyItems
+
+    return NumpyItems(items.mass.numpy(), items.bbox.numpy(), items.main_bbox.numpy(), pos=items.pos.numpy())
+
+
+@pytest.mark.parametrize("n", NS)
+def test_numpy_loss_and_gradient_match_torch(n):
+    items = synthetic_items(n)
+    for pos in positions(n):
+        loss, grad = _loss_and_grad(items, pos)
+        numpy_loss, numpy_grad = numpy_items(items).loss_and_grad(pos.numpy().astype(np.float64))
+        np.testing.assert_allclose(numpy_loss, loss.numpy(), rtol=1e-5)
+        # relative to the largest component, the small ones are all rounding
+        assert np.abs(numpy_grad - grad.numpy()).max() <= 1e-5 * np.abs(grad.numpy()).max()
+
+
+@pytest.mark.parametrize("n", NS)
+@pytest.mark.parametrize("options", [dict(collision="sweep"), dict(collision="tiled", tile=4),
+                                     dict(loss_mode="fused")], ids=["sweep", "tiled", "fused"])
+def test_loss_paths_match_dense(n, options):
+    dense = synthetic_items(n)
+    for pos in positions(n):
+        # the sweep collision keeps the pairs of the layout it was first called on
+        loss_diff, grad_diff = _loss_mismatch(dense, synthetic_items(n, **options), pos)
+        assert loss_diff < 1e-5
+        assert grad_diff < 1e-5
+
+
+@pytest.mark.parametrize("n", (4, 10, 20))
+def test_numpy_optimize_matches_torch(n):
+    # checkpoints are not kept: which one is the best depends on the last digits of the loss
+    from topology.monitor import ConvergenceMonitor
+
+    items = synthetic_items(n)
+    other = numpy_items(items)
+    items.optimize(shuffle=False, monitor=ConvergenceMonitor(keep_best=False))
+    other.optimize(shuffle=False, monitor=ConvergenceMonitor(keep_best=False))
+    assert np.abs(items.pos.numpy() - other.pos).max() < items.safe_dist
+
+
+def test_main_does_not_import_torch():
+    code = "import sys, topology.main; print('torch' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          check=True).stdout.strip() == "False"
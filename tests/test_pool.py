@@ -0,0 +1,49 @@
+import copy
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from topology.benchmark import synthetic_boxes, synthetic_platform
+from topology.fleet import plan_fleet
+from topology.pool import SolverPool
+
+
+def hang(frame):
+    # progress callback of a placement that never finishes; the workers import it from this module
+    time.sleep(3600)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with SolverPool(2, threads=1, warm_up=False) as pool:
+        pool.wait_ready()
+        yield pool
+
+
+def test_results_abandons_the_hanging_placements(pool):
+    platform, boxes = synthetic_platform(), synthetic_boxes(10, seed=0)
+    futures = [pool.submit(platform, copy.deepcopy(boxes), max_steps=20, seed=0),
+               pool.submit(platform, copy.deepcopy(boxes), max_steps=20, seed=0, progress=hang)]
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        pool.gather(futures, timeout=5.0)
+    assert time.perf_counter() - start < 8.0
+    assert futures[0].result(0) is not None
+    with pytest.raises(TimeoutError):
+        futures[1].result(0)
+    # the killed worker is replaced
+    assert pool.gather([pool.submit(platform, copy.deepcopy(boxes), max_steps=20, seed=0)], timeout=60.0)
+
+
+def test_plan_fleet_waits_once_for_all_the_carriages(pool):
+    # every one of the 3 carriages hangs, the timeout is for all of them together and not one after another;
+    # the one left in the queue is stopped as soon as a worker takes it
+    boxes = synthetic_boxes(60, seed=0)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        plan_fleet([synthetic_platform()], boxes, fill=0.1, pool=pool, pool_timeout=3.0, progress=hang)
+    assert time.perf_counter() - start < 6.0
+    platform = synthetic_platform()
+    assert pool.gather([pool.submit(platform, synthetic_boxes(10, seed=0), max_steps=20, seed=0)
+                        for _ in range(2)], timeout=60.0)
@@ -0,0 +1,24 @@
+from topology.benchmark import synthetic_boxes, synthetic_platform
+from topology.selection import select_and_place
+from validation.models import Box
+
+
+def test_select_and_place_loads_nothing():
+    # wider than the floor either way round, and too heavy for max_weight
+    boxes = [Box(dimensions=(3000, 3000, 500), weight=1.0, amount=2)]
+    loaded, unloaded, result = select_and_place(synthetic_platform(), boxes, max_steps=20, seed=0)
+    assert loaded == []
+    assert [box.amount for box in unloaded] == [2]
+    assert result.steps == 0 and not result.has_overlap
+
+    loaded, unloaded, result = select_and_place(synthetic_platform(), synthetic_boxes(5, seed=0), max_weight=0.01,
+                                                max_steps=20, seed=0)
+    assert loaded == [] and len(unloaded) == 5
+    assert result.steps == 0
+
+
+def test_select_and_place_splits_the_order():
+    boxes = synthetic_boxes(40, seed=0, size=(600, 1200))
+    loaded, unloaded, result = select_and_place(synthetic_platform(), boxes, fill=0.3, max_steps=200, seed=0)
+    assert loaded and unloaded
+    assert sum(box.amount for box in loaded + unloaded) == 40
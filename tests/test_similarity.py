@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+
+from topology.similarity import match_boxes
+
+
+def greedy(rows, past_rows, max_box_distance):
+    # the pair by pair loop match_boxes replaced
+    cost = np.abs(rows[:, None] - past_rows[None]).sum(axis=-1)
+    match = np.full(len(rows), -1)
+    taken = np.zeros(len(past_rows), dtype=bool)
+    for flat in np.argsort(cost, axis=None, kind="stable"):
+        i, j = np.unravel_index(flat, cost.shape)
+        if cost[i, j] > max_box_distance:
+            break
+        if match[i] < 0 and not taken[j]:
+            match[i] = j
+            taken[j] = True
+    return match
+
+
+def test_match_boxes_is_the_greedy_matching():
+    # few distinct values, so that most pairs tie
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        rows = rng.integers(0, 4, (rng.integers(0, 20), 4)) * 0.05
+        past_rows = rng.integers(0, 4, (rng.integers(0, 20), 4)) * 0.05
+        max_box_distance = rng.choice([0.0, 0.1, 0.3, 10.0])
+        assert (match_boxes(rows, past_rows, max_box_distance) == greedy(rows, past_rows, max_box_distance)).all()
+
+
+def test_match_boxes_scales():
+    # the loop over all the N^2 pairs took 4 s for 1000 boxes; same boxes are the worst case of ties
+    rng = np.random.default_rng(0)
+    rows = rng.random((1000, 4))
+    start = time.perf_counter()
+    match = match_boxes(rows, rows + rng.normal(0, 0.01, rows.shape), 0.1)
+    same = match_boxes(np.zeros_like(rows), np.zeros_like(rows), 0.1)
+    elapsed = time.perf_counter() - start
+
+    assert (match == np.arange(len(rows))).mean() > 0.95
+    assert (same == np.arange(len(rows))).all()
+    assert elapsed < 2.0
@@ -0,0 +1,463 @@
+import argparse
+import copy
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+MAIN_BBOX = np.array([[0, 0, 0], [2.87, 13.3, 10]])
+
+
+def synthetic_platform():
+    from validation.models import Carriage
+
+    return Carriage(floor_length=13300, floor_width=2870, weight=21, height_from_rails=1310,
+                    cg_height_from_rails=800, base_length=9720, length_to_cg=6650, s_side_surface_meters=7)
+
+
+def synthetic_boxes(n, seed=0, size=(200, 600)):
+    from validation.models import Box
+
+    rng = np.random.default_rng(seed)
+    dimensions = rng.integers(*size, (n, 3))
+    weights = np.round(rng.uniform(0.05, 1.0, n), 3)
+    return [Box(dimensions=tuple(d.tolist()), weight=float(w)) for d, w in zip(dimensions, weights)]
+
+
+def synthetic_items(n, seed=0, **kwargs):
+    from topology.process import Items
+
+    rng = np.random.default_rng(seed)
+    dimensions = rng.uniform(0.2, 1.5, (n, 3)).astype(np.float32)
+    bbox = np.stack([np.zeros_like(dimensions), dimensions], axis=-2)
+    masses = rng.uniform(100, 2000, n)
+    pos = rng.normal(size=(n, 3)) * np.array([1, 1, 0]) * MAIN_BBOX[1] / 2
+    return Items(masses, bbox, MAIN_BBOX, pos=pos, **kwargs)
+
+
+def _collision_peak_memory(n, collision, tile):
+    # peak of the memory torch allocates during one forward and backward pass of the collision loss, over what
+    # was allocated before it; taken from the allocation events of the profiler, ru_maxrss of the process does
+    # not see allocations that fit under the peak left by importing torch
+    import json
+    import os
+    import tempfile
+    from torch.profiler import ProfilerActivity, profile
+
+    items = synthetic_items(n, collision=collision, tile=tile)
+    items.pos.requires_grad = True
+    start = time.perf_counter()
+    items.collision_loss().sum().backward()
+    elapsed = time.perf_counter() - start
+
+    items.pos.grad = None
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as profiler:
+        items.collision_loss().sum().backward()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.json")
+        profiler.export_chrome_trace(path)
+        with open(path) as file:
+            events = [event["args"] for event in json.load(file)["traceEvents"] if event.get("name") == "[memory]"]
+    before = events[0]["Total Allocated"] - events[0]["Bytes"]
+    return (max(event["Total Allocated"] for event in events) - before) / 2 ** 20, elapsed
+
+
+def benchmark_collision_memory(ns=(250, 500, 1000, 2000), tile=64):
+    print(f"{'N':>6} {'dense MB':>10} {'dense s':>8} {'tiled MB':>10} {'tiled s':>8}")
+    for n in ns:
+        row = []
+        for collision in ("dense", "tiled"):
+            row += _collision_peak_memory(n, collision, tile)
+        print(f"{n:>6} {row[0]:>10.1f} {row[1]:>8.3f} {row[2]:>10.1f} {row[3]:>8.3f}")
+
+
+def _steps_per_second(items, steps):
+    import torch
+
+    pos = items.pos.clone().requires_grad_()
+    optimizer = torch.optim.Adam([pos], lr=items.safe_dist)
+    # first steps pay for compilation and allocator warm-up
+    for i in range(steps // 10 + 1):
+        optimizer.zero_grad()
+        items.get_all_loss(pos).backward()
+        optimizer.step()
+
+    start = time.perf_counter()
+    for i in range(steps):
+        optimizer.zero_grad()
+        items.get_all_loss(pos).backward()
+        optimizer.step()
+    return steps / (time.perf_counter() - start)
+
+
+def benchmark_loss_modes(ns=(4, 10, 25, 50), steps=500, modes=("eager", "fused", "compiled")):
+    print(f"{'N':>6}" + "".join(f"{mode + ' st/s':>16}" for mode in modes))
+    for n in ns:
+        row = [_steps_per_second(synthetic_items(n, loss_mode=mode), steps) for mode in modes]
+        print(f"{n:>6}" + "".join(f"{value:>16.0f}" for value in row))
+
+
+def _loss_and_grad(items, pos):
+    pos = pos.clone().requires_grad_()
+    loss = items.get_all_loss(pos)
+    loss.sum().backward()
+    return loss.detach(), pos.grad
+
+
+def _loss_mismatch(reference, other, pos) -> tuple[float, float]:
+    # largest relative differences of the loss and of the gradient (to the largest gradient component)
+    # between two Items on the same (..., N, 3) positions
+    loss, grad = _loss_and_grad(reference, pos)
+    other_loss, other_grad = _loss_and_grad(other, pos)
+    loss_diff = ((other_loss - loss).abs() / loss.abs().clip(1e-12)).max().item()
+    grad_diff = ((other_grad - grad).abs().max() / grad.abs().max().clip(1e-12)).item()
+    return loss_diff, grad_diff
+
+
+def check_loss_paths(ns=(4, 10, 20, 50), seed=0, starts=3, rtol=1e-5):
+    # the sweep-and-prune and tiled collisions and the fused loss give the loss and gradient of the eager dense
+    # one, on a single layout and on a (starts, N, 3) batch; the table of what tests/test_parity.py asserts
+    import torch
+
+    ok = True
+    print(f"{'N':>6} {'shape':>12} {'case':>16} {'loss rel':>10} {'grad rel':>10}")
+    for n in ns:
+        rng = np.random.default_rng(seed)
+        batch = rng.normal(size=(starts, n, 3)) * np.array([1, 1, 0]) * MAIN_BBOX[1] / 4
+        dense = synthetic_items(n, seed=seed)
+        for pos in (dense.pos, torch.tensor(batch, dtype=torch.float32)):
+            cases = {"sweep / dense": synthetic_items(n, seed=seed, collision="sweep"),
+                     "tiled / dense": synthetic_items(n, seed=seed, collision="tiled", tile=4),
+                     "fused / eager": synthetic_items(n, seed=seed, loss_mode="fused")}
+            for case, other in cases.items():
+                loss_diff, grad_diff = _loss_mismatch(dense, other, pos)
+                ok &= loss_diff < rtol and grad_diff < rtol
+                print(f"{n:>6} {str(tuple(pos.shape)):>12} {case:>16} {loss_diff:>10.2e} {grad_diff:>10.2e}")
+    return ok
+
+
+def check_backend_parity(ns=(4, 10, 20), seed=0):
+    # same start positions through both backends, final placements should agree within safe_dist; the table
+    # of what tests/test_parity.py asserts
+    # (checkpoints are not kept: which one is the best depends on the last digits of the loss)
+    from topology.monitor import ConvergenceMonitor
+    from topology.numpy_backend import NumpyItems
+
+    ok = True
+    print(f"{'N':>6} {'max pos diff':>14} {'loss torch':>12} {'loss numpy':>12} {'torch s':>8} {'numpy s':>8}")
+    for n in ns:
+        items = synthetic_items(n, seed=seed)
+        numpy_items = NumpyItems(items.mass.numpy(), items.bbox.numpy(), items.main_bbox.numpy(), pos=items.pos.numpy())
+
+        start = time.perf_counter()
+        items.optimize(shuffle=False, monitor=ConvergenceMonitor(keep_best=False))
+        torch_time = time.perf_counter() - start
+        start = time.perf_counter()
+        numpy_items.optimize(shuffle=False, monitor=ConvergenceMonitor(keep_best=False))
+        numpy_time = time.perf_counter() - start
+
+        diff = np.abs(items.pos.numpy() - numpy_items.pos).max()
+        ok &= bool(diff < items.safe_dist)
+        print(f"{n:>6} {diff:>14.4f} {items.get_all_loss().item():>12.4f} {numpy_items.get_all_loss():>12.4f} "
+              f"{torch_time:>8.3f} {numpy_time:>8.3f}")
+
+    ok &= check_loss_paths(seed=seed)
+
+    code = "import sys, topology.main; print('torch' in sys.modules)"
+    torch_imported = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout.strip()
+    ok &= torch_imported == "False"
+    print("topology.main imports torch:", torch_imported)
+    print("parity:", "OK" if ok else "FAILED")
+    return ok
+
+
+def benchmark_warm_start(n=100, seed=0):
+    # full solve of n boxes, then one more box added and solved incrementally from the stored coordinates
+    from topology.main import calculate_optimal_placement
+
+    platform = synthetic_platform()
+    boxes = synthetic_boxes(n + 1, seed=seed)
+    print(f"{'mode':>22} {'steps':>6} {'seconds':>8} {'overlaps':>8}")
+    result = calculate_optimal_placement(platform, boxes[:n])
+    print(f"{'full, ' + str(n) + ' boxes':>22} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8}")
+    for pin_placed in (False, True):
+        added = [copy.copy(box) for box in boxes]
+        result = calculate_optimal_placement(platform, added, incremental=True, pin_placed=pin_placed)
+        mode = "+1 box" + (", pinned" if pin_placed else "")
+        print(f"{mode:>22} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8}")
+
+
+def benchmark_constructive(ns=(10, 50, 100), seed=0):
+    # time until the first feasible layout, starting from random positions or from the first-fit-decreasing placer
+    from topology.main import calculate_optimal_placement
+    from topology.monitor import ConvergenceMonitor
+
+    platform = synthetic_platform()
+    print(f"{'N':>6} {'init':>12} {'steps':>6} {'seconds':>8} {'overlaps':>8}")
+    for n in ns:
+        boxes = synthetic_boxes(n, seed=seed)
+        result = calculate_optimal_placement(platform, boxes, method="constructive")
+        print(f"{n:>6} {'placer only':>12} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8}")
+        for init in ("random", "constructive"):
+            monitor = ConvergenceMonitor(stop_on_feasible=True)
+            result = calculate_optimal_placement(platform, boxes, init=init, monitor=monitor)
+            print(f"{n:>6} {init:>12} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8}")
+
+
+def benchmark_similarity(n=50, seed=0):
+    # time until the first feasible layout of near-duplicates of a solved order, from random positions
+    # or from the layout of the solved order found by PlacementIndex
+    from topology.main import calculate_optimal_placement
+    from topology.monitor import ConvergenceMonitor
+    from topology.similarity import PlacementIndex
+
+    platform = synthetic_platform()
+    boxes = synthetic_boxes(n + 1, seed=seed)
+    index = PlacementIndex()
+    calculate_optimal_placement(platform, [copy.copy(box) for box in boxes[:n]], seed=seed, index=index)
+
+    rng = np.random.default_rng(seed)
+    reweighted = [copy.copy(box) for box in boxes[:n]]
+    for box in reweighted:
+        box.weight = round(box.weight * rng.uniform(0.95, 1.05), 3)
+    variants = {"+1 box": boxes, "weights +-5%": reweighted}
+
+    print(f"{'order':>14} {'start':>8} {'steps':>6} {'seconds':>8} {'overlaps':>8}")
+    for name, variant in variants.items():
+        for start, start_index in (("random", None), ("index", index)):
+            added = [copy.copy(box) for box in variant]
+            monitor = ConvergenceMonitor(stop_on_feasible=True)
+            result = calculate_optimal_placement(platform, added, seed=seed, monitor=monitor, index=start_index)
+            print(f"{name:>14} {start:>8} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8}")
+
+
+def benchmark_rotation(n=15, seed=0, rotations=(1, 4, 8)):
+    # n crates 1000 mm long and 1500 mm wide: only one fits across the floor as entered, two when turned by 90°,
+    # so the order only has a feasible layout if the orientation search turns them
+    from topology.main import calculate_optimal_placement
+    from validation.models import Box
+
+    platform = synthetic_platform()
+    print(f"{'rotations':>10} {'steps':>6} {'seconds':>8} {'overlaps':>8} {'rotated':>8}")
+    for count in rotations:
+        boxes = [Box(dimensions=(1000, 1500, 1000), weight=1.0, amount=n)]
+        result = calculate_optimal_placement(platform, boxes, seed=seed, rotations=count)
+        turned = sum(boxes[0].pieces_rotated)
+        print(f"{count:>10} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8} {turned:>8}")
+
+
+def benchmark_stacking(n=150, seed=0):
+    # an order with more box footprint than the floor area: on the floor only, or stacked under the
+    # MAX_HEIGHT limit of the center of mass; the optimizer starts from the constructive layout (stacked, it is
+    # returned as it is when it has no conflicts) or from random positions
+    from topology.limits import max_cg_height
+    from topology.main import calculate_optimal_placement
+    from validation.models import expand_pieces
+
+    platform = synthetic_platform()
+    boxes = synthetic_boxes(n, seed=seed, size=(300, 800))
+    footprint = sum(box.dimensions[0] * box.dimensions[1] for box in boxes) / 1e6
+    print(f"footprint {footprint:.1f} m2, floor {platform.floor_length * platform.floor_width / 1e6:.1f} m2, "
+          f"center of mass up to {max_cg_height(platform) * 1000:.0f} mm")
+    print(f"{'stacking':>8} {'method':>12} {'init':>12} {'steps':>6} {'seconds':>8} {'overlaps':>8} {'top mm':>7} "
+          f"{'cg mm':>6} {'limits':>7}")
+    for stacking in (False, True):
+        for method, init in (("constructive", "constructive"), ("optimize", "constructive"), ("optimize", "random")):
+            placed = [copy.copy(box) for box in boxes]
+            result = calculate_optimal_placement(platform, placed, seed=seed, method=method, init=init,
+                                                 stacking=stacking)
+            pieces = expand_pieces(placed)
+            top = max(box.coords_of_cg[2] + box.dimensions[2] / 2 for box in pieces)
+            cg = sum(box.weight * box.coords_of_cg[2] for box in pieces) / sum(box.weight for box in pieces)
+            limits = "ok" if result.within_limits else "FAILED"
+            print(f"{stacking!s:>8} {method:>12} {init:>12} {result.steps:>6} {result.elapsed:>8.3f} "
+                  f"{result.overlaps:>8} {top:>7.0f} {cg:>6.0f} {limits:>7}")
+
+
+def benchmark_limits(seed=0):
+    # a 40 t box pinned 2.5 m off the middle of the floor, the other boxes have to balance it within the
+    # longitudinal limit validation.formulas checks (690 mm for 62 t)
+    from topology.main import calculate_optimal_placement
+    from validation.models import Box
+
+    platform = synthetic_platform()
+    boxes = [
+        Box(dimensions=(3000, 2400, 800), weight=40.0, coords_of_cg=(4150, 0, 400)),
+        Box(dimensions=(1500, 1200, 800), weight=5.5, amount=4),
+    ]
+    print(f"{'constraints':>12} {'backend':>8} {'steps':>6} {'seconds':>8} {'overlaps':>8} {'limits':>7}")
+    for constraints in (None, "penalty", "lagrangian"):
+        for backend in ("torch", "numpy"):
+            placed = [copy.copy(box) for box in boxes]
+            result = calculate_optimal_placement(platform, placed, seed=seed, backend=backend, incremental=True,
+                                                 pin_placed=True, constraints=constraints)
+            limits = "ok" if result.within_limits else "FAILED"
+            print(f"{constraints!s:>12} {backend:>8} {result.steps:>6} {result.elapsed:>8.3f} {result.overlaps:>8} "
+                  f"{limits:>7}")
+
+
+def benchmark_solvers(ns=(10, 50, 100), seed=0, anneal=4.0):
+    # steps and time until the first feasible layout from the same random start with every solver,
+    # with and without a collision margin annealed down from anneal * safe_dist (L-BFGS only without)
+    from topology.main import calculate_optimal_placement
+    from topology.monitor import ConvergenceMonitor
+
+    platform = synthetic_platform()
+    print(f"{'N':>6} {'solver':>10} {'anneal':>7} {'steps':>6} {'seconds':>8} {'overlaps':>8}")
+    for n in ns:
+        boxes = synthetic_boxes(n, seed=seed)
+        for solver in ("adam", "projected", "lbfgs"):
+            for factor in (None,) if solver == "lbfgs" else (None, anneal):
+                monitor = ConvergenceMonitor(stop_on_feasible=True)
+                result = calculate_optimal_placement(platform, [copy.copy(box) for box in boxes], seed=seed,
+                                                     monitor=monitor, solver=solver, anneal=factor)
+                print(f"{n:>6} {solver:>10} {factor!s:>7} {result.steps:>6} {result.elapsed:>8.3f} "
+                      f"{result.overlaps:>8}")
+
+
+def benchmark_segments(ns=(200, 400, 600), seed=0, workers=None, deadline=3.0):
+    # the whole floor at once against segments optimized in parallel (workers processes, one per CPU by default)
+    # and polished together, with the step budget and with a deadline of deadline seconds; the hierarchical
+    # method runs twice with a step budget, the second time on the worker processes the first one started
+    from topology.main import calculate_optimal_placement
+
+    platform = synthetic_platform()
+    print(f"{'N':>6} {'method':>12} {'deadline':>8} {'steps':>6} {'seconds':>8} {'loss':>8} {'overlaps':>8} "
+          f"{'limits':>7}")
+    for n in ns:
+        boxes = synthetic_boxes(n, seed=seed, size=(150, 300))
+        for method, budget in (("optimize", None), ("hierarchical", None), ("hierarchical", None),
+                               ("optimize", deadline), ("hierarchical", deadline)):
+            placed = [copy.copy(box) for box in boxes]
+            result = calculate_optimal_placement(platform, placed, seed=seed, method=method, collision="sweep",
+                                                 workers=workers, deadline=budget)
+            limits = "ok" if result.within_limits else "FAILED"
+            print(f"{n:>6} {method:>12} {budget or '-':>8} {result.steps:>6} {result.elapsed:>8.3f} "
+                  f"{sum(result.losses.values()):>8.4f} {result.overlaps:>8} {limits:>7}")
+
+
+def benchmark_selection(n=300, seed=0):
+    # an order with about twice the floor area in footprint: the whole order overlaps, the selection
+    # loads what fits and leaves the rest
+    from topology.main import calculate_optimal_placement
+    from topology.selection import select_and_place
+
+    platform = synthetic_platform()
+    boxes = synthetic_boxes(n, seed=seed, size=(300, 700))
+    total = sum(box.weight for box in boxes)
+    print(f"{'mode':>10} {'loaded t':>9} {'of t':>7} {'left':>5} {'seconds':>8} {'overlaps':>8} {'limits':>7}")
+    result = calculate_optimal_placement(platform, [copy.copy(box) for box in boxes], seed=seed)
+    limits = "ok" if result.within_limits else "FAILED"
+    print(f"{'all':>10} {total:>9.2f} {total:>7.2f} {0:>5} {result.elapsed:>8.3f} {result.overlaps:>8} {limits:>7}")
+    for objective in ("mass", "volume"):
+        start = time.perf_counter()
+        loaded, unloaded, result = select_and_place(platform, [copy.copy(box) for box in boxes], objective,
+                                                    seed=seed)
+        elapsed = time.perf_counter() - start
+        weight = sum(box.weight * box.amount for box in loaded)
+        left = sum(box.amount for box in unloaded)
+        limits = "ok" if result.within_limits else "FAILED"
+        print(f"{objective:>10} {weight:>9.2f} {total:>7.2f} {left:>5} {elapsed:>8.3f} {result.overlaps:>8} "
+              f"{limits:>7}")
+
+
+def benchmark_pool(n=30, seed=0, workers=2, requests=4):
+    # latency of placements sent to a SolverPool: the first one after the workers started with or without
+    # the warm-up solve, and requests placements submitted at once
+    from topology.pool import SolverPool
+
+    platform = synthetic_platform()
+    boxes = synthetic_boxes(n, seed=seed)
+    print(f"{'case':>24} {'seconds':>8}")
+    for warm_up in (False, True):
+        with SolverPool(workers, warm_up=warm_up) as pool:
+            pool.wait_ready()
+            start = time.perf_counter()
+            pool.place(platform, [copy.copy(box) for box in boxes], seed=seed, max_steps=200)
+            print(f"{'first, warm-up ' + str(warm_up):>24} {time.perf_counter() - start:>8.3f}")
+            start = time.perf_counter()
+            futures = [pool.submit(platform, [copy.copy(box) for box in boxes], seed=seed, max_steps=200)
+                       for _ in range(requests)]
+            for future in futures:
+                future.result()
+            print(f"{str(requests) + ' at once':>24} {time.perf_counter() - start:>8.3f}")
+
+
+def benchmark_instrument(ns=(10, 50), steps=300, seed=0):
+    # optimizer steps per second without an instrument and recording every step or every 10th one,
+    # the loss terms, gradient norms and overlaps of a recorded step cost about one more loss evaluation
+    from topology.instrument import StepRecorder
+    from topology.monitor import ConvergenceMonitor
+
+    cases = {"off": lambda: None, "every 1": lambda: StepRecorder(), "every 10": lambda: StepRecorder(10)}
+    print(f"{'N':>6}" + "".join(f"{case + ' st/s':>16}" for case in cases))
+    for n in ns:
+        # the first solve pays for the allocator and thread pool warm-up
+        synthetic_items(n, seed=seed).optimize(max_steps=steps // 10)
+        row = []
+        for instrument in cases.values():
+            items = synthetic_items(n, seed=seed)
+            # stop_p=None runs all the steps
+            result = items.optimize(max_steps=steps, monitor=ConvergenceMonitor(stop_p=None), instrument=instrument())
+            row.append(result.steps / result.elapsed)
+        print(f"{n:>6}" + "".join(f"{value:>16.0f}" for value in row))
+
+
+def benchmark_trajectory(ns=(10, 50, 200), steps=300, seed=0, repeats=3):
+    # optimizer steps per second without a recorder and recording every step in float16 and float32,
+    # with the size of the file; the best of repeats runs
+    import os
+    import tempfile
+    from topology.monitor import ConvergenceMonitor
+    from topology.trajectory import TrajectoryRecorder
+
+    directory = tempfile.mkdtemp()
+    dtypes = (None, "float16", "float32")
+    print(f"{'N':>6}" + "".join(f"{str(dtype) + ' st/s':>16}" for dtype in dtypes) + f"{'float16 KB':>12}")
+    for n in ns:
+        synthetic_items(n, seed=seed).optimize(max_steps=steps // 10)
+        row = []
+        for dtype in dtypes:
+            path = os.path.join(directory, f"{n}_{dtype}.traj")
+            best = 0
+            for _ in range(repeats):
+                recorder = None if dtype is None else TrajectoryRecorder(path, dtype=dtype)
+                result = synthetic_items(n, seed=seed).optimize(max_steps=steps, recorder=recorder,
+                                                                monitor=ConvergenceMonitor(stop_p=None))
+                best = max(best, result.steps / result.elapsed)
+            row.append(best)
+        size = os.path.getsize(os.path.join(directory, f"{n}_float16.traj")) / 1024
+        print(f"{n:>6}" + "".join(f"{value:>16.0f}" for value in row) + f"{size:>12.0f}")
+
+
+BENCHMARKS = {
+    "memory": benchmark_collision_memory,
+    "loss": benchmark_loss_modes,
+    "parity": check_backend_parity,
+    "warm_start": benchmark_warm_start,
+    "constructive": benchmark_constructive,
+    "similarity": benchmark_similarity,
+    "rotation": benchmark_rotation,
+    "stacking": benchmark_stacking,
+    "limits": benchmark_limits,
+    "solvers": benchmark_solvers,
+    "segments": benchmark_segments,
+    "selection": benchmark_selection,
+    "pool": benchmark_pool,
+    "instrument": benchmark_instrument,
+    "trajectory": benchmark_trajectory,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
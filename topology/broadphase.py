@@ -0,0 +1,51 @@
+import numpy as np
+
+LENGTH_AXIS = 1
+
+
+def sweep_and_prune(centers: np.ndarray, sizes: np.ndarray, cutoff: float, axis: int = LENGTH_AXIS) -> np.ndarray:
+    # centers, sizes - (..., N, 3); leading dims are independent layouts (starts), pairs are merged over them
+    # returns (P, 2) unordered pairs i < j whose boxes are closer than cutoff along every axis
+    centers = np.asarray(centers, dtype=np.float32).reshape((-1,) + np.shape(centers)[-2:])
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float32), centers.shape)
+    n = centers.shape[-2]
+
+    pairs = []
+    for c, s in zip(centers, sizes):
+        lo = c[:, axis] - s[:, axis] / 2
+        hi = c[:, axis] + s[:, axis] / 2
+
+        # sort by the interval start, every box only needs to look ahead until starts pass its end + cutoff
+        order = np.argsort(lo, kind="stable")
+        lo_sorted = lo[order]
+        end = np.searchsorted(lo_sorted, hi[order] + cutoff, side="right")
+        count = np.maximum(end - np.arange(n) - 1, 0)
+
+        first = np.repeat(np.arange(n), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        second = first + 1 + offset
+        i, j = order[first], order[second]
+
+        # narrow phase on the remaining axes: separation gap along each axis must be below cutoff
+        gap = np.abs(c[i] - c[j]) - (s[i] + s[j]) / 2
+        keep = np.all(gap <= cutoff, axis=-1)
+        i, j = i[keep], j[keep]
+        pairs.append(np.stack([np.minimum(i, j), np.maximum(i, j)], axis=-1))
+
+    pairs = np.concatenate(pairs, axis=0)
+    if len(centers) > 1:
+        pairs = np.unique(pairs, axis=0)
+    return pairs.reshape(-1, 2).astype(np.int64)
+
+
+def overlap_count(centers: np.ndarray, sizes: np.ndarray, main_bbox: np.ndarray, tol: float = 1e-3) -> np.ndarray:
+    # exact number of box pairs penetrating deeper than tol plus boxes sticking out of main_bbox, per layout
+    centers = np.asarray(centers, dtype=np.float32)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float32), centers.shape)
+    counts = []
+    for center, size in zip(centers.reshape((-1,) + centers.shape[-2:]), sizes.reshape((-1,) + sizes.shape[-2:])):
+        i, j = sweep_and_prune(center, size, 0).T
+        penetration = np.abs(center[i] - center[j]) - (size[i] + size[j]) / 2
+        outside = np.abs(main_bbox[0] - center) - (main_bbox[1] - size) / 2
+        counts.append(np.sum(penetration.max(axis=-1) < -tol) + np.sum(outside.max(axis=-1) > tol))
+    return np.array(counts).reshape(centers.shape[:-2])
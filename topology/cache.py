@@ -0,0 +1,115 @@
+import dataclasses
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from topology.convert import piece_dimensions, piece_weights, read_piece_coords, read_piece_rotation, \
+    write_piece_coords
+from topology.result import PlacementResult
+from validation.models import Carriage, Box
+
+
+def canonical_order(boxes: list[Box], with_positions: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    # identical pieces are interchangeable, so orders are compared as multisets: pieces sorted by dimensions and
+    # weight (and stored coordinates for incremental solves); returns the sort order and the sorted rows
+    rows = [piece_dimensions(boxes), piece_weights(boxes)[:, None]]
+    if with_positions:
+        rows.append(read_piece_coords(boxes))
+    rows = np.concatenate(rows, axis=-1, dtype=np.float64)
+    order = np.lexsort(rows.T[::-1])
+    return order, rows[order]
+
+
+def placement_key(platform: Carriage, boxes: list[Box], options: dict,
+                  with_positions: bool = False) -> tuple[str, np.ndarray]:
+    # content hash of the carriage, the piece multiset and the solver options, with the canonical piece order
+    order, rows = canonical_order(boxes, with_positions)
+    payload = json.dumps({
+        "carriage": dataclasses.asdict(platform),
+        "boxes": rows.tolist(),
+        "options": options,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest(), order
+
+
+class PlacementCache:
+    # solved layouts by placement_key: an in-process LRU of max_entries in front of an optional directory
+    # of JSON files, the least recently used files are removed once they take more than max_bytes
+
+    def __init__(self, max_entries: int = 128, directory: str | os.PathLike = None, max_bytes: int = 64 * 2 ** 20):
+        self.max_entries = max_entries
+        self.directory = None if directory is None else Path(directory)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> dict | None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.directory is None:
+            return None
+        path = self.directory / f"{key}.json"
+        try:
+            entry = json.loads(path.read_text())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+        # written under a temporary name first, a concurrent reader never sees half a file
+        path = self.directory / f"{key}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, path)
+        self._evict_files()
+
+    def lookup(self, key: str, order: np.ndarray, boxes: list[Box]) -> PlacementResult | None:
+        # fills coords_of_cg of the boxes from a cached layout, None if there is none
+        entry = self.get(key)
+        if entry is None:
+            return None
+        coords = np.zeros((len(order), 3), dtype=np.int64)
+        coords[order] = entry["coords"]
+        rotated = np.zeros(len(order), dtype=bool)
+        rotated[order] = entry.get("rotated", False)
+        write_piece_coords(boxes, coords, rotated)
+        return dataclasses.replace(PlacementResult(**entry["result"]), cached=True)
+
+    def store(self, key: str, order: np.ndarray, boxes: list[Box], result: PlacementResult):
+        self.put(key, {
+            "coords": read_piece_coords(boxes)[order].tolist(),
+            "rotated": read_piece_rotation(boxes)[order].tolist(),
+            "result": dataclasses.asdict(result),
+        })
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _evict_files(self):
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
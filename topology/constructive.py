@@ -0,0 +1,167 @@
+import time
+
+import numpy as np
+
+EPS = 1e-6
+
+
+def _fits(corners, size, floor_lo, floor_hi, rects):
+    # corners - (M, 2) candidate lower corners, rects - (K, 2, 2) (lower corner, upper corner) already taken
+    upper = corners + size
+    inside = np.all(corners >= floor_lo - EPS, axis=-1) & np.all(upper <= floor_hi + EPS, axis=-1)
+    if len(rects) == 0:
+        return inside
+    overlap = np.all(
+        (corners[:, None] < rects[None, :, 1] - EPS) & (upper[:, None] > rects[None, :, 0] + EPS),
+        axis=-1
+    )
+    return inside & ~overlap.any(axis=-1)
+
+
+class _Half:
+    # one half of the floor, from the middle of the length to one of the ends, in its own frame where
+    # the length axis grows from the middle (mirrored for the back half)
+
+    def __init__(self, sign, floor_lo, floor_hi, obstacles, min_size=None):
+        # min_size - (2,) no box is smaller along either axis, points where it does not fit are dropped
+        self.sign = sign
+        self.min_size = np.zeros(2) if min_size is None else np.asarray(min_size)
+        self.floor_lo = np.array([floor_lo[0], 0])
+        self.floor_hi = np.array([floor_hi[0], floor_hi[1] if sign > 0 else -floor_lo[1]])
+        self.rects = np.zeros((0, 2, 2))
+        self.points = np.array([self.floor_lo])
+        for lo, hi in obstacles:
+            self.add(*self.to_frame(lo, hi))
+
+    def to_frame(self, lo, hi):
+        if self.sign > 0:
+            return lo, hi
+        return np.array([lo[0], -hi[1]]), np.array([hi[0], -lo[1]])
+
+    def from_frame(self, lo, hi):
+        return self.to_frame(lo, hi)
+
+    def candidate(self, size):
+        # best extreme point for the box: least length used, then closest to the side wall
+        valid = _fits(self.points, size, self.floor_lo, self.floor_hi, self.rects)
+        if not valid.any():
+            return None
+        points = self.points[valid]
+        best = np.lexsort((points[:, 0], points[:, 1] + size[1]))[0]
+        return points[best]
+
+    def add(self, lo, hi):
+        self.rects = np.concatenate([self.rects, [[lo, hi]]], axis=0)
+        # extreme points of the new rectangle, also projected onto the side wall and onto the middle
+        new = np.array([
+            [hi[0], lo[1]],
+            [lo[0], hi[1]],
+            [self.floor_lo[0], hi[1]],
+            [hi[0], self.floor_lo[1]],
+        ])
+        # points where not even the smallest box fits any more are dropped: the older points were checked against
+        # the older rectangles already, only the ones next to the new rectangle can have become useless; without
+        # the pruning the points grow by 4 a box and every candidate checks all of them against all rectangles
+        near = ~_fits(self.points, self.min_size, self.floor_lo, self.floor_hi, self.rects[-1:])
+        near[near] = ~_fits(self.points[near], self.min_size, self.floor_lo, self.floor_hi, self.rects)
+        new = new[_fits(new, self.min_size, self.floor_lo, self.floor_hi, self.rects)]
+        self.points = np.unique(np.concatenate([self.points[~near], new], axis=0), axis=0)
+
+
+def first_fit_decreasing(
+        mass: np.ndarray,
+        bbox: np.ndarray,
+        main_bbox: np.ndarray,
+        key: str = "footprint",
+        pos: np.ndarray = None,
+        fixed: np.ndarray = None,
+        stacking: bool = False,
+        time_budget: float = None
+) -> tuple[np.ndarray, np.ndarray]:
+    # deterministic placement on the floor in the Items frame: boxes sorted by footprint (or mass) go one by one
+    # to an extreme point of the front or back half of the floor, whichever keeps the center of mass closer
+    # to the middle of the length; fixed boxes (with given pos) stay where they are and act as obstacles
+    # stacking - boxes that do not fit on the floor start a new layer on top of the highest box of the layer below,
+    #            as long as they stay under the top of main_bbox (the floor is its bottom)
+    # time_budget - seconds, the boxes not placed by then keep their pos (and count as not placed)
+    # returns (N, 3) positions and (N,) mask of boxes that found a free place
+    mass = np.asarray(mass, dtype=np.float64)
+    bbox = np.asarray(bbox, dtype=np.float64)
+    main_bbox = np.asarray(main_bbox, dtype=np.float64)
+    n = len(mass)
+    size = bbox[:, 1, :2]
+    offset = bbox[:, 0, :2]
+    floor_lo = main_bbox[0, :2] - main_bbox[1, :2] / 2
+    floor_hi = main_bbox[0, :2] + main_bbox[1, :2] / 2
+
+    result = np.zeros((n, 3)) if pos is None else np.array(pos, dtype=np.float64)
+    fixed = np.zeros(n, dtype=bool) if fixed is None else np.asarray(fixed, dtype=bool)
+    placed = fixed.copy()
+
+    # center of the box footprints relative to the floor
+    centers = result[:, :2] + offset
+    obstacles = [(c - s / 2, c + s / 2) for c, s in zip(centers[fixed], size[fixed])]
+    min_size = size[~fixed].min(axis=0) if (~fixed).any() else None
+    halves = [_Half(1, floor_lo, floor_hi, obstacles, min_size), _Half(-1, floor_lo, floor_hi, obstacles, min_size)]
+    moment = (mass[fixed] * centers[fixed, 1]).sum()
+    total = mass[fixed].sum()
+    # layers of the stack as [base height, highest top, halves], only the floor without stacking
+    floor_z, ceiling = main_bbox[0, 2] - main_bbox[1, 2] / 2, main_bbox[0, 2] + main_bbox[1, 2] / 2
+    layers = [[floor_z, floor_z, halves]]
+    bottom = np.full(n, floor_z)
+
+    end = None if time_budget is None else time.perf_counter() + time_budget
+    weight = size.prod(axis=-1) if key == "footprint" else mass
+    for i in np.argsort(-weight, kind="stable"):
+        if fixed[i]:
+            continue
+        if end is not None and time.perf_counter() >= end:
+            break
+        best = None
+        for k in range(len(layers) + stacking):
+            if k == len(layers):
+                # nothing fits on the layers so far, start a new one on top of the highest box of the last one
+                base = layers[-1][1]
+                if base <= layers[-1][0] or base + bbox[i, 1, 2] > ceiling + EPS:
+                    break
+                layers.append([base, base, [_Half(1, floor_lo, floor_hi, obstacles, min_size),
+                                            _Half(-1, floor_lo, floor_hi, obstacles, min_size)]])
+            for half in layers[k][2]:
+                corner = half.candidate(size[i])
+                if corner is None:
+                    continue
+                lo, hi = half.from_frame(corner, corner + size[i])
+                center = (lo + hi) / 2
+                balance = abs((moment + mass[i] * center[1]) / (total + mass[i]))
+                if best is None or balance < best[0] - EPS:
+                    best = (balance, half, corner, center, layers[k])
+            if best is not None:
+                break
+        if best is None:
+            # no free place left, put it on the axis in the middle of the floor and let the optimizer sort it out
+            centers[i] = (floor_lo + floor_hi) / 2
+            continue
+        _, half, corner, center, layer = best
+        half.add(corner, corner + size[i])
+        centers[i] = center
+        bottom[i] = layer[0]
+        layer[1] = max(layer[1], layer[0] + bbox[i, 1, 2])
+        placed[i] = True
+        moment += mass[i] * center[1]
+        total += mass[i]
+
+    new = placed & ~fixed
+    if not fixed.any() and new.any():
+        # the whole layout can move freely: center it across the width and balance it along the length
+        lo = (centers[new] - size[new] / 2).min(axis=0)
+        hi = (centers[new] + size[new] / 2).max(axis=0)
+        shift = np.clip(
+            main_bbox[0, :2] - np.array([(lo[0] + hi[0]) / 2, moment / total]),
+            floor_lo - lo,
+            floor_hi - hi
+        )
+        centers[new] += shift
+
+    result[~fixed, :2] = centers[~fixed] - offset[~fixed]
+    result[~fixed, 2] = bottom[~fixed] + bbox[~fixed, 1, 2] / 2 - bbox[~fixed, 0, 2] if stacking else 0
+    return result, placed
@@ -1,13 +1,29 @@
 import numpy as np
 
-from topology.process import Items
+from topology.postprocess import resolve_overlaps, snap_to_grid
 from validation.models import Carriage, Box
 
 PLATFORM_HEIGHT = 5
 
 
-def build_items(platform: Carriage, boxes: list[Box]) -> Items:
-    main_bbox = np.array([
+def get_items_class(backend: str = "torch"):
+    # torch is imported only when the torch backend is actually requested
+    if backend == "numpy":
+        from topology.numpy_backend import NumpyItems
+        return NumpyItems
+    from topology.process import Items
+    return Items
+
+
+def get_main_bbox(platform: Carriage, stacking: bool = False, max_height: float = None) -> np.ndarray:
+    # when stacking the floor is at z = 0 and boxes reach up to max_height (mm, PLATFORM_HEIGHT by default)
+    if stacking:
+        height = PLATFORM_HEIGHT if max_height is None else max_height / 1000
+        return np.array([
+            [0, 0, height / 2],
+            [platform.floor_width / 1000, platform.floor_length / 1000, height]
+        ])
+    return np.array([
         [0, 0, 0],
         [
             platform.floor_width / 1000,
@@ -16,31 +32,146 @@ def build_items(platform: Carriage, boxes: list[Box]) -> Items:
         ]
     ])
 
-    dimensions = np.stack([np.array(box.dimensions, np.float32) for box in boxes], axis=0)
+
+def piece_amounts(boxes: list[Box]) -> np.ndarray:
+    return np.array([box.amount for box in boxes], dtype=np.int64)
+
+
+def piece_dimensions(boxes: list[Box]) -> np.ndarray:
+    # (N, 3) dimensions of every piece, the boxes repeated by their amount
+    dimensions = np.array([box.dimensions for box in boxes], dtype=np.int64).reshape(-1, 3)
+    return np.repeat(dimensions, piece_amounts(boxes), axis=0)
+
+
+def read_piece_rotation(boxes: list[Box]) -> np.ndarray:
+    # (N,) pieces turned by 90° on the floor, pieces added to the amount since the last placement are not
+    amounts = piece_amounts(boxes)
+    rotated = np.zeros(amounts.sum(), dtype=bool)
+    for box, start in zip(boxes, np.cumsum(amounts) - amounts):
+        stored = (box.pieces_rotated or (box.rotated,))[:box.amount]
+        rotated[start:start + len(stored)] = stored
+    return rotated
+
+
+def piece_floor_dimensions(boxes: list[Box], rotated: np.ndarray = None) -> np.ndarray:
+    # (N, 3) dimensions of every piece along the carriage length, across it and in height
+    rotated = read_piece_rotation(boxes) if rotated is None else rotated
+    dimensions = piece_dimensions(boxes)
+    return np.where(rotated[:, None], dimensions[:, [1, 0, 2]], dimensions)
+
+
+def piece_weights(boxes: list[Box]) -> np.ndarray:
+    # (N,) weights of every piece in tons
+    return np.repeat(np.array([box.weight for box in boxes], dtype=np.float64), piece_amounts(boxes))
+
+
+def build_arrays(platform: Carriage, boxes: list[Box], stacking: bool = False,
+                 max_height: float = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (N,) masses in kg, (N, 2, 3) bboxes and main_bbox in the Items frame, one item per piece
+    main_bbox = get_main_bbox(platform, stacking, max_height)
+
+    dimensions = piece_floor_dimensions(boxes).astype(np.float32)
     bbox = np.stack([
         np.zeros_like(dimensions),
         dimensions[..., [1, 0, 2]] / 1000
     ], axis=-2)
 
-    masses = np.stack([box.weight for box in boxes], axis=0)
-    masses = masses * 1000
+    masses = piece_weights(boxes) * 1000
+    return masses, bbox, main_bbox
 
-    items = Items(masses, bbox, main_bbox)
+
+def build_items(platform: Carriage, boxes: list[Box], backend: str = "torch", stacking: bool = False,
+                **kwargs) -> "Items":
+    items = get_items_class(backend)(*build_arrays(platform, boxes, stacking), stacking=stacking, **kwargs)
     return items
 
 
-def fill_boxes_positions(items: Items, boxes: list[Box]):
-    positions = items.pos.numpy()
-    centers = items.bbox[:, 0].numpy()
-    dimensions = items.bbox[:, 1].numpy()
-    main_bbox = items.main_bbox.numpy()
+def floor_heights(bbox: np.ndarray, main_bbox: np.ndarray) -> np.ndarray:
+    # (N,) z of the items standing on the floor of a stacking main_bbox
+    return main_bbox[0][2] - main_bbox[1][2] / 2 + bbox[:, 1, 2] / 2 - bbox[:, 0, 2]
+
+
+def coords_to_positions(platform: Carriage, coords: np.ndarray, stacking: bool = False) -> np.ndarray:
+    # (N, 3) Box.coords_of_cg in millimetres to item positions, the height is kept only when stacking
+    main_bbox = get_main_bbox(platform)
+    positions = np.array(coords, dtype=np.float32).reshape(-1, 3)[..., [1, 0, 2]] / 1000
+    positions[..., 1] = positions[..., 1] + main_bbox[0][1] - main_bbox[1][1] / 2
+    if not stacking:
+        positions[..., 2] = 0
+    return positions
+
+
+def read_piece_coords(boxes: list[Box]) -> np.ndarray:
+    # (N, 3) stored coords_of_cg of every piece, pieces added to the amount since the last placement get (0, 0, 0)
+    amounts = piece_amounts(boxes)
+    coords = np.zeros((amounts.sum(), 3), dtype=np.int64)
+    for box, start in zip(boxes, np.cumsum(amounts) - amounts):
+        stored = (box.pieces or (box.coords_of_cg,))[:box.amount]
+        coords[start:start + len(stored)] = stored
+    return coords
+
+
+def write_piece_coords(boxes: list[Box], coords: np.ndarray, rotated: np.ndarray = None):
+    # identical pieces are interchangeable, they are stored in a canonical order: along the length, then the width;
+    # rotated - (N,) new orientation of the pieces, the stored one is kept when None
+    amounts = piece_amounts(boxes)
+    coords = np.asarray(coords)
+    rotated = read_piece_rotation(boxes) if rotated is None else np.asarray(rotated, dtype=bool)
+    group = np.repeat(np.arange(len(boxes)), amounts)
+    order = np.lexsort((coords[:, 1], coords[:, 0], group))
+    coords, rotated = coords[order], rotated[order]
+    for box, start in zip(boxes, np.cumsum(amounts) - amounts):
+        if box.amount < 1:
+            continue
+        pieces = coords[start:start + box.amount]
+        turned = rotated[start:start + box.amount]
+        box.coords_of_cg = tuple(pieces[0].tolist())
+        box.rotated = bool(turned[0])
+        box.pieces = tuple(map(tuple, pieces.tolist())) if box.amount > 1 else ()
+        box.pieces_rotated = tuple(turned.tolist()) if box.amount > 1 else ()
+
+
+def read_boxes_positions(platform: Carriage, boxes: list[Box],
+                         stacking: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    # inverse of fill_boxes_positions: (N, 3) item positions and (N,) mask of pieces that were placed before,
+    # a piece that was never placed still has coords_of_cg == (0, 0, 0)
+    coords = read_piece_coords(boxes)
+    placed = np.any(coords != 0, axis=-1)
+
+    positions = coords_to_positions(platform, coords, stacking)
+    positions[~placed] = 0
+    return positions, placed
+
+
+def fill_boxes_positions(items: "Items", boxes: list[Box], rotated: np.ndarray = None,
+                         time_budget: float = None) -> int:
+    # writes item positions to the boxes snapped to whole millimetres, with remaining overlaps pushed apart,
+    # returns the overlapping pairs plus boxes out of the floor that are left (0 - the stored placement is feasible)
+    # rotated - (N,) orientation the items were placed in, if it differs from the one stored in the boxes
+    # time_budget - seconds for pushing the overlaps apart, see resolve_overlaps
+    positions = np.array(items.pos)
+    centers = np.array(items.bbox)[:, 0]
+    dimensions = np.array(items.bbox)[:, 1]
+    main_bbox = np.array(items.main_bbox)
 
     # positions - geometrical center, center - relative center of mass
     positions, centers = positions + centers, -centers
-    positions[..., 2] = dimensions[..., 2] / 2
+    ceiling = None
+    if items.stacking:
+        # stacked boxes keep their height, the floor of the stacking main_bbox is at z = 0
+        ceiling = int(np.round((main_bbox[0][2] + main_bbox[1][2] / 2) * 1000))
+    else:
+        positions[..., 2] = dimensions[..., 2] / 2
     positions[..., 1] = positions[..., 1] - main_bbox[0][1] + main_bbox[1][1] / 2
-    positions = positions[..., [1, 0, 2]] * 1000
+    positions = snap_to_grid(positions[..., [1, 0, 2]] * 1000)
+
+    sizes = piece_floor_dimensions(boxes, rotated)
+    floor = np.round(main_bbox[1, [1, 0]] * 1000).astype(np.int64)
+    pinned = None if items.pinned is None else np.array(items.pinned)
+    positions, conflicts = resolve_overlaps(positions, sizes, floor, fixed=pinned, masses=np.array(items.mass),
+                                            ceiling=ceiling, min_support=items.min_support, time_budget=time_budget)
 
-    for box, pos in zip(boxes, positions):
-        box.coords_of_cg = tuple(np.int32(pos).tolist())
+    write_piece_coords(boxes, positions, rotated)
+    for box in boxes:
         print(box)
+    return conflicts
@@ -1,9 +1,6 @@
 import numpy as np
-import torch
 import cv2 as cv
 
-from topology.process import Items
-
 
 class Scene:
     size: np.ndarray  # image size in pixels
@@ -44,23 +41,21 @@ class Scene:
         pt = np.int32(pt)
         cv.drawMarker(image, pt, color, markerType=cv.MARKER_CROSS, markerSize=20)
 
-    @torch.no_grad()
-    def draw_items(self, image, items: Items):
-        bbox_all = items.get_abs_bbox().numpy()
+    def draw_items(self, image, items: "Items"):
+        bbox_all = np.array(items.get_abs_bbox())
         # dist = items.get_main_bbox_dist(main_bbox)
         for i, bbox in enumerate(bbox_all):
             self.draw_bbox(bbox, image, (0, 255, 0))
             # self.draw_text(bbox[0] - bbox[1] * (0.5, 0, 0), f"{losses[i]:.3f}", image, (0, 0, 255))
 
-    @torch.no_grad()
-    def draw_center_of_mass(self, image, items: Items):
-        com = items.center_of_mass().numpy()
+    def draw_center_of_mass(self, image, items: "Items"):
+        com = np.array(items.center_of_mass())
         self.draw_point(com, image, (255, 0, 0))
 
-    def show(self, items: Items):
+    def show(self, items: "Items"):
         image = np.zeros(tuple(self.size[::-1]) + (3,), dtype=np.uint8)
         self.draw_items(image, items)
-        self.draw_bbox(items.main_bbox.numpy(), image, (0, 0, 255))
+        self.draw_bbox(np.array(items.main_bbox), image, (0, 0, 255))
         self.draw_center_of_mass(image, items)
         cv.imshow("Scene", image)
         cv.waitKey(1)
\ No newline at end of file
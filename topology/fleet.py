@@ -0,0 +1,116 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import get_context
+
+import numpy as np
+
+from topology.convert import piece_amounts, piece_dimensions, piece_weights
+from topology.main import calculate_optimal_placement
+from topology.options import PlacementOptions
+from topology.pool import PLACE_TIMEOUT
+from topology.result import PlacementResult
+from validation.formulas import CalculatedReport, calculate_formulas
+from validation.models import Carriage, Box, expand_pieces
+
+
+@dataclass
+class CarriagePlan:
+    carriage: int  # index of the carriage type in the catalogue
+    shipments: list[int]  # index of the order box every box comes from
+    boxes: list[Box]  # placed pieces of the order loaded on this carriage
+    result: PlacementResult
+    report: CalculatedReport  # validation.formulas of the placed layout
+
+
+def assign_carriages(carriages: list[Carriage], boxes: list[Box], fill: float = 0.85,
+                     max_weight: float = None) -> tuple[list[tuple[int, np.ndarray]], np.ndarray]:
+    # first-fit-decreasing bin packing of the pieces by footprint: every piece goes to the first carriage with
+    # room for it (fill of the floor, max_weight tons), a new carriage is of the type with the largest floor
+    # the piece fits on; afterwards every carriage is swapped for the smallest type its pieces fit on
+    # returns (carriage type, (len(boxes),) pieces of every box) of every carriage and the pieces that fit none
+    dimensions = piece_dimensions(boxes).astype(np.float64)
+    weights = piece_weights(boxes)
+    shipment = np.repeat(np.arange(len(boxes)), piece_amounts(boxes))
+    area = dimensions[:, 0] * dimensions[:, 1] / 1e6
+
+    floors = np.array([[carriage.floor_length, carriage.floor_width] for carriage in carriages], dtype=np.float64)
+    capacity = fill * floors.prod(axis=-1) / 1e6
+    # (N, T) the piece fits the floor of the type in some 0°/90° orientation
+    fits = (np.maximum(dimensions[:, None, 0], dimensions[:, None, 1]) <= floors[None, :, 0]) & \
+           (np.minimum(dimensions[:, None, 0], dimensions[:, None, 1]) <= floors[None, :, 1])
+    max_weight = np.inf if max_weight is None else max_weight
+
+    types, area_load, weight_load, members = [], [], [], []
+    unplaced = np.zeros(len(boxes), dtype=np.int64)
+    for i in np.argsort(-area, kind="stable"):
+        for k, t in enumerate(types):
+            if fits[i, t] and area_load[k] + area[i] <= capacity[t] and weight_load[k] + weights[i] <= max_weight:
+                break
+        else:
+            if not fits[i].any():
+                unplaced[shipment[i]] += 1
+                continue
+            types.append(int(np.where(fits[i], capacity, -np.inf).argmax()))
+            area_load.append(0.0)
+            weight_load.append(0.0)
+            members.append([])
+            k = len(types) - 1
+        area_load[k] += area[i]
+        weight_load[k] += weights[i]
+        members[k].append(i)
+
+    plan = []
+    for t, load, pieces in zip(types, area_load, members):
+        smaller = fits[pieces].all(axis=0) & (capacity >= load)
+        t = int(np.where(smaller, capacity, np.inf).argmin())
+        plan.append((t, np.bincount(shipment[pieces], minlength=len(boxes))))
+    return plan, unplaced
+
+
+def take_pieces(boxes: list[Box], counts: np.ndarray) -> tuple[list[int], list[Box]]:
+    # boxes with counts pieces of every order box (and the index of the box), to be placed from scratch
+    shipments, parts = [], []
+    for k, (box, count) in enumerate(zip(boxes, counts)):
+        if count > 0:
+            shipments.append(k)
+            parts.append(replace(box, amount=int(count), coords_of_cg=(0, 0, 0), pieces=(), rotated=False,
+                                 pieces_rotated=()))
+    return shipments, parts
+
+
+def _place(platform, boxes, options, kwargs):
+    result = calculate_optimal_placement(platform, boxes, options, **kwargs)
+    return boxes, result, calculate_formulas(expand_pieces(boxes), platform)
+
+
+def plan_fleet(carriages: list[Carriage], boxes: list[Box], fill: float = 0.85, max_weight: float = None,
+               workers: int = None, pool: "SolverPool" = None, pool_timeout: float = PLACE_TIMEOUT,
+               options: PlacementOptions = None, **kwargs) -> tuple[list[CarriagePlan], np.ndarray]:
+    # spreads the order over the fewest carriages of the catalogue by assign_carriages, then places every carriage
+    # by calculate_optimal_placement (options, kwargs) on a pool of workers processes (os.cpu_count() by default,
+    # 1 - one after another in this process), or on the pre-warmed workers of a topology.pool.SolverPool
+    # (pool_timeout seconds for all the carriages), and checks it with validation.formulas
+    # returns the plan of every carriage and (len(boxes),) pieces of every box that fit no carriage of the catalogue
+    assignment, unplaced = assign_carriages(carriages, boxes, fill, max_weight)
+    loads = [take_pieces(boxes, counts) for _, counts in assignment]
+    tasks = [(carriages[t], parts, options, kwargs) for (t, _), (_, parts) in zip(assignment, loads)]
+
+    workers = min(os.cpu_count() or 1, len(tasks)) if workers is None else workers
+    if pool is not None:
+        # all carriages are sent at once, the workers of the pool place them side by side
+        futures = [pool.submit(platform, parts, options=options, **kwargs) for platform, parts, _, _ in tasks]
+        placed = [(parts, result, calculate_formulas(expand_pieces(parts), platform))
+                  for (platform, _, _, _), (parts, result) in zip(tasks, pool.gather(futures, pool_timeout))]
+    elif workers > 1:
+        # spawned workers do not inherit the torch thread pool of this process
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+            placed = list(executor.map(_place, *zip(*tasks)))
+    else:
+        placed = [_place(*task) for task in tasks]
+
+    plans = [
+        CarriagePlan(carriage=t, shipments=shipments, boxes=parts, result=result, report=report)
+        for (t, _), (shipments, _), (parts, result, report) in zip(assignment, loads, placed)
+    ]
+    return plans, unplaced
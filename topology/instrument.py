@@ -0,0 +1,91 @@
+import json
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class StepRecord:
+    step: int
+    time: float  # seconds from the start of optimize to the start of the step
+    forward: float  # seconds of the loss (with its gradient in the numpy backend)
+    backward: float  # seconds of the gradient
+    update: float  # seconds of the optimizer step, projection included
+    loss: list[float]  # total loss of every start
+    losses: dict[str, list[float]] = field(default_factory=dict)  # weighted loss terms of every start
+    grad_norm: list[float] = field(default_factory=list)  # of the gradient the optimizer used, every start
+    overlaps: list[int] = field(default_factory=list)  # overlapping pairs plus boxes outside the floor
+
+
+class Instrument:
+    # receives a StepRecord of every every-th step of optimize(..., instrument=...); measuring the loss terms,
+    # the gradient norms and the overlaps costs about one more loss per recorded step, without an instrument
+    # optimize does none of it
+    # close() is called once optimize is done
+
+    def __init__(self, every: int = 1):
+        self.every = every
+
+    def wants(self, step: int) -> bool:
+        return step % self.every == 0
+
+    def on_step(self, record: StepRecord):
+        pass
+
+    def close(self):
+        pass
+
+
+class StepRecorder(Instrument):
+    # keeps the records in memory
+
+    def __init__(self, every: int = 1):
+        super().__init__(every)
+        self.records = []
+
+    def on_step(self, record: StepRecord):
+        self.records.append(record)
+
+
+class JsonLinesExporter(Instrument):
+    # appends every record to path as a line of JSON as soon as it is taken, a killed run keeps its steps
+
+    def __init__(self, path, every: int = 1):
+        super().__init__(every)
+        self.file = open(path, "a")
+
+    def on_step(self, record: StepRecord):
+        self.file.write(json.dumps(asdict(record)) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def chrome_trace_events(records: list[StepRecord], pid: int = 0) -> list[dict]:
+    # forward, backward and update of every step as complete events, and the loss terms and overlaps of every
+    # start as counters, times in microseconds
+    events = []
+    for record in records:
+        ts = record.time * 1e6
+        for name in ("forward", "backward", "update"):
+            duration = getattr(record, name) * 1e6
+            events.append({"name": name, "cat": "optimize", "ph": "X", "ts": ts, "dur": duration, "pid": pid,
+                           "tid": 0, "args": {"step": record.step}})
+            ts += duration
+        for k, loss in enumerate(record.loss):
+            args = {name: values[k] for name, values in record.losses.items()}
+            events.append({"name": f"losses {k}", "ph": "C", "ts": record.time * 1e6, "pid": pid,
+                           "args": dict(args, total=loss)})
+            events.append({"name": f"overlaps {k}", "ph": "C", "ts": record.time * 1e6, "pid": pid,
+                           "args": {"overlaps": record.overlaps[k], "grad_norm": record.grad_norm[k]}})
+    return events
+
+
+class ChromeTraceExporter(StepRecorder):
+    # writes the records to path in the Chrome trace event format on close, for chrome://tracing or Perfetto
+
+    def __init__(self, path, every: int = 1):
+        super().__init__(every)
+        self.path = path
+
+    def close(self):
+        with open(self.path, "w") as file:
+            json.dump({"traceEvents": chrome_trace_events(self.records), "displayTimeUnit": "ms"}, file)
@@ -0,0 +1,152 @@
+import math
+
+import torch
+
+
+def safe_exp(x, p1=1):
+    # same as Items.safe_exp_loss with x0 = 1, together with its derivative
+    value = (
+            torch.exp(x.clip(None, p1)) +
+            math.exp(p1) * (x - p1).clip(0, None) +
+            (x - p1).clip(0, None).square() / 2
+    )
+    grad = torch.where(x <= p1, torch.exp(x.clip(None, p1)), math.exp(p1) + (x - p1))
+    return value, grad
+
+
+def pair_dist(offset, size, with_grad=False):
+    # offset - (..., 3) difference of box centers, size - (..., 3) sum of half sizes
+    # same distance as Items.pair_dist, optionally with d dist / d offset
+    dist = offset.abs() - size
+    mask = dist.max(dim=-1).values > 0
+    clipped = dist.clip(1e-12, None)
+    dist_far = clipped.square().sum(dim=-1).sqrt()
+    dist_sum = dist.prod(dim=-1)
+    value = torch.where(mask, dist_far, dist_sum)
+    if not with_grad:
+        return value, None
+
+    grad_far = clipped / dist_far[..., None] * (dist >= 1e-12)
+    grad_sum = torch.stack([
+        dist[..., 1] * dist[..., 2],
+        dist[..., 0] * dist[..., 2],
+        dist[..., 0] * dist[..., 1],
+    ], dim=-1)
+    grad = torch.where(mask[..., None], grad_far, grad_sum) * offset.sign()
+    return value, grad
+
+
+def _flatten(pos, bbox):
+    # (..., N, 3), (..., N, 2, 3) -> (B, N, 3) centers and half sizes
+    bbox = bbox.expand(pos.shape[:-1] + bbox.shape[-2:])
+    center = (pos + bbox[..., 0, :]).reshape((-1,) + pos.shape[-2:])
+    half = (bbox[..., 1, :] / 2).reshape((-1,) + pos.shape[-2:])
+    return center, half
+
+
+class TiledCollisionLoss(torch.autograd.Function):
+    # per-box collision loss (..., N) computed over blocks of tile rows,
+    # so the (N, N) pair matrix is never materialized in forward nor kept for backward
+
+    @staticmethod
+    def forward(ctx, pos, bbox, safe_dist, tile):
+        ctx.save_for_backward(pos, bbox)
+        ctx.safe_dist = safe_dist
+        ctx.tile = tile
+
+        center, half = _flatten(pos, bbox)
+        n = center.shape[-2]
+        loss = center.new_empty(center.shape[:-1])
+        for start in range(0, n, tile):
+            rows = slice(start, start + tile)
+            dist, _ = pair_dist(
+                center[:, rows, None, :] - center[:, None, :, :],
+                half[:, rows, None, :] + half[:, None, :, :]
+            )
+            value, _ = safe_exp(-dist / safe_dist)
+            loss[:, rows] = value.sum(dim=-1)
+        return loss.reshape(pos.shape[:-1])
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        pos, bbox = ctx.saved_tensors
+        safe_dist = ctx.safe_dist
+        tile = ctx.tile
+
+        center, half = _flatten(pos, bbox)
+        grad_output = grad_output.reshape(center.shape[:-1])
+        n = center.shape[-2]
+        grad = torch.empty_like(center)
+        for start in range(0, n, tile):
+            rows = slice(start, start + tile)
+            dist, dist_grad = pair_dist(
+                center[:, rows, None, :] - center[:, None, :, :],
+                half[:, rows, None, :] + half[:, None, :, :],
+                with_grad=True
+            )
+            _, loss_grad = safe_exp(-dist / safe_dist)
+            # pair loss is symmetric, box i gets gradient both from its own row and from column i of other rows
+            weight = grad_output[:, rows, None] + grad_output[:, None, :]
+            pair_grad = -loss_grad / safe_dist * weight
+            grad[:, rows] = (pair_grad[..., None] * dist_grad).sum(dim=-2)
+        return grad.reshape(pos.shape), None, None, None
+
+
+def tiled_collision_loss(pos, bbox, safe_dist, tile=64):
+    return TiledCollisionLoss.apply(pos, bbox, safe_dist, tile)
+
+
+class FusedLoss(torch.autograd.Function):
+    # Items.get_all_loss with dense collision in a single pass: the analytic gradient is computed
+    # together with the value, so autograd records one node instead of the whole chain of small ops
+
+    @staticmethod
+    def forward(ctx, pos, mass, bbox, main_bbox, safe_dist):
+        n = pos.shape[-2]
+        center = pos + bbox[..., 0, :]
+        size = bbox[..., 1, :].expand_as(center)
+
+        # collision between boxes
+        dist, dist_grad = pair_dist(
+            center[..., :, None, :] - center[..., None, :, :],
+            (size[..., :, None, :] + size[..., None, :, :]) / 2,
+            with_grad=True
+        )
+        value, value_grad = safe_exp(-dist / safe_dist)
+        loss = value.sum(dim=-1)
+        # every per-box loss enters the mean with 1 / n, and each pair appears in two rows
+        grad = 2 / n * (-value_grad / safe_dist)[..., None].mul(dist_grad).sum(dim=-2)
+
+        # collision with bounding overall box
+        offset = center - main_bbox[0]
+        dist = offset.abs() - (main_bbox[1] - size) / 2
+        dist_max = dist.max(dim=-1)
+        value, value_grad = safe_exp(dist_max.values / safe_dist)
+        loss = loss + 10 * value
+        onehot = torch.nn.functional.one_hot(dist_max.indices, 3).to(pos.dtype)
+        grad = grad + 10 / n * (value_grad / safe_dist)[..., None] * onehot * offset.sign()
+
+        # to stick every box to center axis
+        loss = loss + pos[..., 0].abs()
+        grad[..., 0] += pos[..., 0].sign() / n
+
+        loss = loss.mean(dim=-1)
+
+        # stick center of mass to center of platform
+        com = (mass[:, None] * pos).sum(dim=-2) / mass.sum()
+        com_norm = com.norm(dim=-1, keepdim=True)
+        loss = loss + 10 * com_norm[..., 0]
+        com_grad = torch.where(com_norm > 0, com / com_norm, torch.zeros_like(com))
+        grad = grad + 10 * (mass / mass.sum())[:, None] * com_grad[..., None, :]
+
+        ctx.save_for_backward(grad)
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad, = ctx.saved_tensors
+        return grad_output[..., None, None] * grad, None, None, None, None
+
+
+def fused_loss(pos, mass, bbox, main_bbox, safe_dist):
+    return FusedLoss.apply(pos, mass, bbox, main_bbox, safe_dist)
@@ -0,0 +1,24 @@
+from validation.models import Carriage, Box, expand_pieces
+from validation.standarts import MAX_HEIGHT, calculate_long_max_cg_by_weight
+
+
+def max_bias(boxes: list[Box]) -> float:
+    # largest longitudinal offset of the cargo center of mass from the middle of the floor in metres
+    # that still passes validation.formulas, it depends on the total cargo weight in tons
+    return calculate_long_max_cg_by_weight(round(sum(box.weight * box.amount for box in boxes), 3)) / 1000
+
+
+def max_cg_height(platform: Carriage) -> float:
+    # highest center of mass of the cargo above the floor in metres that still passes the MAX_HEIGHT check
+    return (MAX_HEIGHT - platform.height_from_rails) / 1000
+
+
+def within_limits(platform: Carriage, boxes: list[Box]) -> bool:
+    # the stored layout passes the center of mass checks of validation.formulas
+    pieces = expand_pieces(boxes)
+    weight = sum(box.weight for box in pieces)
+    if weight == 0:
+        return True
+    bias = 0.5 * platform.floor_length - sum(box.weight * box.coords_of_cg[0] for box in pieces) / weight
+    height = sum(box.weight * (box.h_of_cg + platform.height_from_rails) for box in pieces) / weight
+    return bias < calculate_long_max_cg_by_weight(round(weight, 3)) and height < MAX_HEIGHT
@@ -1,24 +1,214 @@
+import time
+from dataclasses import asdict, replace
+
 import numpy as np
 
 from documentgen.drawing import generate_drawing
-from topology.convert import build_items, fill_boxes_positions
-from topology.process import Items
-from topology.display import Scene
+from topology.broadphase import overlap_count
+from topology.cache import PlacementCache, placement_key
+from topology.constructive import first_fit_decreasing
+from topology.convert import (build_arrays, coords_to_positions, fill_boxes_positions, floor_heights, get_items_class,
+                              read_boxes_positions, read_piece_rotation)
+from topology.instrument import Instrument
+from topology.limits import max_bias, max_cg_height, within_limits
+from topology.monitor import ConvergenceMonitor
+from topology.options import PlacementOptions
+from topology.pool import PLACE_TIMEOUT
+from topology.result import PlacementResult
+from topology.rotation import orientation_candidates, rotate_bbox
+from topology.segments import DEADLINE_SHARE, assign_segments, segment_count, solve_segments
+from topology.similarity import PlacementIndex
+from topology.trajectory import TrajectoryRecorder, describe_placement
 from validation.models import Carriage, Box
 
+POSTPROCESS_SHARE = 0.1  # of the deadline kept for pushing the residual overlaps apart after the optimizer
+
+
+def time_left(deadline: float, start: float, reserve: float = 0.0) -> float | None:
+    # seconds of deadline - reserve not used since start, None without a deadline
+    if deadline is None:
+        return None
+    return max(deadline - reserve - (time.perf_counter() - start), 0.0)
+
+
+def calculate_optimal_placement(platform: Carriage, boxes: list[Box], options: PlacementOptions = None,
+                                visualise=False, monitor=None, cache: PlacementCache = None,
+                                index: PlacementIndex = None, workers=None, pool: "SolverPool" = None,
+                                pool_timeout=PLACE_TIMEOUT, progress=None, instrument: Instrument = None,
+                                recorder: TrajectoryRecorder = None, **overrides) -> PlacementResult:
+    # options - PlacementOptions, how the order is solved; overrides - fields of it given one by one,
+    #           e.g. calculate_optimal_placement(platform, boxes, options, seed=1)
+    # cache - PlacementCache, an order already solved with the same options is returned from it without solving
+    # index - PlacementIndex, boxes without a position start from the nearest similar solved order,
+    #         every feasible result is added to it
+    # workers - processes of the segments of method="hierarchical"
+    # pool - topology.pool.SolverPool, the placement is solved by one of its pre-warmed worker processes,
+    #        TimeoutError after pool_timeout seconds (the worker is replaced), WorkerDied if the worker crashes
+    # progress - callback of the optimizer getting a topology.progress.progress_frame about twice a second
+    #            (e.g. ProgressChannel.publish); the placement is then solved in this process, not by the pool
+    # instrument - topology.instrument.Instrument of the optimizer steps (of the polishing pass of "hierarchical"),
+    #              e.g. ChromeTraceExporter to profile a slow order; solved in this process as well
+    # recorder - topology.trajectory.TrajectoryRecorder of the optimizer steps (of the polishing pass), the carriage
+    #            and the boxes go to its header; replayed by python -m topology.trajectory
+    call_start = time.perf_counter()
+    options = replace(PlacementOptions() if options is None else options, **overrides)
+    deadline = options.deadline
+    reserve = 0.0 if deadline is None else POSTPROCESS_SHARE * deadline
+    if cache is not None and monitor is None and not visualise:
+        key_options = dict(asdict(options), index=index is not None)
+        key, order = placement_key(platform, boxes, key_options, with_positions=options.incremental)
+        result = cache.lookup(key, order, boxes)
+        if result is not None:
+            return result
+        result = calculate_optimal_placement(platform, boxes, options, index=index, workers=workers, pool=pool,
+                                             pool_timeout=pool_timeout, progress=progress, instrument=instrument,
+                                             recorder=recorder)
+        cache.store(key, order, boxes, result)
+        if options.incremental:
+            # submitting the solved layout again gives it back as it is
+            key, order = placement_key(platform, boxes, key_options, with_positions=True)
+            cache.store(key, order, boxes, result)
+        return result
+
+    if pool is not None and monitor is None and not visualise and progress is None and instrument is None and \
+            recorder is None:
+        # the worker only gets the nearest entry of the index, the solved order is added to it here
+        result = pool.place(platform, boxes, timeout=pool_timeout, options=options, workers=workers,
+                            index=None if index is None else index.nearest_only(platform, boxes))
+        if index is not None and not result.has_overlap:
+            index.add(platform, boxes)
+        return result
 
-def calculate_optimal_placement(platform: Carriage, boxes: list[Box], visualise=False):
     if visualise:
+        from topology.display import Scene
         scene = Scene(
             np.array([1000, 1000]),
             np.array([[0, 0], [20, 20]])
         )
     else:
         scene = None
+    if recorder is not None:
+        recorder.describe(**describe_placement(platform, boxes))
+
+    stacking = options.stacking
+    item_options = dict(collision=options.collision, seed=options.seed, stacking=stacking)
+    if options.backend == "torch":
+        item_options.update(loss_mode=options.loss_mode)
+    if options.constraints is not None:
+        item_options.update(constraints=options.constraints, max_bias=max_bias(boxes))
+        if stacking:
+            item_options.update(max_cg_height=max_cg_height(platform))
+    # everything below works on pieces, a box with amount > 1 is that many items
+    masses, bbox, main_bbox = build_arrays(platform, boxes, stacking, options.max_height)
+    shuffle = True
+    placed = np.zeros(len(masses), dtype=bool)
+    pos = None
+    if options.incremental:
+        pos, placed = read_boxes_positions(platform, boxes, stacking)
+        if options.pin_placed:
+            item_options.update(pinned=placed)
+    if index is not None:
+        # boxes without a position of their own start where their match in the nearest past order was
+        coords, matched = index.warm_start(platform, boxes)
+        matched &= ~placed
+        pos = np.zeros((len(masses), 3), dtype=np.float32) if pos is None else pos
+        pos[matched] = coords_to_positions(platform, coords[matched], stacking)
+        placed = placed | matched
+    if pos is not None:
+        item_options.update(pos=pos)
+        shuffle = ~placed
+        # the rest of the layout is already converged, done as soon as the new boxes add no overlaps
+        if monitor is None and placed.any():
+            budget = overlap_count(pos[placed], bbox[placed, 1], main_bbox)
+            monitor = ConvergenceMonitor(stop_on_feasible=True, overlap_budget=budget)
+
+    constructed = None
+    rotated = None
+    if options.method == "constructive" or options.init == "constructive":
+        start = time.perf_counter()
+        pos, fits = first_fit_decreasing(masses, bbox, main_bbox, pos=item_options.get("pos"), fixed=placed,
+                                         stacking=stacking, time_budget=time_left(deadline, call_start, reserve))
+        if stacking:
+            # boxes left without a place stand on the floor, the optimizer moves them
+            pos[~fits, 2] = floor_heights(bbox, main_bbox)[~fits]
+        constructed = get_items_class("numpy")(masses, bbox, main_bbox, pos=pos, stacking=stacking,
+                                               max_bias=item_options.get("max_bias"),
+                                               max_cg_height=item_options.get("max_cg_height"))
+        elapsed = time.perf_counter() - start
+        item_options.update(pos=pos)
+        # the first start keeps the constructed layout, extra starts still explore from random positions
+        # (when some boxes have positions of their own no start is shuffled, all of them keep those)
+        shuffle = np.zeros(len(masses), dtype=bool) if placed.any() else False
+
+    if options.method == "constructive" or stacking and constructed is not None and \
+            constructed.conflict_count() == 0:
+        items = constructed
+        result = PlacementResult(
+            steps=0,
+            elapsed=elapsed,
+            converged=bool(fits.all()),
+            expired=False,
+            overlaps=int(constructed.overlap_count()),
+            losses=constructed.get_loss_components()
+        )
+    else:
+        max_steps = options.max_steps
+        if deadline is not None:
+            monitor = ConvergenceMonitor() if monitor is None else monitor
+            monitor.time_budget = time_left(deadline, call_start, reserve)
+            max_steps = None
+
+        starts = options.starts
+        if options.rotations > 1:
+            # every start gets its own orientation set through a bbox per start, so all of them run in one batch
+            starts = max(starts, options.rotations)
+            turn = orientation_candidates(bbox, main_bbox, starts, fixed=placed, seed=options.seed)
+        else:
+            turn = np.zeros((starts, len(masses)), dtype=bool)
+        if options.method == "hierarchical":
+            if options.rotations > 1:
+                raise ValueError("the hierarchical method keeps the stored orientations, use rotations=1")
+            start = time.perf_counter()
+            count = segment_count(bbox, main_bbox) if options.segments is None else options.segments
+            segment = assign_segments(masses, bbox, main_bbox, count, item_options.get("pos"), placed)
+            # a segment is done as soon as its pieces fit, the polishing pass improves the layout further
+            pos, steps = solve_segments(masses, bbox, main_bbox, segment, options, item_options, workers,
+                                        deadline=None if deadline is None else
+                                        time_left(deadline, call_start, reserve) * DEADLINE_SHARE,
+                                        shuffle=shuffle)
+            # boxes at the borders of the segments and the center of mass of the whole load are polished together
+            polish = dict(item_options, pos=pos, collision="sweep")
+            if polish.get("loss_mode") == "fused":
+                # the fused loss only has the dense collision, the whole floor is polished with the sparse one
+                polish.update(loss_mode="eager")
+            items = get_items_class(options.backend)(masses, bbox, main_bbox, **polish)
+            monitor = ConvergenceMonitor(stop_on_feasible=True) if monitor is None else monitor
+            if deadline is not None:
+                monitor.time_budget = time_left(deadline, call_start, reserve)
+            result = items.optimize(scene, shuffle=False, monitor=monitor, max_steps=options.polish_steps,
+                                    solver=options.solver, progress=progress, instrument=instrument,
+                                    recorder=recorder)
+            result = replace(result, steps=steps + result.steps, elapsed=time.perf_counter() - start)
+        else:
+            items = get_items_class(options.backend)(masses, rotate_bbox(bbox, turn) if options.rotations > 1
+                                                     else bbox, main_bbox, **item_options)
+            result = items.optimize(scene, shuffle=shuffle, starts=starts, monitor=monitor, max_steps=max_steps,
+                                    solver=options.solver, anneal=options.anneal, progress=progress,
+                                    instrument=instrument, recorder=recorder)
+        rotated = read_piece_rotation(boxes) ^ turn[result.start]
+        if constructed is not None and items.conflict_count() > constructed.conflict_count():
+            # packed boxes get pushed apart into each other, the constructed layout was better
+            items = constructed
+            rotated = None
+            result = replace(result, losses=items.get_loss_components())
 
-    items = build_items(platform, boxes)
-    items.optimize(scene)
-    fill_boxes_positions(items, boxes)
+    # the stored millimetre layout is checked exactly, residual overlaps of the soft penalty are pushed apart
+    overlaps = fill_boxes_positions(items, boxes, rotated, time_budget=time_left(deadline, call_start))
+    result = replace(result, overlaps=overlaps, within_limits=within_limits(platform, boxes),
+                     elapsed=time.perf_counter() - call_start)
+    if index is not None and not result.has_overlap:
+        index.add(platform, boxes)
+    return result
 
 
 def main():
@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+
+
+class ConvergenceMonitor:
+    # stop criteria for Items.optimize / NumpyItems.optimize, works on torch tensors and numpy arrays alike
+    #   stop_p - relative std of the loss below which a start is converged (None to disable)
+    #   grad_norm - gradient norm below which a start is converged (None to disable)
+    #   stop_on_feasible - a start is done as soon as it has no more than overlap_budget overlaps
+    #   time_budget - seconds of wall clock after which all starts are stopped (None for no limit)
+    #   keep_best - remember the best feasible layout seen at checks, otherwise only the final starts are compared
+    # running statistics stay on the loss tensor, the host only syncs every check_every steps;
+    # at every check the best feasible layout seen so far is kept, so an expired run still has an answer
+
+    def __init__(self, stop_p=1e-4, window=100, check_every=10, grad_norm=None, stop_on_feasible=False,
+                 time_budget=None, overlap_budget=0, keep_best=True):
+        self.stop_p = stop_p
+        self.window = window
+        self.check_every = check_every
+        self.grad_norm = grad_norm
+        self.stop_on_feasible = stop_on_feasible
+        self.time_budget = time_budget
+        self.overlap_budget = overlap_budget
+        self.keep_best = keep_best
+        self.reset()
+
+    def reset(self):
+        self.mean = None
+        self.var = None
+        self.last = None
+        self.steps = 0
+        self.expired = False
+        self.start_time = time.perf_counter()
+        self.best_loss = np.inf
+        self.best_pos = None
+        self.best_start = 0
+        self.selected = 0  # start the layout returned by select comes from
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def update(self, loss):
+        # exponential moving mean and variance with an effective window of `window` steps
+        self.steps += 1
+        self.last = loss
+        if self.mean is None:
+            self.mean = loss * 1
+            self.var = loss * 0
+            return
+        alpha = 1 / self.window
+        diff = loss - self.mean
+        incr = alpha * diff
+        self.mean = self.mean + incr
+        self.var = (1 - alpha) * (self.var + diff * incr)
+
+    def should_check(self):
+        # every check_every steps, and at once when the time budget is up (a step of a large order is slow)
+        return self.steps % self.check_every == 0 or \
+            self.time_budget is not None and self.elapsed() > self.time_budget
+
+    def check(self, pos, overlaps, grad=None) -> np.ndarray:
+        # pos - (starts, N, 3) current layouts, overlaps - (starts,) from overlap_count
+        # returns (starts,) mask of starts that are done
+        loss = np.asarray(self.last, dtype=np.float64)
+        feasible = overlaps == 0
+        if self.keep_best and feasible.any():
+            k = np.where(feasible, loss, np.inf).argmin()
+            if loss[k] < self.best_loss:
+                self.best_loss = loss[k]
+                self.best_pos = np.array(pos[k])
+                self.best_start = int(k)
+
+        done = np.zeros(loss.shape, dtype=bool)
+
+        if self.stop_p is not None and self.steps >= self.window:
+            done |= np.asarray(self.var ** 0.5 < self.stop_p * self.mean)
+
+        if self.grad_norm is not None and grad is not None:
+            done |= np.asarray((grad ** 2).sum(-1).sum(-1) ** 0.5 < self.grad_norm)
+
+        if self.stop_on_feasible:
+            done |= overlaps <= self.overlap_budget
+
+        if self.time_budget is not None and self.elapsed() > self.time_budget:
+            self.expired = True
+            done[:] = True
+
+        return done
+
+    def select(self, pos, loss, overlaps) -> np.ndarray:
+        # final layout: the best feasible of the final starts or of the ones seen at checks
+        loss = np.asarray(loss, dtype=np.float64)
+        feasible = overlaps == 0
+        if feasible.any():
+            loss = np.where(feasible, loss, np.inf)
+        k = loss.argmin()
+        if self.best_pos is not None and (not feasible[k] or self.best_loss < loss[k]):
+            self.selected = self.best_start
+            return self.best_pos.copy()
+        self.selected = int(k)
+        return np.array(pos[k])
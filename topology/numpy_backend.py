@@ -0,0 +1,480 @@
+import itertools
+import time
+
+import numpy as np
+
+from topology.broadphase import overlap_count, sweep_and_prune
+from topology.instrument import Instrument, StepRecord
+from topology.monitor import ConvergenceMonitor
+from topology.progress import progress_frame
+from topology.result import PlacementResult
+
+
+def safe_exp(x, p1=1):
+    # Items.safe_exp_loss with x0 = 1, together with its derivative
+    value = (
+            np.exp(np.clip(x, None, p1)) +
+            np.exp(p1) * np.clip(x - p1, 0, None) +
+            np.square(np.clip(x - p1, 0, None)) / 2
+    )
+    grad = np.where(x <= p1, np.exp(np.clip(x, None, p1)), np.exp(p1) + (x - p1))
+    return value, grad
+
+
+def pair_dist(offset, size):
+    # Items.pair_dist on (..., 3) center offsets and sums of half sizes, with d dist / d offset
+    dist = np.abs(offset) - size
+    mask = dist.max(axis=-1) > 0
+    clipped = np.clip(dist, 1e-12, None)
+    dist_far = np.sqrt(np.square(clipped).sum(axis=-1))
+    value = np.where(mask, dist_far, dist.prod(axis=-1))
+
+    grad_far = clipped / dist_far[..., None] * (dist >= 1e-12)
+    grad_sum = np.stack([
+        dist[..., 1] * dist[..., 2],
+        dist[..., 0] * dist[..., 2],
+        dist[..., 0] * dist[..., 1],
+    ], axis=-1)
+    grad = np.where(mask[..., None], grad_far, grad_sum) * np.sign(offset)
+    return value, grad
+
+
+class NumpyItems:
+    # Items without torch: the same loss terms with hand-derived gradients and Adam in NumPy
+    pos: np.ndarray  # (N, 3) positions of center of mass
+    mass: np.ndarray  # (N,) masses in kg
+    bbox: np.ndarray  # (N, 2, 3) -- ((x, y, z) relative to center, (Wx, Wy, Wz)), or (starts, N, 2, 3)
+
+    main_bbox: np.ndarray
+
+    collision: str  # "dense" or "sweep", same as for Items
+    pairs: np.ndarray = None
+
+    pinned: np.ndarray = None  # (N,) boxes that keep their position during optimize
+
+    stacking: bool  # same as for Items
+    min_support: float
+    max_bias: float = None  # regulatory limits, same as for Items
+    max_cg_height: float = None
+    constraints: str
+    penalty_weight: float
+    multipliers: np.ndarray = None
+
+    def __init__(
+            self,
+            mass: np.ndarray,
+            bbox: np.ndarray,
+            main_bbox: np.ndarray,
+            pos: np.ndarray = None,
+            safe_dist: float = 0.1,
+            collision: str = "dense",
+            cutoff: float = None,
+            pinned: np.ndarray = None,
+            seed: int = None,
+            stacking: bool = False,
+            min_support: float = 0.8,
+            max_bias: float = None,
+            max_cg_height: float = None,
+            constraints: str = "penalty",
+            penalty_weight: float = 100.0
+    ):
+        self.mass = np.asarray(mass, dtype=np.float32)
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.main_bbox = np.asarray(main_bbox, dtype=np.float32)
+        self.safe_dist = safe_dist
+        self.collision = collision
+        self.cutoff = 10 * safe_dist if cutoff is None else cutoff
+        self.stacking = stacking
+        self.min_support = min_support
+        self.max_bias = max_bias
+        self.max_cg_height = max_cg_height
+        self.constraints = constraints
+        self.penalty_weight = penalty_weight
+        if pinned is not None:
+            self.pinned = np.array(pinned, dtype=bool)
+        # unseeded generators draw fresh entropy, the same as the global RNG of the torch backend
+        self.rng = np.random.default_rng(seed)
+
+        if pos is None:
+            self.pos = np.zeros((self.bbox.shape[-3], 3), dtype=np.float32)
+            self.shuffle()
+        else:
+            self.pos = np.array(pos, dtype=np.float32)
+
+    def optimize(self, scene: "Scene" = None, stop_p=1e-4, shuffle=True, max_steps=1000, rebuild_every=5, starts=1,
+                 monitor: ConvergenceMonitor = None, betas=(0.9, 0.999), eps=1e-8, solver="adam",
+                 anneal: float = None, progress=None, progress_interval=0.5,
+                 instrument: Instrument = None, recorder: "TrajectoryRecorder" = None) -> PlacementResult:
+        # solver - "adam" or "projected", L-BFGS needs the torch backend
+        # instrument - as in Items.optimize, the analytic gradient is timed with the forward pass
+        # recorder - as in Items.optimize
+        if solver not in ("adam", "projected"):
+            raise ValueError(f"solver {solver!r} is not available in the numpy backend")
+        monitor = ConvergenceMonitor(stop_p=stop_p) if monitor is None else monitor
+        monitor.reset()
+
+        pos = np.repeat(self.pos[None], starts, axis=0)
+        if isinstance(shuffle, bool):
+            self.shuffle(pos if shuffle else pos[1:])
+        else:
+            self.shuffle(pos, mask=shuffle)
+        if solver == "projected":
+            pos = self.project(pos)
+        lr = self.safe_dist
+        if self.constraints == "lagrangian" and self.has_limits:
+            bbox = self.get_abs_bbox(pos)
+            self.multipliers = np.zeros_like(self.limit_excess_and_grad(bbox[..., 0, :], bbox[..., 1, :])[0])
+        m = np.zeros_like(pos)
+        v = np.zeros_like(pos)
+
+        active = np.ones(starts, dtype=bool)
+
+        reported = -np.inf
+        timing = None
+        if recorder is not None:
+            recorder.begin(self, starts, self.loss_names)
+        safe_dist, cutoff = self.safe_dist, self.cutoff
+        anneal_steps = (1000 if max_steps is None else max_steps) // 2
+        try:
+            for i in itertools.count() if max_steps is None else range(max_steps):
+                if anneal is not None:
+                    factor = anneal ** max(1 - i / anneal_steps, 0)
+                    self.safe_dist, self.cutoff = safe_dist * factor, cutoff * factor
+                    lr = self.safe_dist
+
+                if self.collision == "sweep" and i % rebuild_every == 0:
+                    self.update_pairs(pos, skin=2 * rebuild_every * self.safe_dist)
+
+                if instrument is not None and instrument.wants(i):
+                    timing = dict(forward=0.0, backward=0.0, start=time.perf_counter())
+                loss, grad = self.loss_and_grad(pos)
+                if timing is not None:
+                    timing["forward"] = time.perf_counter() - timing["start"]
+                if recorder is not None and recorder.wants(i):
+                    terms = self.loss_terms_and_grad(pos)[0] if recorder.wants_terms(i) else None
+                    recorder.record(i, pos, loss, terms)
+                if self.pinned is not None:
+                    grad[..., self.pinned, :] = 0
+
+                # Adam, converged starts are not updated at all
+                t = i + 1
+                m = betas[0] * m + (1 - betas[0]) * grad
+                v = betas[1] * v + (1 - betas[1]) * np.square(grad)
+                denom = np.sqrt(v) / np.sqrt(1 - betas[1] ** t) + eps
+                step = lr / (1 - betas[0] ** t) * m / denom
+                pos[active] -= step[active].astype(np.float32)
+                if solver == "projected":
+                    pos[active] = self.project(pos)[active]
+
+                if timing is not None:
+                    instrument.on_step(self.step_record(i, timing, monitor.start_time, pos, loss, grad))
+                    timing = None
+
+                if scene is not None:
+                    self.pos = pos[0]
+                    scene.show(self)
+
+                monitor.update(loss)
+                if monitor.should_check():
+                    if self.constraints == "lagrangian" and self.has_limits:
+                        # multipliers grow while a limit is exceeded
+                        bbox = self.get_abs_bbox(pos)
+                        excess, _ = self.limit_excess_and_grad(bbox[..., 0, :], bbox[..., 1, :])
+                        self.multipliers = np.clip(self.multipliers + self.penalty_weight * excess, 0, None)
+                    conflicts = self.conflict_count(pos)
+                    active &= ~monitor.check(pos, conflicts, grad)
+                    if progress is not None and time.perf_counter() - reported >= progress_interval:
+                        reported = time.perf_counter()
+                        progress(self.progress_frame(pos, loss, conflicts, monitor.steps))
+                    if not active.any():
+                        break
+        finally:
+            self.safe_dist, self.cutoff = safe_dist, cutoff
+            if instrument is not None:
+                instrument.close()
+            if recorder is not None:
+                recorder.close()
+
+        loss, _ = self.loss_and_grad(pos)
+        self.pos = monitor.select(pos, loss, self.conflict_count(pos))
+        if self.bbox.ndim > 3:
+            self.bbox = self.bbox[monitor.selected]
+        if self.multipliers is not None:
+            self.multipliers = self.multipliers[monitor.selected]
+
+        return PlacementResult(
+            steps=monitor.steps,
+            elapsed=monitor.elapsed(),
+            converged=not active.any() and not monitor.expired,
+            expired=monitor.expired,
+            overlaps=int(self.overlap_count()),
+            losses=self.get_loss_components(),
+            start=monitor.selected
+        )
+
+    def get_all_loss(self, pos=None):
+        return self.loss_and_grad(self.pos if pos is None else pos)[0]
+
+    def get_loss_components(self, pos=None) -> dict[str, float]:
+        terms, _ = self.loss_terms_and_grad(self.pos if pos is None else pos)
+        return {name: float(value) for name, value in terms.items()}
+
+    @property
+    def loss_names(self) -> list[str]:
+        # keys of loss_terms_and_grad
+        names = ["collision", "main_bbox", "axis", "center_of_mass"]
+        names += ["support", "gravity"] if self.stacking else []
+        return names + ["limits"] if self.has_limits else names
+
+    def step_record(self, step: int, timing: dict, start_time: float, pos, loss, grad) -> StepRecord:
+        total = time.perf_counter() - timing["start"]
+        terms, _ = self.loss_terms_and_grad(pos)
+        return StepRecord(
+            step=step,
+            time=timing["start"] - start_time,
+            forward=timing["forward"],
+            backward=timing["backward"],
+            update=total - timing["forward"],
+            loss=np.asarray(loss).tolist(),
+            losses={name: np.asarray(value).tolist() for name, value in terms.items()},
+            grad_norm=np.linalg.norm(grad.reshape(grad.shape[0], -1), axis=-1).tolist(),
+            overlaps=self.overlap_count(pos).tolist(),
+        )
+
+    def progress_frame(self, pos, loss, conflicts, step: int) -> dict:
+        terms, _ = self.loss_terms_and_grad(pos)
+        return progress_frame(pos, self.bbox, self.main_bbox, loss, conflicts, step, terms)
+
+    def loss_and_grad(self, pos):
+        # pos - (..., N, 3), returns loss (...) and d loss / d pos (..., N, 3)
+        terms, grad = self.loss_terms_and_grad(pos)
+        return sum(terms.values()), grad
+
+    def loss_terms_and_grad(self, pos):
+        # weighted loss terms (...) the same as in Items.get_loss_components and the gradient of their sum
+        n = pos.shape[-2]
+        center = pos + self.bbox[..., 0, :]
+        size = np.broadcast_to(self.bbox[..., 1, :], center.shape)
+        terms = {}
+
+        # collision
+        loss, grad = self.collision_loss_and_grad(center, size)
+        terms["collision"] = loss.mean(axis=-1)
+        grad = grad / n
+
+        # collision with bounding overall box
+        offset = center - self.main_bbox[0]
+        dist = np.abs(offset) - (self.main_bbox[1] - size) / 2
+        index = dist.argmax(axis=-1)
+        value, value_grad = safe_exp(np.take_along_axis(dist, index[..., None], axis=-1)[..., 0] / self.safe_dist)
+        terms["main_bbox"] = 10 * value.mean(axis=-1)
+        onehot = np.eye(3, dtype=np.float32)[index]
+        grad = grad + 10 / n * (value_grad / self.safe_dist)[..., None] * onehot * np.sign(offset)
+
+        # to stick every box to center axis
+        terms["axis"] = np.abs(pos[..., 0]).mean(axis=-1)
+        grad[..., 0] += np.sign(pos[..., 0]) / n
+
+        # stick center of mass to center of platform, when stacking only on the floor
+        com = self.center_of_mass(pos)
+        if self.stacking:
+            com = com * np.array([1, 1, 0], dtype=np.float32)
+        com_norm = np.linalg.norm(com, axis=-1, keepdims=True)
+        terms["center_of_mass"] = 10 * com_norm[..., 0]
+        com_grad = np.divide(com, com_norm, out=np.zeros_like(com), where=com_norm > 0)
+        grad = grad + 10 * (self.mass / self.mass.sum())[:, None] * com_grad[..., None, :]
+
+        if self.stacking:
+            floor = self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2
+            bottom = center[..., 2] - size[..., 2] / 2 - floor
+
+            # every box rests on something
+            support, support_grad = self.support_loss_and_grad(center, size, bottom)
+            terms["support"] = 10 * support.mean(axis=-1)
+            grad = grad + 10 / n * support_grad
+
+            # and sinks as low as it can
+            terms["gravity"] = bottom.mean(axis=-1)
+            grad[..., 2] += 1 / n
+
+        # regulatory limits of the center of mass
+        if self.has_limits:
+            excess, excess_grad = self.limit_excess_and_grad(center, size)
+            if self.constraints == "lagrangian":
+                multipliers = np.zeros(excess.shape[-1]) if self.multipliers is None else self.multipliers
+                rho = self.penalty_weight
+                shifted = np.clip(excess + multipliers / rho, 0, None)
+                terms["limits"] = (rho / 2 * np.square(shifted) - np.square(multipliers) / (2 * rho)).sum(axis=-1)
+                weight = rho * shifted
+            else:
+                terms["limits"] = 10 * np.clip(excess, 0, None).sum(axis=-1)
+                weight = 10 * (excess > 0)
+            grad = grad + (weight[..., None, None, :] * excess_grad).sum(axis=-1)
+
+        return terms, grad
+
+    @property
+    def has_limits(self) -> bool:
+        return self.max_bias is not None or self.max_cg_height is not None
+
+    def limit_excess_and_grad(self, center, size):
+        # Items.limit_excess (..., K) with d excess / d center (..., N, 3, K)
+        weights = self.mass / self.mass.sum()
+        excess, grad = [], []
+        if self.max_bias is not None:
+            bias = (weights * center[..., 1]).sum(axis=-1) - self.main_bbox[0, 1]
+            excess.append(np.abs(bias) - self.max_bias)
+            grad.append(np.sign(bias)[..., None, None] * weights[:, None] * np.array([0, 1, 0]))
+        if self.max_cg_height is not None:
+            floor = self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2
+            height = (weights * (center[..., 2] + size[..., 2] / 2)).sum(axis=-1) - floor
+            excess.append(height - self.max_cg_height)
+            grad.append(np.broadcast_to(weights[:, None] * np.array([0, 0, 1]), center.shape))
+        return np.stack(excess, axis=-1), np.stack(np.broadcast_arrays(*grad), axis=-1)
+
+    def conflict_count(self, pos=None, tol=1e-3) -> np.ndarray:
+        # overlap_count plus the limits the layout is beyond
+        count = self.overlap_count(pos, tol)
+        if self.has_limits:
+            bbox = self.get_abs_bbox(pos)
+            count = count + (self.limit_excess_and_grad(bbox[..., 0, :], bbox[..., 1, :])[0] > tol).sum(axis=-1)
+        return count
+
+    def support_loss_and_grad(self, center, size, bottom):
+        # per-box Items.support_loss (..., N) and the gradient of its sum w.r.t. centers
+        if self.collision == "sweep":
+            if self.pairs is None:
+                self.update_pairs(center - self.bbox[..., 0, :])
+            # both directions of every pair: a resting on b and b resting on a
+            a = np.concatenate([self.pairs[:, 0], self.pairs[:, 1]])
+            b = np.concatenate([self.pairs[:, 1], self.pairs[:, 0]])
+            area, area_grad = self.support_area_and_grad(center[..., a, :] - center[..., b, :], size[..., a, :],
+                                                         size[..., b, :])
+            flat_area = np.zeros(center.shape[:-1], dtype=np.float32).reshape(-1, center.shape[-2])
+            np.add.at(flat_area, (slice(None), a), area.reshape(len(flat_area), -1))
+            supported = flat_area.reshape(center.shape[:-1])
+        else:
+            a, b = None, None
+            area, area_grad = self.support_area_and_grad(
+                center[..., :, None, :] - center[..., None, :, :], size[..., :, None, :], size[..., None, :, :]
+            )
+            eye = np.eye(center.shape[-2], dtype=bool)
+            area, area_grad = np.where(eye, 0, area), np.where(eye[..., None], 0, area_grad)
+            supported = area.sum(axis=-1)
+
+        floor, floor_grad = self.contact_and_grad(bottom)
+        footprint = size[..., 0] * size[..., 1]
+        support = floor + supported / footprint
+        lacking = (support < self.min_support).astype(np.float32)
+        loss = lacking * (self.min_support - support)
+
+        # d loss / d support is -1 where the support is lacking, it reaches the supporting boxes through the area
+        weight = -lacking / footprint
+        grad = np.zeros_like(center)
+        grad[..., 2] = -lacking * floor_grad
+        if a is None:
+            pair_grad = weight[..., :, None, None] * area_grad
+            grad = grad + pair_grad.sum(axis=-2) - pair_grad.sum(axis=-3)
+        else:
+            pair_grad = weight[..., a, None] * area_grad
+            flat_grad, pair_grad = grad.reshape((-1,) + grad.shape[-2:]), pair_grad.reshape(len(flat_area), -1, 3)
+            np.add.at(flat_grad, (slice(None), a), pair_grad)
+            np.add.at(flat_grad, (slice(None), b), -pair_grad)
+        return loss, grad
+
+    def contact_and_grad(self, gap):
+        # Items.contact with its derivative
+        value = np.exp(-np.square(gap / self.safe_dist))
+        return value, -2 * gap / self.safe_dist ** 2 * value
+
+    def support_area_and_grad(self, offset, size_a, size_b):
+        # Items.support_area on center offsets a - b, with d area / d offset
+        gap = offset[..., 2] - (size_a[..., 2] + size_b[..., 2]) / 2
+        contact, contact_grad = self.contact_and_grad(gap)
+        raw = (size_a[..., :2] + size_b[..., :2]) / 2 - np.abs(offset[..., :2])
+        overlap = np.clip(np.minimum(raw, np.minimum(size_a[..., :2], size_b[..., :2])), 0, None)
+        sliding = (raw > 0) & (raw < np.minimum(size_a[..., :2], size_b[..., :2]))
+        overlap_grad = -np.sign(offset[..., :2]) * sliding
+
+        area = contact * overlap[..., 0] * overlap[..., 1]
+        grad = np.stack([
+            contact * overlap_grad[..., 0] * overlap[..., 1],
+            contact * overlap[..., 0] * overlap_grad[..., 1],
+            contact_grad * overlap[..., 0] * overlap[..., 1],
+        ], axis=-1)
+        return area, grad
+
+    def collision_loss_and_grad(self, center, size):
+        # per-box collision loss (..., N) and gradient of its sum w.r.t. centers
+        if self.collision == "sweep":
+            if self.pairs is None:
+                self.update_pairs(center - self.bbox[..., 0, :])
+            i, j = self.pairs[:, 0], self.pairs[:, 1]
+
+            # diagonal of the dense matrix has no gradient
+            loss, _ = safe_exp(-pair_dist(np.zeros_like(center), size)[0] / self.safe_dist)
+
+            dist, dist_grad = pair_dist(center[..., i, :] - center[..., j, :], (size[..., i, :] + size[..., j, :]) / 2)
+            value, value_grad = safe_exp(-dist / self.safe_dist)
+            pair_grad = 2 * (-value_grad / self.safe_dist)[..., None] * dist_grad
+
+            grad = np.zeros_like(center)
+            flat_loss, flat_grad = loss.reshape(-1, loss.shape[-1]), grad.reshape((-1,) + grad.shape[-2:])
+            value, pair_grad = value.reshape(len(flat_loss), -1), pair_grad.reshape(len(flat_grad), -1, 3)
+            np.add.at(flat_loss, (slice(None), i), value)
+            np.add.at(flat_loss, (slice(None), j), value)
+            np.add.at(flat_grad, (slice(None), i), pair_grad)
+            np.add.at(flat_grad, (slice(None), j), -pair_grad)
+            return loss, grad
+
+        dist, dist_grad = pair_dist(
+            center[..., :, None, :] - center[..., None, :, :],
+            (size[..., :, None, :] + size[..., None, :, :]) / 2
+        )
+        value, value_grad = safe_exp(-dist / self.safe_dist)
+        # each pair appears in two rows of the per-box loss
+        grad = (2 * (-value_grad / self.safe_dist)[..., None] * dist_grad).sum(axis=-2)
+        return value.sum(axis=-1), grad
+
+    def shuffle(self, pos=None, mask=None):
+        pos = self.pos if pos is None else pos
+        shuffled = self.rng.standard_normal(pos.shape) * np.array([1, 1, 0])
+        shuffled *= self.main_bbox[1] / 2
+        shuffled += self.main_bbox[0]
+        if self.stacking:
+            # stacked layouts start with every box on the floor
+            bbox = self.bbox.reshape((-1,) + self.bbox.shape[-3:])[0]
+            shuffled[..., 2] = self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2 + bbox[:, 1, 2] / 2 - bbox[:, 0, 2]
+        if mask is None:
+            pos[:] = shuffled
+        else:
+            pos[..., mask, :] = shuffled[..., mask, :]
+
+    def project(self, pos=None) -> np.ndarray:
+        pos = self.pos if pos is None else pos
+        room = (self.main_bbox[1] - self.bbox[..., 1, :]) / 2
+        lo = self.main_bbox[0] - room - self.bbox[..., 0, :]
+        hi = self.main_bbox[0] + room - self.bbox[..., 0, :]
+        projected = np.maximum(np.minimum(pos, hi), lo).astype(pos.dtype)
+        if self.pinned is not None:
+            projected = np.where(self.pinned[:, None], pos, projected)
+        return projected
+
+    def get_abs_bbox(self, pos=None):
+        pos = self.pos if pos is None else pos
+        return np.stack(np.broadcast_arrays(
+            pos + self.bbox[..., 0, :],
+            self.bbox[..., 1, :]
+        ), axis=-2)
+
+    def overlap_count(self, pos=None, tol=1e-3) -> np.ndarray:
+        bbox = self.get_abs_bbox(pos)
+        return overlap_count(bbox[..., 0, :], bbox[..., 1, :], self.main_bbox, tol)
+
+    def update_pairs(self, pos=None, skin=0.0):
+        bbox = self.get_abs_bbox(pos)
+        self.pairs = sweep_and_prune(bbox[..., 0, :], bbox[..., 1, :], self.cutoff + skin)
+
+    def center_of_mass(self, pos=None):
+        pos = self.pos if pos is None else pos
+        return (self.mass[:, None] * pos).sum(axis=-2) / self.mass.sum()
@@ -0,0 +1,55 @@
+from dataclasses import dataclass, fields, replace
+
+
+@dataclass
+class PlacementOptions:
+    # how calculate_optimal_placement solves an order; the same options give the same layout of the same order,
+    # they are part of the key of a PlacementCache entry
+    collision: str = "dense"  # collision loss of Items: "dense", "tiled" or "sweep"
+    starts: int = 1  # layouts optimized side by side in one batch, the best one is returned
+    loss_mode: str = "eager"  # "eager", "fused" or "compiled" loss of Items (torch only)
+    backend: str = "torch"  # "torch" or "numpy", the numpy backend never imports torch
+    # seconds of the whole call: the constructive start, the optimizer (until it converges or the time is up,
+    # max_steps is ignored, the best feasible layout seen so far is returned) and pushing the residual overlaps
+    # apart (POSTPROCESS_SHARE of it is kept for that)
+    deadline: float = None
+    max_steps: int = 1000
+    # pieces with stored coords_of_cg start from them, only new pieces get random positions, pin_placed
+    # additionally keeps the stored ones fixed
+    incremental: bool = False
+    pin_placed: bool = False
+    # "optimize" or "constructive", the latter only runs the first-fit-decreasing placer (no torch),
+    # "hierarchical" - pieces are split into segments along the floor of equal mass (their number by segment_count
+    # unless segments is given), every segment is optimized on its own on a pool of workers processes, then
+    # the whole floor for up to polish_steps steps with sweep collision; with a deadline the segments get
+    # DEADLINE_SHARE of it and the polishing pass what is left
+    method: str = "optimize"
+    init: str = "random"  # "random" or "constructive", where the boxes that have no position yet start
+    seed: int = None  # random start positions, the same seed and order give the same layout
+    # sets of 0°/90° floor orientations of the new pieces tried at once, one start each (starts is raised to it),
+    # the best layout keeps its orientations; 1 keeps the stored orientation
+    rotations: int = 1
+    # boxes may be put on top of each other up to max_height (mm above the floor), the center of mass of the cargo
+    # is kept low enough for the MAX_HEIGHT check; stacking is constructive first: with init="constructive"
+    # a layout the placer builds without conflicts (overlaps or limits exceeded) is returned as it is, the optimizer
+    # pushing stacked boxes apart never improves on it, it only runs when pieces are left without a place or
+    # a limit is exceeded
+    stacking: bool = False
+    max_height: float = None
+    # "lagrangian" or "penalty", how the optimizer keeps the center of mass within the limits validation.formulas
+    # checks (longitudinal offset, and height when stacking), None - not at all
+    constraints: str = "lagrangian"
+    # "adam", "projected" (boxes kept inside the floor after every step) or "lbfgs" (torch only), anneal - start
+    # with a collision margin that many times wider (not with "lbfgs"), see Items.optimize
+    solver: str = "adam"
+    anneal: float = None
+    segments: int = None
+    polish_steps: int = 200
+
+
+def split_options(options: PlacementOptions, kwargs: dict) -> tuple[PlacementOptions, dict]:
+    # options (the defaults if None) with the fields given in kwargs replaced, and the rest of kwargs
+    names = {field.name for field in fields(PlacementOptions)}
+    options = replace(PlacementOptions() if options is None else options,
+                      **{name: value for name, value in kwargs.items() if name in names})
+    return options, {name: value for name, value in kwargs.items() if name not in names}
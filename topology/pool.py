@@ -0,0 +1,200 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError, wait
+from multiprocessing import get_context
+
+from topology.result import PlacementResult
+from validation.models import Carriage, Box
+
+WATCH_INTERVAL = 1.0  # seconds between the checks that the workers are alive while no result comes
+PLACE_TIMEOUT = 600.0  # seconds SolverPool.place waits for a placement by default
+
+
+def prepare_worker(threads: int, warm_up: bool = True):
+    # pins the torch threads of a solver process to its share of the cores, so that concurrent solves do not
+    # oversubscribe them, and runs a tiny solve through the whole pipeline: torch kernels, the allocator and
+    # the thread pools are initialized before the first real order
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    import topology.process  # noqa: F401
+    from topology.main import calculate_optimal_placement
+
+    if warm_up:
+        platform = Carriage(floor_length=13300, floor_width=2870, weight=21, height_from_rails=1310,
+                            cg_height_from_rails=800, base_length=9720, length_to_cg=6650, s_side_surface_meters=7)
+        calculate_optimal_placement(platform, [Box(dimensions=(1000, 800, 500), weight=1.0, amount=4)],
+                                    max_steps=50, seed=0)
+
+
+def worker_threads(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _serve(tasks, results, threads, warm_up):
+    from topology.main import calculate_optimal_placement
+
+    prepare_worker(threads, warm_up)
+    results.put(("ready", os.getpid()))
+    while (task := tasks.get()) is not None:
+        task_id, platform, boxes, kwargs = task
+        results.put(("started", os.getpid(), task_id))
+        try:
+            result = calculate_optimal_placement(platform, boxes, **kwargs)
+            results.put(("done", os.getpid(), task_id, (boxes, result), None))
+        except Exception as e:
+            results.put(("done", os.getpid(), task_id, None, e))
+
+
+class WorkerDied(RuntimeError):
+    pass
+
+
+class SolverPool:
+    # workers long-lived processes with torch imported and warmed up, placements are sent to them over
+    # multiprocessing queues; each worker uses threads torch threads (the cores split evenly by default)
+    # calculate_optimal_placement(..., pool=pool) solves through it, close() (or with) stops the workers
+    # a worker that dies fails the placement it was solving with WorkerDied and is replaced by a new one,
+    # a placement that times out in place() or gather() gets its worker replaced as well
+
+    def __init__(self, workers: int = 2, threads: int = None, warm_up: bool = True):
+        self.threads = worker_threads(workers) if threads is None else threads
+        self.warm_up = warm_up
+        self.context = get_context("spawn")
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.futures = {}
+        self.running = {}  # pid of a worker -> id of the task it is solving
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.ready = threading.Semaphore(0)
+        self.closing = False
+        self.processes = [self._start() for _ in range(workers)]
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def _start(self):
+        process = self.context.Process(target=_serve, args=(self.tasks, self.results, self.threads, self.warm_up),
+                                       daemon=True)
+        process.start()
+        return process
+
+    def _collect(self):
+        while True:
+            try:
+                message = self.results.get(timeout=WATCH_INTERVAL)
+            except queue.Empty:
+                self._replace_dead()
+                continue
+            if message is None:
+                return
+            if message[0] == "ready":
+                # a worker finished its warm-up
+                self.ready.release()
+            elif message[0] == "started":
+                _, pid, task_id = message
+                with self.lock:
+                    self.running[pid] = task_id
+                    abandoned = task_id not in self.futures
+                if abandoned:
+                    # abandoned while it was still in the queue, the worker is stopped before it wastes time on it
+                    self._kill(pid)
+            else:
+                _, pid, task_id, value, error = message
+                with self.lock:
+                    future = self.futures.pop(task_id, None)
+                    self.running.pop(pid, None)
+                if future is None:
+                    # place() gave up waiting for it
+                    continue
+                if error is None:
+                    future.set_result(value)
+                else:
+                    future.set_exception(error)
+            self._replace_dead()
+
+    def _replace_dead(self):
+        # the messages a dead worker sent before it died are already read, the placement it was solving fails
+        if self.closing:
+            return
+        for k, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            self.processes[k] = self._start()
+            with self.lock:
+                future = self.futures.pop(self.running.pop(process.pid, None), None)
+            if future is not None:
+                future.set_exception(WorkerDied(f"solver worker {process.pid} died with exit code {process.exitcode}"))
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        # blocks until every worker is warmed up
+        return all(self.ready.acquire(timeout=timeout) for _ in self.processes)
+
+    def submit(self, platform: Carriage, boxes: list[Box], **kwargs) -> Future:
+        # Future of (placed copies of the boxes, PlacementResult), kwargs of calculate_optimal_placement
+        future = Future()
+        task_id = next(self.ids)
+        with self.lock:
+            self.futures[task_id] = future
+        self.tasks.put((task_id, platform, boxes, kwargs))
+        return future
+
+    def place(self, platform: Carriage, boxes: list[Box], timeout: float = PLACE_TIMEOUT,
+              **kwargs) -> PlacementResult:
+        # solves like calculate_optimal_placement and writes the placed coordinates into the boxes;
+        # raises TimeoutError after timeout seconds (None - waits as long as it takes)
+        future = self.submit(platform, boxes, **kwargs)
+        try:
+            placed, result = future.result(timeout)
+        except TimeoutError:
+            self._abandon(future)
+            raise
+        for box, solved in zip(boxes, placed):
+            box.coords_of_cg, box.pieces = solved.coords_of_cg, solved.pieces
+            box.rotated, box.pieces_rotated = solved.rotated, solved.pieces_rotated
+        return result
+
+    def gather(self, futures: list[Future], timeout: float = PLACE_TIMEOUT) -> list:
+        # the values of the futures of submit() in order, waiting timeout seconds for all of them together
+        # (None - as long as it takes); when the time is up the placements not done are abandoned like in place()
+        # and fail with TimeoutError, which is raised
+        _, pending = wait(futures, timeout)
+        for future in pending:
+            self._abandon(future)
+        if pending:
+            raise TimeoutError(f"{len(pending)} of {len(futures)} placements not done in {timeout} s")
+        return [future.result() for future in futures]
+
+    def _abandon(self, future: Future):
+        # a placement still waiting is dropped, the worker stuck on a started one is killed and replaced
+        with self.lock:
+            task_id = next((task for task, pending in self.futures.items() if pending is future), None)
+            self.futures.pop(task_id, None)
+            pid = next((pid for pid, task in self.running.items() if task == task_id), None)
+        self._kill(pid)
+        if task_id is not None:
+            # a placement that finished in the meantime keeps its result
+            future.set_exception(TimeoutError("the placement was abandoned"))
+
+    def _kill(self, pid: int):
+        for process in self.processes:
+            if process.pid == pid:
+                process.kill()
+
+    def close(self):
+        self.closing = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.results.put(None)
+        self.collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
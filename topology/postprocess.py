@@ -0,0 +1,236 @@
+import time
+
+import numpy as np
+
+from topology.broadphase import sweep_and_prune
+from topology.constructive import first_fit_decreasing
+
+LENGTH = 0  # length axis of Box.coords_of_cg / Box.dimensions, the width axis is 1
+
+
+def snap_to_grid(positions: np.ndarray) -> np.ndarray:
+    # positions in millimetres rounded to whole millimetres, the way they are stored in Box.coords_of_cg
+    return np.round(positions).astype(np.int64)
+
+
+def find_overlaps(centers: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    # centers, sizes - (N, 3) integer millimetres, returns (P, 2) pairs of boxes with a positive penetration
+    # on every axis; touching boxes do not overlap, the comparison is exact on doubled coordinates
+    centers2 = 2 * centers
+    # sweep-line along the length axis, touching pairs are kept by the broad phase and dropped below
+    i, j = sweep_and_prune(centers2, 2 * sizes, 0, axis=LENGTH).T
+    overlap = np.all(np.abs(centers2[i] - centers2[j]) < sizes[i] + sizes[j], axis=-1)
+    return np.stack([i[overlap], j[overlap]], axis=-1)
+
+
+def floor_limits(sizes: np.ndarray, floor: np.ndarray, ceiling: int = None) -> tuple[np.ndarray, np.ndarray]:
+    # (N, 2) lowest and highest center of every box on the floor, floor - (length, width) in millimetres,
+    # the length is counted from the start of the platform and the width from its axis;
+    # with a ceiling (stacked boxes) (N, 3), the height is counted from the floor
+    lo = np.stack([(sizes[:, 0] + 1) // 2, -((floor[1] - sizes[:, 1]) // 2)], axis=-1)
+    hi = np.stack([floor[0] - (sizes[:, 0] + 1) // 2, (floor[1] - sizes[:, 1]) // 2], axis=-1)
+    if ceiling is not None:
+        lo = np.concatenate([lo, (sizes[:, 2:] + 1) // 2], axis=-1)
+        hi = np.concatenate([hi, ceiling - (sizes[:, 2:] + 1) // 2], axis=-1)
+    return lo, hi
+
+
+def push(centers, i, j, axis, need, lo, hi, fixed):
+    # moves the boxes of the disjoint pairs (i, j) apart along axis by need millimetres in total, as evenly as
+    # the floor lets them; i, j, axis, need - (P,) arrays
+    swap = centers[i, axis] > centers[j, axis]
+    i, j = np.where(swap, j, i), np.where(swap, i, j)
+    room_back = np.where(fixed[i], 0, np.maximum(centers[i, axis] - lo[i, axis], 0))
+    room_forward = np.where(fixed[j], 0, np.maximum(hi[j, axis] - centers[j, axis], 0))
+    back = np.minimum(need // 2, room_back)
+    forward = np.minimum(need - back, room_forward)
+    back = np.minimum(need - forward, room_back)
+    centers[i, axis] -= back
+    centers[j, axis] += forward
+
+
+def resolve_overlaps(centers: np.ndarray, sizes: np.ndarray, floor: np.ndarray, fixed: np.ndarray = None,
+                     masses: np.ndarray = None, max_rounds: int = 100, ceiling: int = None,
+                     min_support: float = 0.0, time_budget: float = None) -> tuple[np.ndarray, int]:
+    # moves boxes back inside the floor and pushes overlapping pairs apart along the floor axis (length or width)
+    # that needs the smallest whole number of millimetres, split between both boxes
+    # boxes that are still in conflict after max_rounds are placed again by first_fit_decreasing (by drop when stacking)
+    # centers, sizes - (N, 3) integer millimetres; fixed boxes are never moved
+    # ceiling - height limit of stacked boxes: pairs are pushed apart in height too and every box is let down
+    #           onto the floor or the boxes beneath it, less than min_support of its bottom resting counts as conflict
+    # time_budget - seconds, no new round (or placement) starts once they are up, the conflicts left are counted
+    # returns new centers and the number of overlapping pairs plus boxes out of the floor (or unsupported) left
+    end = None if time_budget is None else time.perf_counter() + time_budget
+    centers = np.array(centers, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    fixed = np.zeros(len(centers), dtype=bool) if fixed is None else np.asarray(fixed, dtype=bool)
+    lo, hi = floor_limits(sizes, floor, ceiling)
+    axes = lo.shape[1]
+
+    inside = np.clip(centers[:, :axes], lo, hi)
+    movable = ~fixed[:, None] & (lo <= hi)
+    centers[:, :axes] = np.where(movable, inside, centers[:, :axes])
+
+    centers = push_apart(centers, sizes, lo, hi, fixed, max_rounds, end)
+    if ceiling is not None:
+        centers = settle(centers, sizes, fixed)
+        centers = restack(centers, sizes, lo, hi, fixed, ceiling, min_support, max_rounds, end)
+    else:
+        conflicted = conflicts(centers, sizes, lo, hi) & ~fixed
+        if conflicted.any() and not expired(end):
+            # boxes jammed too deep to be pushed out get a free place from the constructive placer instead
+            masses = np.ones(len(centers)) if masses is None else masses
+            main_bbox = np.array([[0, floor[0] / 2, 0], [floor[1], floor[0], 2 * sizes[:, 2].max()]])
+            bbox = np.stack([np.zeros(sizes.shape), sizes[:, [1, 0, 2]]], axis=-2)
+            pos, _ = first_fit_decreasing(masses, bbox, main_bbox, pos=centers[:, [1, 0, 2]], fixed=~conflicted,
+                                          time_budget=None if end is None else end - time.perf_counter())
+            # odd sizes put the placed centers on half millimetres, rounding must not move them out of the floor
+            centers[conflicted, :2] = np.clip(snap_to_grid(pos[conflicted][:, [1, 0]]), lo[conflicted],
+                                              hi[conflicted])
+            centers = push_apart(centers, sizes, lo, hi, fixed, max_rounds, end)
+
+    outside = np.any((centers[:, :axes] < lo) | (centers[:, :axes] > hi), axis=-1)
+    conflicts_left = len(find_overlaps(centers, sizes)) + int(outside.sum())
+    if ceiling is not None:
+        conflicts_left += int(unsupported(centers, sizes, min_support).sum())
+    return centers, conflicts_left
+
+
+def expired(end: float = None) -> bool:
+    return end is not None and time.perf_counter() >= end
+
+
+def disjoint(pairs: np.ndarray) -> np.ndarray:
+    # (P,) mask of the pairs that come first for both of their boxes, no box is in two of them
+    first = np.full(pairs.max(initial=-1) + 1, len(pairs))
+    np.minimum.at(first, pairs[:, 0], np.arange(len(pairs)))
+    np.minimum.at(first, pairs[:, 1], np.arange(len(pairs)))
+    k = np.arange(len(pairs))
+    return (first[pairs[:, 0]] == k) & (first[pairs[:, 1]] == k)
+
+
+def push_apart(centers, sizes, lo, hi, fixed, max_rounds, end=None):
+    # every round pushes the overlapping pairs apart in batches of pairs without a common box, a batch at once;
+    # a pair an earlier batch has separated already is skipped; stops after the batch during which end passed
+    axes = lo.shape[1]
+    for _ in range(max_rounds):
+        pairs = find_overlaps(centers, sizes)
+        if len(pairs) == 0:
+            break
+        while len(pairs):
+            i, j = pairs.T
+            pairs = pairs[np.all(np.abs(2 * (centers[i] - centers[j])) < sizes[i] + sizes[j], axis=-1)]
+            batch = disjoint(pairs)
+            i, j = pairs[batch].T
+            # the floor axis (or height when stacking) where the pair needs the smallest push, the length axis on a tie
+            need = (sizes[i, :axes] + sizes[j, :axes] + 1) // 2 - np.abs(centers[i, :axes] - centers[j, :axes])
+            axis = np.argmin(need, axis=-1)
+            push(centers, i, j, axis, need[np.arange(len(i)), axis], lo, hi, fixed)
+            pairs = pairs[~batch]
+            if expired(end):
+                return centers
+    return centers
+
+
+def conflicts(centers, sizes, lo, hi) -> np.ndarray:
+    # (N,) boxes that overlap another one or stick out of the floor
+    axes = lo.shape[1]
+    conflicted = np.any((centers[:, :axes] < lo) | (centers[:, :axes] > hi), axis=-1)
+    conflicted[find_overlaps(centers, sizes).ravel()] = True
+    return conflicted
+
+
+def restack(centers, sizes, lo, hi, fixed, ceiling, min_support, max_rounds, end=None):
+    # boxes jammed too deep to be pushed out are put down again one by one, the largest first, on the floor
+    # or on top of the others wherever they end up lowest; moving a box may take the support from under
+    # the boxes on it, they get their turn in the next round
+    for _ in range(max_rounds):
+        conflicted = (conflicts(centers, sizes, lo, hi) | unsupported(centers, sizes, min_support)) & ~fixed
+        if not conflicted.any():
+            break
+        moved = False
+        for i in np.argsort(-sizes[:, 0] * sizes[:, 1], kind="stable"):
+            if conflicted[i]:
+                moved |= drop(centers, sizes, i, ~conflicted, lo[i], hi[i], ceiling, min_support)
+                conflicted[i] = False
+        if not moved or expired(end):
+            break
+    return centers
+
+
+def settle(centers: np.ndarray, sizes: np.ndarray, fixed: np.ndarray) -> np.ndarray:
+    # lets every movable box down, the lowest first, onto the floor or the highest top of the boxes beneath it;
+    # heights are compared doubled, a box with an odd height may stay half a millimetre above its support
+    bottom2 = 2 * centers[:, 2] - sizes[:, 2]
+    top2 = bottom2 + 2 * sizes[:, 2]
+    done = np.zeros(len(centers), dtype=bool)
+    for i in np.argsort(bottom2, kind="stable"):
+        if not fixed[i]:
+            beneath = done & np.all(np.abs(2 * (centers[:, :2] - centers[i, :2])) < sizes[:, :2] + sizes[i, :2],
+                                    axis=-1)
+            level = top2[beneath].max(initial=0)
+            level += (level + sizes[i, 2]) % 2
+            centers[i, 2] = (level + sizes[i, 2]) // 2
+            bottom2[i], top2[i] = level, level + 2 * sizes[i, 2]
+        done[i] = True
+    return centers
+
+
+def drop(centers: np.ndarray, sizes: np.ndarray, i: int, others: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+         ceiling: int, min_support: float) -> bool:
+    # puts box i down where it rests lowest without touching the other boxes, at the floor corners, next to
+    # or on top of one of the others (centered or flush with a corner), with at least min_support of its bottom
+    # resting; the nearest to its current place among the lowest ones, False (not moved) if there is none
+    size = sizes[i]
+    other_centers, other_sizes = centers[others], sizes[others]
+    half = (size[:2] + other_sizes[:, :2] + 1) // 2
+    flush = (other_sizes[:, :2] - size[:2]) // 2
+    candidates = np.concatenate([
+        np.array([[lo[0], lo[1]], [lo[0], hi[1]], [hi[0], lo[1]], [hi[0], hi[1]]]),
+        other_centers[:, :2],
+        other_centers[:, :2] - flush,
+        other_centers[:, :2] + flush,
+        other_centers[:, :2] + half * [1, 0],
+        other_centers[:, :2] - half * [1, 0],
+        other_centers[:, :2] + half * [0, 1],
+        other_centers[:, :2] - half * [0, 1],
+    ])
+    candidates = np.unique(np.clip(candidates, lo[:2], hi[:2]), axis=0)
+
+    # (C, M) others under every candidate, the box rests on the highest of them
+    beneath = np.all(
+        np.abs(2 * (candidates[:, None] - other_centers[None, :, :2])) < size[:2] + other_sizes[None, :, :2], axis=-1
+    )
+    other_top2 = 2 * other_centers[:, 2] + other_sizes[:, 2]
+    level = np.where(beneath, other_top2, 0).max(axis=-1, initial=0)
+    level += (level + size[2]) % 2
+
+    overlap = np.minimum(
+        size[:2] + other_sizes[None, :, :2] - np.abs(2 * (candidates[:, None] - other_centers[None, :, :2])),
+        2 * np.minimum(size[:2], other_sizes[None, :, :2])
+    ).clip(0, None).prod(axis=-1)
+    gap = level[:, None] - other_top2[None]
+    area = np.where((gap >= 0) & (gap <= 1), overlap, 0).sum(axis=-1)
+    valid = (level + 2 * size[2] <= 2 * ceiling) & ((level <= 1) | (area >= min_support * 4 * size[0] * size[1]))
+    if not valid.any():
+        return False
+
+    distance = np.abs(candidates - centers[i, :2]).sum(axis=-1)
+    best = np.lexsort((distance, level, ~valid))[0]
+    centers[i, :2] = candidates[best]
+    centers[i, 2] = (level[best] + size[2]) // 2
+    return True
+
+
+def unsupported(centers: np.ndarray, sizes: np.ndarray, min_support: float) -> np.ndarray:
+    # (N,) boxes above the floor whose bottom rests on the tops of other boxes with less than min_support of its area
+    bottom2 = 2 * centers[:, 2] - sizes[:, 2]
+    top2 = 2 * centers[:, 2] + sizes[:, 2]
+    gap = bottom2[:, None] - top2[None]
+    # doubled overlap of the footprints of every pair
+    overlap = np.minimum(
+        sizes[:, None, :2] + sizes[None, :, :2] - np.abs(2 * (centers[:, None, :2] - centers[None, :, :2])),
+        2 * np.minimum(sizes[:, None, :2], sizes[None, :, :2])
+    ).clip(0, None)
+    area = np.where((gap >= 0) & (gap <= 1), overlap.prod(axis=-1), 0).sum(axis=-1)
+    return (bottom2 > 1) & (area < min_support * 4 * sizes[:, 0] * sizes[:, 1])
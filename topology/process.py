@@ -1,98 +1,410 @@
+import itertools
+import time
+import warnings
+
 import numpy as np
 import torch
 
+from topology.broadphase import overlap_count, sweep_and_prune
+from topology.instrument import Instrument, StepRecord
+from topology.kernels import fused_loss, tiled_collision_loss
+from topology.monitor import ConvergenceMonitor
+from topology.progress import progress_frame
+from topology.result import PlacementResult
+
 
 class Items:
     pos: torch.Tensor  # (N, 3) positions of center of mass
     mass: torch.Tensor  # (N,) masses in kg
-    bbox: torch.Tensor  # (N, 2, 3) -- ((x, y, z) relative to center, (Wx, Wy, Wz))
+    bbox: torch.Tensor  # (N, 2, 3) -- ((x, y, z) relative to center, (Wx, Wy, Wz)),
+    #                     or (starts, N, 2, 3) to optimize every start with its own box orientations
 
     main_bbox: torch.Tensor
 
+    collision: str  # "dense" - all pairs, "sweep" - sparse pairs from sweep-and-prune broad phase,
+    #                 "tiled" - all pairs in blocks of tile rows with O(N * tile) memory
+    pairs: torch.Tensor = None  # (P, 2) candidate pairs i < j for the "sweep" collision
+
+    pinned: torch.Tensor = None  # (N,) boxes that keep their position during optimize
+
+    generator: torch.Generator = None  # random positions of shuffle, the global torch RNG when there is no seed
+
+    stacking: bool  # z is optimized too: boxes rest on the floor (z = 0 at the bottom of main_bbox) or on other boxes
+    min_support: float  # part of the bottom of a stacked box that has to rest on the floor or on boxes beneath it
+
+    # regulatory limits of the cargo center of mass, checked by validation.formulas after the placement:
+    max_bias: float = None  # longitudinal offset from the middle of the floor
+    max_cg_height: float = None  # height above the floor the way the report counts it (only when stacking)
+    constraints: str  # "penalty" - fixed weight on the excess over a limit, "lagrangian" - augmented Lagrangian
+    #                   with multipliers updated at every convergence check, the excess is driven to zero
+    penalty_weight: float  # rho of the augmented Lagrangian
+    multipliers: torch.Tensor = None  # (starts, K) or (K,) Lagrange multipliers of the limits
+
+    loss_mode: str  # "eager" - plain torch ops, "fused" - single op with analytic gradient (dense collision only,
+    #                 without stacking or a bbox per start), "compiled" - eager loss through torch.compile,
+    #                 falls back to "fused" if it is unavailable and the fused loss covers the items, else to "eager"
+
     def __init__(
             self,
             mass: np.ndarray,
             bbox: np.ndarray,
             main_bbox: np.ndarray,
             pos: np.ndarray = None,
-            safe_dist: float = 0.1
+            safe_dist: float = 0.1,
+            collision: str = "dense",
+            cutoff: float = None,
+            tile: int = 64,
+            loss_mode: str = "eager",
+            pinned: np.ndarray = None,
+            seed: int = None,
+            stacking: bool = False,
+            min_support: float = 0.8,
+            max_bias: float = None,
+            max_cg_height: float = None,
+            constraints: str = "penalty",
+            penalty_weight: float = 100.0
     ):
         self.mass = torch.tensor(mass, dtype=torch.float32)
         self.bbox = torch.tensor(bbox, dtype=torch.float32)
         self.main_bbox = torch.tensor(main_bbox, dtype=torch.float32)
         self.safe_dist = safe_dist
+        self.collision = collision
+        # pairs further than cutoff contribute less than exp(-cutoff / safe_dist) to the collision loss
+        self.cutoff = 10 * safe_dist if cutoff is None else cutoff
+        self.tile = tile
+        self.loss_mode = loss_mode
+        self._compiled_loss = None
+        self.stacking = stacking
+        self.min_support = min_support
+        self.max_bias = max_bias
+        self.max_cg_height = max_cg_height
+        self.constraints = constraints
+        self.penalty_weight = penalty_weight
+        if loss_mode == "fused" and collision != "dense":
+            raise ValueError(f"the fused loss only has the dense collision, not {collision!r}")
+        if self.bbox.dim() > 3 and (loss_mode == "fused" or collision == "tiled"):
+            raise ValueError("a bbox per start needs the eager or compiled loss with dense or sweep collision")
+        if stacking and (loss_mode == "fused" or collision == "tiled"):
+            raise ValueError("stacking needs the eager or compiled loss with dense or sweep collision")
+        if pinned is not None:
+            self.pinned = torch.tensor(pinned, dtype=torch.bool)
+        if seed is not None:
+            self.generator = torch.Generator().manual_seed(seed)
 
         if pos is None:
-            self.pos = torch.zeros(len(bbox), 3, dtype=torch.float32)
+            self.pos = torch.zeros(self.bbox.shape[-3], 3, dtype=torch.float32)
             self.shuffle()
         else:
             self.pos = torch.tensor(pos, dtype=torch.float32)
 
-    def optimize(self, scene: "Scene" = None, stop_p=1e-4, shuffle=True, max_steps=1000):
-        prev_loss = [self.get_all_loss()]
-        N_history = 100
+    def optimize(self, scene: "Scene" = None, stop_p=1e-4, shuffle=True, max_steps=1000, rebuild_every=5, starts=1,
+                 monitor: ConvergenceMonitor = None, solver="adam", anneal: float = None, progress=None,
+                 progress_interval=0.5, instrument: Instrument = None,
+                 recorder: "TrajectoryRecorder" = None) -> PlacementResult:
+        # starts > 1 optimizes several random layouts at once as one (starts, N, 3) tensor
+        # and keeps the best feasible one; max_steps=None runs until the monitor stops (e.g. its time_budget)
+        # shuffle - True, False (only extra starts are shuffled) or (N,) mask of boxes to shuffle in every start
+        # solver - "adam", "projected" - Adam with the positions projected into main_bbox after every step,
+        #          "lbfgs" - L-BFGS with strong Wolfe line search, projected the same way
+        # anneal - continuation: safe_dist (and the step size) starts anneal times larger and shrinks back
+        #          geometrically over the first half of max_steps (500 steps without max_steps); not with "lbfgs",
+        #          the changing margin leaves its curvature history and line search stale
+        # progress - called with a progress_frame at checks, at most every progress_interval seconds;
+        #            it must return at once, the optimizer waits for it
+        # instrument - topology.instrument.Instrument getting a StepRecord of the steps it wants
+        # recorder - topology.trajectory.TrajectoryRecorder writing the positions before every step it wants
+        if solver == "lbfgs" and anneal is not None:
+            raise ValueError("anneal changes the objective at every step, L-BFGS needs a fixed one: "
+                             "use anneal with the adam or projected solver")
+        monitor = ConvergenceMonitor(stop_p=stop_p) if monitor is None else monitor
+        monitor.reset()
+
+        pos = self.pos[None].repeat(starts, 1, 1)
+        if isinstance(shuffle, bool):
+            self.shuffle(pos if shuffle else pos[1:])
+        else:
+            self.shuffle(pos, mask=shuffle)
+        if solver != "adam":
+            pos = self.project(pos)
+        pos.requires_grad = True
+        if solver == "lbfgs":
+            # one iteration per step, so the monitor sees every one of them; the line search picks the length
+            optimizer = torch.optim.LBFGS([pos], lr=1, max_iter=1, max_eval=20, history_size=10,
+                                          line_search_fn="strong_wolfe")
+            # a line search may move boxes much further than safe_dist, pairs are rebuilt every step
+            rebuild_every = 1
+        else:
+            optimizer = torch.optim.Adam([pos], lr=self.safe_dist, betas=(0.9, 0.999), eps=1e-8)
+        if self.constraints == "lagrangian" and self.has_limits:
+            self.multipliers = torch.zeros(starts, self.limit_excess(pos.detach()).shape[-1])
 
-        if shuffle:
-            self.shuffle()
+        active = torch.ones(starts, dtype=torch.bool)
+        frozen = None
 
-        params = [self.pos]
-        for param in params:
-            param.requires_grad = True
-        optimizer = torch.optim.Adam(params, lr=self.safe_dist, betas=(0.9, 0.999), eps=1e-8)
+        timing = None
+        if recorder is not None:
+            recorder.begin(self, starts, self.loss_names)
 
-        for i in range(max_steps):
+        def closure():
             optimizer.zero_grad()
-            loss = self.get_all_loss()
-            loss.backward()
-            optimizer.step()
-
-            if scene is not None:
-                scene.show(self)
+            if timing is not None:
+                start = time.perf_counter()
+            loss = self.get_all_loss(pos)
+            total = loss[active].sum()
+            if timing is not None:
+                timing["forward"] += time.perf_counter() - start
+                start = time.perf_counter()
+            total.backward()
+            if timing is not None:
+                timing["backward"] += time.perf_counter() - start
+            if self.pinned is not None:
+                # zero gradient from the first step keeps Adam moments and steps of pinned boxes at zero
+                pos.grad[..., self.pinned, :] = 0
+            if solver != "adam":
+                # boxes against a wall of main_bbox do not try to move through it, the projection would undo
+                # the step and L-BFGS would keep searching along the same direction
+                lo, hi = self.bounds()
+                blocked = ((pos <= lo) & (pos.grad > 0)) | ((pos >= hi) & (pos.grad < 0))
+                pos.grad[blocked] = 0
+            closure.loss = loss.detach()
+            return total
+
+        reported = -np.inf
+        safe_dist, cutoff = self.safe_dist, self.cutoff
+        anneal_steps = (1000 if max_steps is None else max_steps) // 2
+        try:
+            for i in itertools.count() if max_steps is None else range(max_steps):
+                if anneal is not None:
+                    # a wide collision margin spreads the boxes first, the final one packs them
+                    factor = anneal ** max(1 - i / anneal_steps, 0)
+                    self.safe_dist, self.cutoff = safe_dist * factor, cutoff * factor
+                    optimizer.param_groups[0]["lr"] = self.safe_dist
+
+                if self.collision == "sweep" and i % rebuild_every == 0:
+                    # Adam moves every box by about lr per step, so the list stays valid for rebuild_every steps
+                    self.update_pairs(pos, skin=2 * rebuild_every * self.safe_dist)
+
+                if instrument is not None and instrument.wants(i):
+                    timing = dict(forward=0.0, backward=0.0, start=time.perf_counter())
+                before = pos.detach().clone() if solver == "lbfgs" else None
+                recorded = pos.detach().clone() if recorder is not None and recorder.wants(i) else None
+                optimizer.step(closure)
+                loss = closure.loss
+                if before is not None and torch.equal(before, pos.detach()):
+                    # projected steps leave a curvature history without a descent direction, start over
+                    optimizer.state.clear()
+
+                with torch.no_grad():
+                    if solver != "adam":
+                        pos.copy_(self.project(pos))
+                    if frozen is not None:
+                        # Adam momentum would keep moving converged starts
+                        pos.copy_(torch.where(active[:, None, None], pos, frozen))
+
+                if timing is not None:
+                    instrument.on_step(self.step_record(i, timing, monitor.start_time, pos.detach(), loss, pos.grad))
+                    timing = None
+                if recorded is not None:
+                    recorder.record(i, recorded, loss, self.loss_terms(recorded) if recorder.wants_terms(i) else None)
+
+                if scene is not None:
+                    self.pos = pos.detach()[0]
+                    scene.show(self)
+
+                monitor.update(loss)
+                if monitor.should_check():
+                    if self.constraints == "lagrangian" and self.has_limits:
+                        # multipliers grow while a limit is exceeded, updated in place for the compiled loss
+                        with torch.no_grad():
+                            step = self.penalty_weight * self.limit_excess(pos)
+                            self.multipliers.copy_((self.multipliers + step).clip(0, None))
+                    conflicts = self.conflict_count(pos.detach())
+                    done = monitor.check(pos.detach(), conflicts, pos.grad)
+                    if progress is not None and time.perf_counter() - reported >= progress_interval:
+                        reported = time.perf_counter()
+                        progress(self.progress_frame(pos.detach(), loss, conflicts, monitor.steps))
+                    done = active & torch.from_numpy(done)
+                    frozen = pos.detach().clone() if frozen is None else frozen
+                    frozen[done] = pos.detach()[done]
+                    active &= ~done
+                    if not active.any():
+                        break
+        finally:
+            self.safe_dist, self.cutoff = safe_dist, cutoff
+            if instrument is not None:
+                instrument.close()
+            if recorder is not None:
+                recorder.close()
+
+        pos = pos.detach()
+        with torch.no_grad():
+            loss = self.get_all_loss(pos)
+        self.pos = torch.from_numpy(monitor.select(pos, loss, self.conflict_count(pos)))
+        if self.bbox.dim() > 3:
+            self.bbox = self.bbox[monitor.selected]
+        if self.multipliers is not None:
+            self.multipliers = self.multipliers[monitor.selected]
+
+        return PlacementResult(
+            steps=monitor.steps,
+            elapsed=monitor.elapsed(),
+            converged=not active.any() and not monitor.expired,
+            expired=monitor.expired,
+            overlaps=int(self.overlap_count()),
+            losses=self.get_loss_components(),
+            start=monitor.selected
+        )
 
-            prev_loss += [loss.item()]
-            prev_loss = prev_loss[-N_history:]
-            if len(prev_loss) > N_history and np.std(prev_loss) < stop_p * np.average(prev_loss):
-                break
+    def get_all_loss(self, pos=None):
+        # pos - (..., N, 3), leading dimensions are independent layouts, loss is (...)
+        pos = self.pos if pos is None else pos
+
+        if self.loss_mode == "fused":
+            loss = fused_loss(pos, self.mass, self.bbox, self.main_bbox, self.safe_dist)
+            return loss + self.limits_loss(pos) if self.has_limits else loss
+
+        if self.loss_mode == "compiled":
+            if self._compiled_loss is None:
+                self._compiled_loss = torch.compile(self.eager_loss)
+            try:
+                return self._compiled_loss(pos)
+            except Exception as e:
+                fused = self.collision == "dense" and not self.stacking and self.bbox.dim() == 3
+                self.loss_mode = "fused" if fused else "eager"
+                warnings.warn(f"torch.compile is unavailable, falling back to the {self.loss_mode} loss: {e}")
+                return self.get_all_loss(pos)
+
+        return self.eager_loss(pos)
+
+    @torch.no_grad()
+    def get_loss_components(self, pos=None) -> dict[str, float]:
+        # weighted terms of eager_loss, they sum up to the total loss
+        return {name: value.mean().item() for name, value in self.loss_terms(pos).items()}
+
+    @torch.no_grad()
+    def loss_terms(self, pos=None) -> dict[str, torch.Tensor]:
+        # weighted terms of eager_loss of every start (...)
+        pos = self.pos if pos is None else pos
+        terms = {
+            "collision": self.collision_loss(pos).mean(dim=-1),
+            "main_bbox": 10 * self.main_bbox_loss(pos).mean(dim=-1),
+            "axis": pos[..., 0].abs().mean(dim=-1),
+            "center_of_mass": 10 * self.center_of_mass(pos)[..., :self.com_axes].norm(dim=-1),
+        }
+        if self.stacking:
+            terms.update(
+                support=10 * self.support_loss(pos).mean(dim=-1),
+                gravity=self.bottom_height(pos).mean(dim=-1),
+            )
+        if self.has_limits:
+            terms.update(limits=self.limits_loss(pos))
+        return terms
+
+    @property
+    def loss_names(self) -> list[str]:
+        # keys of loss_terms
+        names = ["collision", "main_bbox", "axis", "center_of_mass"]
+        names += ["support", "gravity"] if self.stacking else []
+        return names + ["limits"] if self.has_limits else names
+
+    @torch.no_grad()
+    def step_record(self, step: int, timing: dict, start_time: float, pos, loss, grad) -> StepRecord:
+        # timing - forward and backward seconds of the step and the perf_counter it started at
+        total = time.perf_counter() - timing["start"]
+        return StepRecord(
+            step=step,
+            time=timing["start"] - start_time,
+            forward=timing["forward"],
+            backward=timing["backward"],
+            update=total - timing["forward"] - timing["backward"],
+            loss=loss.tolist(),
+            losses={name: value.tolist() for name, value in self.loss_terms(pos).items()},
+            grad_norm=grad.norm(dim=(-2, -1)).tolist(),
+            overlaps=self.overlap_count(pos).tolist(),
+        )
 
-        for param in params:
-            param.requires_grad = False
+    def progress_frame(self, pos, loss, conflicts, step: int) -> dict:
+        terms = {name: value.numpy() for name, value in self.loss_terms(pos).items()}
+        return progress_frame(pos.numpy(), self.bbox.numpy(), self.main_bbox.numpy(), loss.numpy(), conflicts, step,
+                              terms)
 
-    def get_all_loss(self):
+    def eager_loss(self, pos):
         loss = 0
 
         # collision
-        loss = loss + self.collision_loss()
+        loss = loss + self.collision_loss(pos)
 
         # collision with bounding overall box
-        loss = loss + 10 * self.main_bbox_loss()
+        loss = loss + 10 * self.main_bbox_loss(pos)
 
         # to stick every box to center axis
-        loss = loss + self.pos[:, 0].abs()
+        loss = loss + pos[..., 0].abs()
+
+        if self.stacking:
+            # every box rests on something and sinks as low as it can
+            loss = loss + 10 * self.support_loss(pos) + self.bottom_height(pos)
 
         # summarize loss over all boxes
-        loss = loss.mean()
+        loss = loss.mean(dim=-1)
 
         # stick center of mass to center of platform
-        loss = loss + 10 * self.center_of_mass().norm()
+        loss = loss + 10 * self.center_of_mass(pos)[..., :self.com_axes].norm(dim=-1)
 
-        return loss
+        # regulatory limits of the center of mass
+        if self.has_limits:
+            loss = loss + self.limits_loss(pos)
 
-    def shuffle(self):
-        pos = torch.randn(self.pos.shape) * torch.tensor([1, 1, 0])
-        pos *= self.main_bbox[1] / 2
-        pos += self.main_bbox[0]
-        self.pos[:] = pos
+        return loss
 
-    def get_abs_bbox(self):
-        return torch.stack([
-            self.pos + self.bbox[..., 0, :],
+    def shuffle(self, pos=None, mask=None):
+        pos = self.pos if pos is None else pos
+        shuffled = torch.randn(pos.shape, generator=self.generator) * torch.tensor([1, 1, 0])
+        shuffled *= self.main_bbox[1] / 2
+        shuffled += self.main_bbox[0]
+        if self.stacking:
+            # stacked layouts start with every box on the floor
+            shuffled[..., 2] = self.floor_height()
+        if mask is None:
+            pos[:] = shuffled
+        else:
+            mask = torch.as_tensor(mask, dtype=torch.bool)
+            pos[..., mask, :] = shuffled[..., mask, :]
+
+    def bounds(self) -> tuple[torch.Tensor, torch.Tensor]:
+        # (..., N, 3) lowest and highest positions with the box inside main_bbox
+        room = (self.main_bbox[1] - self.bbox[..., 1, :]) / 2
+        return self.main_bbox[0] - room - self.bbox[..., 0, :], self.main_bbox[0] + room - self.bbox[..., 0, :]
+
+    def project(self, pos=None) -> torch.Tensor:
+        # the closest positions with every box inside main_bbox, pinned boxes stay where they are
+        pos = self.pos if pos is None else pos
+        lo, hi = self.bounds()
+        projected = torch.maximum(torch.minimum(pos, hi), lo)
+        if self.pinned is not None:
+            projected = torch.where(self.pinned[:, None], pos, projected)
+        return projected
+
+    def get_abs_bbox(self, pos=None):
+        pos = self.pos if pos is None else pos
+        return torch.stack(torch.broadcast_tensors(
+            pos + self.bbox[..., 0, :],
             self.bbox[..., 1, :]
-        ], dim=-2)
+        ), dim=-2)
 
-    def get_box_dist(self) -> torch.Tensor:
-        bbox = self.get_abs_bbox()
+    @torch.no_grad()
+    def overlap_count(self, pos=None, tol=1e-3) -> np.ndarray:
+        bbox = self.get_abs_bbox(pos).numpy()
+        return overlap_count(bbox[..., 0, :], bbox[..., 1, :], self.main_bbox.numpy(), tol)
 
-        dist = torch.abs(bbox[None, :, 0, :] - bbox[:, None, 0, :]) - (bbox[None, :, 1, :] + bbox[:, None, 1, :]) / 2
+    @torch.no_grad()
+    def update_pairs(self, pos=None, skin=0.0):
+        bbox = self.get_abs_bbox(pos)
+        pairs = sweep_and_prune(bbox[..., 0, :].numpy(), bbox[..., 1, :].numpy(), self.cutoff + skin)
+        self.pairs = torch.from_numpy(pairs)
+
+    @staticmethod
+    def pair_dist(bbox_a, bbox_b) -> torch.Tensor:
+        dist = torch.abs(bbox_a[..., 0, :] - bbox_b[..., 0, :]) - (bbox_a[..., 1, :] + bbox_b[..., 1, :]) / 2
 
         dist_max = torch.max(dist, dim=-1).values
         dist_sum = dist.prod(dim=-1)
@@ -102,17 +414,106 @@ class Items:
         dist = dist_sum * ~mask + dist_far * mask
         return dist
 
-    def get_main_bbox_dist(self, main_bbox) -> torch.Tensor:
-        bbox = self.get_abs_bbox()
+    def get_box_dist(self, pos=None) -> torch.Tensor:
+        bbox = self.get_abs_bbox(pos)
+        return self.pair_dist(bbox[..., None, :, :, :], bbox[..., :, None, :, :])
+
+    def get_main_bbox_dist(self, main_bbox, pos=None) -> torch.Tensor:
+        bbox = self.get_abs_bbox(pos)
 
-        dist = torch.abs(main_bbox[None, 0, :] - bbox[:, 0, :]) - (main_bbox[None, 1, :] - bbox[:, 1, :]) / 2
+        dist = torch.abs(main_bbox[0] - bbox[..., 0, :]) - (main_bbox[1] - bbox[..., 1, :]) / 2
         dist = torch.max(dist, dim=-1).values
         dist = -dist
 
         return dist
 
-    def center_of_mass(self):
-        return (self.mass[:, None] * self.pos).sum(dim=0) / self.mass.sum()
+    @property
+    def com_axes(self) -> int:
+        # the center of mass is kept on the platform center, when stacking only on the floor,
+        # its height is limited by max_cg_height instead
+        return 2 if self.stacking else 3
+
+    def floor_height(self) -> torch.Tensor:
+        # (N,) z of the boxes standing on the floor
+        bbox = self.bbox.reshape(-1, *self.bbox.shape[-3:])[0]
+        return self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2 + bbox[:, 1, 2] / 2 - bbox[:, 0, 2]
+
+    def bottom_height(self, pos=None) -> torch.Tensor:
+        # (..., N) height of the bottom of every box above the floor
+        bbox = self.get_abs_bbox(pos)
+        return bbox[..., 0, 2] - bbox[..., 1, 2] / 2 - (self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2)
+
+    def contact(self, gap) -> torch.Tensor:
+        # 1 for a bottom lying exactly on a top, fading out over safe_dist
+        return torch.exp(-(gap / self.safe_dist).square())
+
+    def support_area(self, bbox_a, bbox_b) -> torch.Tensor:
+        # area of the bottom of a resting on the top of b
+        gap = (bbox_a[..., 0, 2] - bbox_a[..., 1, 2] / 2) - (bbox_b[..., 0, 2] + bbox_b[..., 1, 2] / 2)
+        size = torch.minimum(bbox_a[..., 1, :2], bbox_b[..., 1, :2])
+        overlap = (bbox_a[..., 1, :2] + bbox_b[..., 1, :2]) / 2 - torch.abs(bbox_a[..., 0, :2] - bbox_b[..., 0, :2])
+        overlap = torch.minimum(overlap, size).clip(0, None)
+        return self.contact(gap) * overlap.prod(dim=-1)
+
+    def support_loss(self, pos=None) -> torch.Tensor:
+        # (..., N) part of the bottom of every box below min_support that rests neither on the floor
+        # nor on boxes right beneath it
+        bbox = self.get_abs_bbox(pos)
+        if self.collision == "sweep":
+            if self.pairs is None:
+                self.update_pairs(pos)
+            i, j = self.pairs[:, 0], self.pairs[:, 1]
+            area = torch.zeros(bbox.shape[:-2])
+            area = area.index_add(-1, i, self.support_area(bbox[..., i, :, :], bbox[..., j, :, :]))
+            area = area.index_add(-1, j, self.support_area(bbox[..., j, :, :], bbox[..., i, :, :]))
+        else:
+            area = self.support_area(bbox[..., :, None, :, :], bbox[..., None, :, :, :])
+            area = area.masked_fill(torch.eye(area.shape[-1], dtype=torch.bool), 0).sum(dim=-1)
+        support = self.contact(self.bottom_height(pos)) + area / bbox[..., 1, :2].prod(dim=-1)
+        return (self.min_support - support).clip(0, None)
+
+    @property
+    def has_limits(self) -> bool:
+        return self.max_bias is not None or self.max_cg_height is not None
+
+    def limit_excess(self, pos=None) -> torch.Tensor:
+        # (..., K) how far the cargo is beyond every given limit (negative - within it), the way
+        # validation.formulas counts it: mass-weighted box centers along the length from the middle of the floor,
+        # and their height raised by half the box height
+        bbox = self.get_abs_bbox(pos)
+        weights = self.mass / self.mass.sum()
+        excess = []
+        if self.max_bias is not None:
+            bias = (weights * bbox[..., 0, 1]).sum(dim=-1) - self.main_bbox[0, 1]
+            excess.append(bias.abs() - self.max_bias)
+        if self.max_cg_height is not None:
+            floor = self.main_bbox[0, 2] - self.main_bbox[1, 2] / 2
+            height = (weights * (bbox[..., 0, 2] + bbox[..., 1, 2] / 2)).sum(dim=-1) - floor
+            excess.append(height - self.max_cg_height)
+        return torch.stack(excess, dim=-1)
+
+    def limits_loss(self, pos=None) -> torch.Tensor:
+        # (...) penalty of the limit excess, or the augmented Lagrangian term with the current multipliers
+        excess = self.limit_excess(pos)
+        if self.constraints == "lagrangian":
+            if self.multipliers is None:
+                self.multipliers = torch.zeros(excess.shape[-1])
+            rho, multipliers = self.penalty_weight, self.multipliers
+            term = rho / 2 * (excess + multipliers / rho).clip(0, None).square() - multipliers.square() / (2 * rho)
+            return term.sum(dim=-1)
+        return 10 * excess.clip(0, None).sum(dim=-1)
+
+    @torch.no_grad()
+    def conflict_count(self, pos=None, tol=1e-3) -> np.ndarray:
+        # overlap_count plus the limits the layout is beyond, what the monitor treats as infeasible
+        count = self.overlap_count(pos, tol)
+        if self.has_limits:
+            count = count + (self.limit_excess(pos) > tol).sum(dim=-1).numpy()
+        return count
+
+    def center_of_mass(self, pos=None):
+        pos = self.pos if pos is None else pos
+        return (self.mass[:, None] * pos).sum(dim=-2) / self.mass.sum()
 
     @staticmethod
     def safe_exp_loss(x, x0, p1=1):
@@ -122,13 +523,32 @@ class Items:
                 ((x / x0) - p1).clip(0, None).square() / 2
         )
 
-    def collision_loss(self) -> torch.Tensor:
-        box_dist = self.get_box_dist()
+    def collision_loss(self, pos=None) -> torch.Tensor:
+        if self.collision == "sweep":
+            return self.sparse_collision_loss(pos)
+        if self.collision == "tiled":
+            return tiled_collision_loss(self.pos if pos is None else pos, self.bbox, self.safe_dist, self.tile)
+
+        box_dist = self.get_box_dist(pos)
         loss = self.safe_exp_loss(-box_dist, self.safe_dist)
         loss = loss.sum(dim=-1)
         return loss
 
-    def main_bbox_loss(self):
-        box_dist = self.get_main_bbox_dist(self.main_bbox)
+    def sparse_collision_loss(self, pos=None) -> torch.Tensor:
+        if self.pairs is None:
+            self.update_pairs(pos)
+        bbox = self.get_abs_bbox(pos)
+        i, j = self.pairs[:, 0], self.pairs[:, 1]
+
+        # diagonal of the dense matrix, constant w.r.t. positions but kept so both paths give the same loss
+        loss = self.safe_exp_loss(-self.pair_dist(bbox, bbox), self.safe_dist)
+
+        # distance is symmetric, so every unordered pair is added to both of its boxes
+        pair_loss = self.safe_exp_loss(-self.pair_dist(bbox[..., i, :, :], bbox[..., j, :, :]), self.safe_dist)
+        loss = loss.index_add(-1, i, pair_loss).index_add(-1, j, pair_loss)
+        return loss
+
+    def main_bbox_loss(self, pos=None):
+        box_dist = self.get_main_bbox_dist(self.main_bbox, pos)
         loss = self.safe_exp_loss(-box_dist, self.safe_dist)
         return loss
@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+
+
+def progress_frame(pos, bbox, main_bbox, loss, conflicts, step: int, terms: dict) -> dict:
+    # the best start so far (fewest conflicts, then the lowest loss) for a progress callback of optimize:
+    # pos (starts, N, 3), bbox (N, 2, 3) or (starts, N, 2, 3), loss (starts,), conflicts (starts,),
+    # terms - weighted loss terms (starts,) of the solver
+    # boxes are [length, width, size along the length, size across] of every box in whole mm, the length from
+    # the start of the floor, the width from its axis
+    k = int(np.lexsort((np.asarray(loss, dtype=np.float64), np.asarray(conflicts)))[0])
+    bbox = np.asarray(bbox)
+    bbox = bbox[k] if bbox.ndim > 3 else bbox
+    center = (np.asarray(pos[k]) + bbox[:, 0]) * 1000
+    start = (main_bbox[0][1] - main_bbox[1][1] / 2) * 1000
+    boxes = np.stack([center[:, 1] - start, center[:, 0], bbox[:, 1, 1] * 1000, bbox[:, 1, 0] * 1000], axis=-1)
+    return {
+        "step": step,
+        "start": k,
+        "loss": float(loss[k]),
+        "overlaps": int(conflicts[k]),
+        "losses": {name: float(value[k]) for name, value in terms.items()},
+        "boxes": np.rint(boxes).astype(np.int64).tolist(),
+    }
+
+
+class ProgressChannel:
+    # hands progress frames from the optimizer to a slower consumer (a database writer, a stream) keeping only
+    # the latest one: publish never blocks the optimizer, frames nobody took in time are counted in dropped
+    # channel.publish is the progress callback of optimize, get() waits for a frame newer than the last taken
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.dropped = 0
+        self.closed = False
+
+    def publish(self, frame: dict):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.condition.notify_all()
+
+    def get(self, timeout: float = None) -> dict | None:
+        # the latest frame, None when the channel is closed (or the timeout passed) without a new one
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None or self.closed, timeout)
+            frame, self.frame = self.frame, None
+            return frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
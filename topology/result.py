@@ -0,0 +1,18 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PlacementResult:
+    steps: int  # optimizer steps run
+    elapsed: float  # seconds of the whole calculate_optimal_placement call (of the optimizer for optimize itself)
+    converged: bool  # stopped by the convergence criteria, not by max_steps or the deadline
+    expired: bool  # the time budget ran out
+    overlaps: int  # overlapping pairs plus boxes outside the floor in the returned layout
+    losses: dict[str, float] = field(default_factory=dict)  # loss terms of the returned layout
+    start: int = 0  # index of the start the returned layout comes from
+    within_limits: bool = True  # the stored layout passes the center of mass checks of validation.formulas
+    cached: bool = False  # the layout comes from a PlacementCache, the other fields are of the original solve
+
+    @property
+    def has_overlap(self) -> bool:
+        return self.overlaps > 0
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def rotate_bbox(bbox: np.ndarray, turn: np.ndarray) -> np.ndarray:
+    # bbox - (N, 2, 3) in the Items frame, turn - (..., N) pieces to turn by 90° on the floor
+    # returns (..., N, 2, 3) with the floor sizes swapped and the center offsets turned for the marked pieces
+    bbox = np.asarray(bbox)
+    turned = bbox.copy()
+    turned[:, 0, :2] = np.stack([-bbox[:, 0, 1], bbox[:, 0, 0]], axis=-1)
+    turned[:, 1, :2] = bbox[:, 1, [1, 0]]
+    return np.where(np.asarray(turn, dtype=bool)[..., None, None], turned, bbox)
+
+
+def orientation_candidates(bbox: np.ndarray, main_bbox: np.ndarray, count: int, fixed: np.ndarray = None,
+                           seed: int = None) -> np.ndarray:
+    # (count, N) sets of pieces to turn, evaluated at once as starts of one optimize:
+    # nothing turned, every long side along the carriage, every long side across it, then random sets;
+    # fixed pieces and pieces whose length would not fit across the floor are never turned
+    size = np.asarray(bbox)[:, 1]
+    can_turn = size[:, 1] <= main_bbox[1][0]
+    if fixed is not None:
+        can_turn &= ~np.asarray(fixed, dtype=bool)
+
+    rng = np.random.default_rng(seed)
+    candidates = np.stack([
+        np.zeros(len(size), dtype=bool),
+        size[:, 0] > size[:, 1],
+        size[:, 1] > size[:, 0],
+        *(rng.random(len(size)) < 0.5 for _ in range(max(count - 3, 0)))
+    ])[:count]
+    return candidates & can_turn
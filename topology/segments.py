@@ -0,0 +1,158 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import current_process, get_context
+
+import numpy as np
+
+from topology.convert import get_items_class
+from topology.monitor import ConvergenceMonitor
+from topology.options import PlacementOptions
+
+PIECES_PER_SEGMENT = 50
+MIN_SEGMENT_STEPS = 100
+DEADLINE_SHARE = 0.75  # of the deadline of calculate_optimal_placement for the segments, the rest polishes
+
+_executors = {}
+
+
+def segment_count(bbox: np.ndarray, main_bbox: np.ndarray, per_segment: int = PIECES_PER_SEGMENT) -> int:
+    # about per_segment pieces in every segment, but no segment shorter than the longest piece
+    longest = bbox[:, 1, 1].max(initial=0)
+    fit = int(main_bbox[1][1] // longest) if longest > 0 else len(bbox)
+    return max(1, min(-(-len(bbox) // per_segment), fit))
+
+
+def segment_bboxes(main_bbox: np.ndarray, count: int) -> np.ndarray:
+    # (count, 2, 3) main_bbox cut across its length into count equal segments, from the start of the floor
+    length = main_bbox[1][1] / count
+    start = main_bbox[0][1] - main_bbox[1][1] / 2
+    segments = np.repeat(np.asarray(main_bbox, dtype=np.float64)[None], count, axis=0)
+    segments[:, 0, 1] = start + length * (np.arange(count) + 0.5)
+    segments[:, 1, 1] = length
+    return segments
+
+
+def assign_segments(masses: np.ndarray, bbox: np.ndarray, main_bbox: np.ndarray, count: int,
+                    pos: np.ndarray = None, placed: np.ndarray = None) -> np.ndarray:
+    # (N,) segment of every piece: placed pieces stay in the segment their center is in, the others go one by one,
+    # the largest share of the total mass or floor area first, to the segment with the smallest share afterwards;
+    # segments of equal mass keep the center of mass of the whole load in the middle of the floor
+    masses = np.asarray(masses, dtype=np.float64)
+    area = bbox[:, 1, 0] * bbox[:, 1, 1]
+    mass_share = masses / max(masses.sum(), 1e-9)
+    area_share = area / max(area.sum(), 1e-9)
+    segment = np.full(len(masses), -1)
+    mass_load, area_load = np.zeros(count), np.zeros(count)
+
+    if placed is not None and placed.any():
+        length = main_bbox[1][1] / count
+        start = main_bbox[0][1] - main_bbox[1][1] / 2
+        centers = pos[placed, 1] + bbox[placed, 0, 1]
+        segment[placed] = np.clip((centers - start) // length, 0, count - 1).astype(int)
+        np.add.at(mass_load, segment[placed], mass_share[placed])
+        np.add.at(area_load, segment[placed], area_share[placed])
+
+    for i in np.argsort(-np.maximum(mass_share, area_share), kind="stable"):
+        if segment[i] >= 0:
+            continue
+        k = np.maximum(mass_load + mass_share[i], area_load + area_share[i]).argmin()
+        segment[i] = k
+        mass_load[k] += mass_share[i]
+        area_load[k] += area_share[i]
+    return segment
+
+
+def segment_steps(max_steps: int, pieces: int, total: int) -> int:
+    # the boxes of a segment travel over its part of the floor only, the soft overlap penalty leaves touching
+    # boxes that never count as feasible, so a segment gets its share of the pieces of max_steps
+    return min(max_steps, max(MIN_SEGMENT_STEPS, -(-max_steps * pieces // max(total, 1))))
+
+
+def _init_worker(backend, threads):
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    import topology.process  # noqa: F401
+
+
+def segment_executor(backend: str, workers: int) -> ProcessPoolExecutor:
+    # spawned workers live as long as this process, later orders do not import torch in them again
+    key = backend, workers
+    if key not in _executors:
+        from topology.pool import worker_threads
+
+        _executors[key] = ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                              initargs=(backend, worker_threads(workers)))
+    return _executors[key]
+
+
+def _solve_segment(backend, masses, bbox, main_bbox, options, optimize_options):
+    items = get_items_class(backend)(masses, bbox, main_bbox, **options)
+    result = items.optimize(**optimize_options)
+    return np.array(items.pos), result.steps
+
+
+def solve_segments(masses: np.ndarray, bbox: np.ndarray, main_bbox: np.ndarray, segment: np.ndarray,
+                   options: PlacementOptions = None, item_options: dict = None, workers: int = None,
+                   deadline: float = None, monitor: ConvergenceMonitor = None,
+                   shuffle: bool | np.ndarray = True) -> tuple[np.ndarray, int]:
+    # optimizes the pieces of every segment inside its part of main_bbox, on a pool of workers processes
+    # (os.cpu_count() by default, 1 - one after another in this process), kept for the next call, with the backend,
+    # starts, solver and anneal of options; item_options go to the Items of every segment, per-piece pos and
+    # pinned are split between them
+    # a segment runs up to segment_steps of options.max_steps, or its share of deadline seconds (then of 1000
+    # steps at most): the segments are solved in rounds of workers, every round gets the same time
+    # returns (N, 3) positions and the largest number of steps a segment took
+    options = PlacementOptions() if options is None else options
+    item_options = {} if item_options is None else item_options
+    backend = options.backend
+    max_steps = 1000 if deadline is not None or options.max_steps is None else options.max_steps
+    monitor = ConvergenceMonitor(stop_on_feasible=True) if monitor is None else monitor
+    if current_process().daemon:
+        # a daemonic process (a SolverPool worker) cannot start processes of its own
+        workers = 1
+    segments = segment_bboxes(main_bbox, segment.max(initial=0) + 1)
+    count = len(np.unique(segment))
+    workers = min(os.cpu_count() or 1, count) if workers is None else workers
+    if deadline is not None:
+        monitor = copy.copy(monitor)
+        monitor.time_budget = deadline / max(-(-count // max(workers, 1)), 1)
+    tasks, solved_segments = [], []
+    for k, segment_bbox in enumerate(segments):
+        members = segment == k
+        if not members.any():
+            continue
+        solved_segments.append(k)
+        segment_options = {
+            name: value[members] if name in ("pos", "pinned") and value is not None else value
+            for name, value in item_options.items()
+        }
+        # the center of mass term of Items pulls to the origin, every segment is solved around its own middle
+        segment_bbox = segment_bbox.copy()
+        offset, segment_bbox[0, 1] = segment_bbox[0, 1], 0
+        if segment_options.get("pos") is not None:
+            segment_options["pos"] = segment_options["pos"] - np.array([0, offset, 0], dtype=np.float32)
+        tasks.append((backend, masses[members], bbox[members], segment_bbox, segment_options,
+                      dict(shuffle=shuffle if isinstance(shuffle, bool) else np.asarray(shuffle)[members],
+                           starts=options.starts, solver=options.solver, anneal=options.anneal, monitor=monitor,
+                           max_steps=segment_steps(max_steps, members.sum(), len(masses)))))
+
+    if workers > 1:
+        # spawned workers do not inherit the torch thread pool of this process
+        try:
+            solved = list(segment_executor(backend, workers).map(_solve_segment, *zip(*tasks)))
+        except BrokenProcessPool:
+            # a worker died, the next call starts new ones
+            _executors.pop((backend, workers)).shutdown(wait=False)
+            raise
+    else:
+        solved = [_solve_segment(*task) for task in tasks]
+
+    pos = np.zeros((len(masses), 3), dtype=np.float32)
+    for k, (segment_pos, _) in zip(solved_segments, solved):
+        pos[segment == k] = segment_pos + np.array([0, segments[k, 0, 1], 0], dtype=np.float32)
+    return pos, max((steps for _, steps in solved), default=0)
@@ -0,0 +1,104 @@
+from dataclasses import replace
+
+import numpy as np
+
+from topology.convert import piece_amounts, piece_dimensions, piece_weights
+from topology.main import calculate_optimal_placement
+from topology.options import PlacementOptions, split_options
+from topology.result import PlacementResult
+from validation.models import Carriage, Box
+
+KNAPSACK_UNITS = 4000  # resolution of the capacity in the dynamic programming table
+
+
+def knapsack(values: np.ndarray, sizes: np.ndarray, capacity: float, units: int = KNAPSACK_UNITS) -> np.ndarray:
+    # (N,) mask of the items of the largest total value with sizes summing up to no more than capacity,
+    # 0/1 knapsack by dynamic programming over capacity cut into units steps, sizes rounded up to a whole step
+    n = len(values)
+    if n == 0 or capacity <= 0:
+        return np.zeros(n, dtype=bool)
+    steps = np.ceil(np.asarray(sizes) / capacity * units).astype(np.int64)
+    best = np.zeros(units + 1)
+    take = np.zeros((n, units + 1), dtype=bool)
+    for i in range(n):
+        if steps[i] > units:
+            continue
+        candidate = np.full(units + 1, -np.inf)
+        candidate[steps[i]:] = best[:units + 1 - steps[i]] + values[i]
+        take[i] = candidate > best
+        best = np.maximum(best, candidate)
+
+    chosen = np.zeros(n, dtype=bool)
+    left = units
+    for i in range(n - 1, -1, -1):
+        if take[i, left]:
+            chosen[i] = True
+            left -= steps[i]
+    return chosen
+
+
+def preselect(platform: Carriage, boxes: list[Box], objective: str = "mass", fill: float = 0.85,
+              max_weight: float = None, stacking: bool = False, max_height: float = None) -> np.ndarray:
+    # (len(boxes),) number of pieces of every shipment to load: the most mass (or volume) whose footprint
+    # takes at most fill of the floor (of the floor times max_height when stacking) and whose weight is at most
+    # max_weight tons; pieces that do not fit the floor or the height on their own are never loaded
+    dimensions = piece_dimensions(boxes).astype(np.float64)
+    weights = piece_weights(boxes)
+    shipment = np.repeat(np.arange(len(boxes)), piece_amounts(boxes))
+    values = {"mass": weights, "volume": dimensions.prod(axis=-1) / 1e9}[objective]
+
+    fits = np.minimum(dimensions[:, 0], dimensions[:, 1]) <= platform.floor_width
+    fits &= np.maximum(dimensions[:, 0], dimensions[:, 1]) <= platform.floor_length
+    area = dimensions[:, 0] * dimensions[:, 1] / 1e6
+    capacity = fill * platform.floor_length * platform.floor_width / 1e6
+    if stacking and max_height is not None:
+        fits &= dimensions[:, 2] <= max_height
+        area, capacity = area * dimensions[:, 2] / 1000, capacity * max_height / 1000
+
+    chosen = np.zeros(len(weights), dtype=bool)
+    chosen[fits] = knapsack(values[fits], area[fits], capacity)
+    if max_weight is not None:
+        # the floor is filled first, the pieces bringing the least value for their footprint are left out
+        for i in np.argsort(values / np.maximum(area, 1e-9), kind="stable"):
+            if weights[chosen].sum() <= max_weight:
+                break
+            chosen[i] = False
+    return np.bincount(shipment[chosen], minlength=len(boxes))
+
+
+def split_boxes(boxes: list[Box], counts: np.ndarray) -> tuple[list[Box], list[Box]]:
+    # shipments cut into the loaded first counts pieces and the unloaded rest (without a position);
+    # a shipment loaded in full is the box itself, so its coordinates are filled in place
+    loaded, unloaded = [], []
+    for box, count in zip(boxes, counts):
+        if count == box.amount:
+            loaded.append(box)
+            continue
+        if count > 0:
+            loaded.append(replace(box, amount=int(count), pieces=box.pieces[:count],
+                                  pieces_rotated=box.pieces_rotated[:count]))
+        unloaded.append(replace(box, amount=int(box.amount - count), coords_of_cg=(0, 0, 0), rotated=False,
+                                pieces=(), pieces_rotated=()))
+    return loaded, unloaded
+
+
+def select_and_place(platform: Carriage, boxes: list[Box], objective: str = "mass", fill: float = 0.85,
+                     shrink: float = 0.9, max_rounds: int = 5, max_weight: float = None,
+                     options: PlacementOptions = None, **kwargs) -> tuple[list[Box], list[Box], PlacementResult]:
+    # loads as much of the order as fits: preselect picks the shipments for fill of the floor, they are placed by
+    # calculate_optimal_placement (options, kwargs), and while the layout has overlaps or breaks the center of mass
+    # limits the fill is lowered by shrink, up to max_rounds times
+    # returns the loaded boxes (placed), the unloaded remainder and the result of the last placement (an empty one
+    # when nothing fits the carriage)
+    options, kwargs = split_options(options, kwargs)
+    for _ in range(max_rounds):
+        counts = preselect(platform, boxes, objective, fill, max_weight, options.stacking, options.max_height)
+        loaded, unloaded = split_boxes(boxes, counts)
+        if not loaded:
+            # a lower fill does not load anything either
+            return loaded, unloaded, PlacementResult(steps=0, elapsed=0.0, converged=False, expired=False, overlaps=0)
+        result = calculate_optimal_placement(platform, loaded, options, **kwargs)
+        if not result.has_overlap and (result.within_limits or options.constraints is None):
+            break
+        fill *= shrink
+    return loaded, unloaded, result
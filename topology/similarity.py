@@ -0,0 +1,155 @@
+import heapq
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from topology.convert import piece_dimensions, piece_weights, read_piece_coords
+from validation.models import Carriage, Box
+
+try:
+    import fcntl
+except ImportError:  # Windows, the file is not locked
+    fcntl = None
+
+QUANTILES = np.linspace(0, 1, 9)
+
+
+def box_rows(boxes: list[Box]) -> np.ndarray:
+    # (N, 4) length, width, height in metres and weight in tons of every piece
+    return np.concatenate([piece_dimensions(boxes) / 1000, piece_weights(boxes)[:, None]], axis=-1)
+
+
+def carriage_key(platform: Carriage) -> str:
+    # orders are only compared with orders on a carriage with the same floor
+    return f"{platform.floor_length}x{platform.floor_width}"
+
+
+def order_signature(boxes: list[Box]) -> np.ndarray:
+    # fixed length vector of an order with any number of boxes: count, total weight and footprint,
+    # and quantiles of the sorted box dimensions and weights
+    rows = box_rows(boxes)
+    footprint = rows[:, 0] * rows[:, 1]
+    return np.concatenate([
+        [np.log1p(len(rows)), rows[:, 3].sum(), footprint.sum()],
+        np.quantile(rows, QUANTILES, axis=0).ravel(),
+    ])
+
+
+def match_boxes(rows: np.ndarray, past_rows: np.ndarray, max_box_distance: float) -> np.ndarray:
+    # greedy one-to-one matching of boxes to the most similar past boxes, the closest pairs first;
+    # returns (N,) index of the matched past box or -1
+    cost = np.abs(rows[:, None] - past_rows[None]).sum(axis=-1)
+    match = np.full(len(rows), -1)
+    if not cost.size:
+        return match
+    # the past boxes of every box, closest first; a heap holds the closest past box of every box that was not
+    # taken when it was pushed, the pair popped is the closest of all the pairs left (ties by box, then past
+    # box, like the order of the flat cost matrix), a box whose past box was taken in the meantime is pushed
+    # again with the next free one
+    order = np.argsort(cost, axis=1, kind="stable")
+    cost = np.take_along_axis(cost, order, axis=1)
+    taken = np.zeros(len(past_rows), dtype=bool)
+    heap = [(cost[i, 0], i, order[i, 0]) for i in np.flatnonzero(cost[:, 0] <= max_box_distance)]
+    heapq.heapify(heap)
+    left = len(past_rows)
+    while heap and left:
+        _, i, j = heapq.heappop(heap)
+        if not taken[j]:
+            match[i] = j
+            taken[j] = True
+            left -= 1
+            continue
+        k = np.argmin(taken[order[i]])
+        if cost[i, k] <= max_box_distance:
+            heapq.heappush(heap, (cost[i, k], i, order[i, k]))
+    return match
+
+
+class PlacementIndex:
+    # solved orders by carriage and order_signature, a new order is started from the layout of the nearest one;
+    # kept in a JSON file at path (if given), only the last max_entries orders are remembered; several processes
+    # may share the file: add() merges into what is on disk under a lock on path.lock, and the entries are read
+    # again whenever the file changed
+    #   max_distance - signature distance up to which a past order counts as similar
+    #   max_box_distance - sum of dimension (m) and weight (t) differences up to which two boxes are matched
+
+    def __init__(self, path: str | os.PathLike = None, max_entries: int = 1000, max_distance: float = 1.0,
+                 max_box_distance: float = 0.1):
+        self.path = None if path is None else Path(path)
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_box_distance = max_box_distance
+        self.entries = []
+        self.mtime = None
+        self.reload()
+
+    def reload(self):
+        # the entries of the file, if another process changed it since it was read
+        if self.path is None or not self.path.exists():
+            return
+        mtime = self.path.stat().st_mtime_ns
+        if mtime != self.mtime:
+            self.entries, self.mtime = json.loads(self.path.read_text()), mtime
+
+    @contextmanager
+    def locked(self):
+        with open(self.path.with_suffix(".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def add(self, platform: Carriage, boxes: list[Box]):
+        entry = {
+            "carriage": carriage_key(platform),
+            "signature": order_signature(boxes).tolist(),
+            "boxes": box_rows(boxes).tolist(),
+            "coords": read_piece_coords(boxes).tolist(),
+        }
+        if self.path is None:
+            self.entries.append(entry)
+            del self.entries[:-self.max_entries]
+            return
+        with self.locked():
+            # the orders other processes added since this one read the file are kept
+            self.reload()
+            self.entries.append(entry)
+            del self.entries[:-self.max_entries]
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self.entries))
+            os.replace(tmp, self.path)
+            self.mtime = self.path.stat().st_mtime_ns
+
+    def nearest(self, platform: Carriage, boxes: list[Box]) -> dict | None:
+        self.reload()
+        key = carriage_key(platform)
+        entries = [entry for entry in self.entries if entry["carriage"] == key]
+        if not entries:
+            return None
+        signatures = np.array([entry["signature"] for entry in entries])
+        distance = np.linalg.norm(signatures - order_signature(boxes), axis=-1)
+        k = distance.argmin()
+        return entries[k] if distance[k] <= self.max_distance else None
+
+    def nearest_only(self, platform: Carriage, boxes: list[Box]) -> "PlacementIndex":
+        # in-memory index with just the nearest entry, enough to warm start the order in another process
+        nearest = PlacementIndex(max_entries=self.max_entries, max_distance=self.max_distance,
+                                 max_box_distance=self.max_box_distance)
+        entry = self.nearest(platform, boxes)
+        nearest.entries = [] if entry is None else [entry]
+        return nearest
+
+    def warm_start(self, platform: Carriage, boxes: list[Box]) -> tuple[np.ndarray, np.ndarray]:
+        # (N, 3) coords_of_cg of every piece taken from the matched pieces of the nearest past order
+        # and (N,) mask of matched pieces
+        rows = box_rows(boxes)
+        coords = np.zeros((len(rows), 3))
+        entry = self.nearest(platform, boxes)
+        if entry is None:
+            return coords, np.zeros(len(rows), dtype=bool)
+        match = match_boxes(rows, np.array(entry["boxes"]), self.max_box_distance)
+        matched = match >= 0
+        coords[matched] = np.array(entry["coords"])[match[matched]]
+        return coords, matched
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+from dataclasses import asdict
+
+import numpy as np
+
+MAGIC = b"TOPOTRAJ"
+ALIGNMENT = 64  # frames start at a multiple of it
+
+
+def frame_dtype(dtype: str, starts: int, n: int, terms: int) -> np.dtype:
+    # one optimizer step: positions of every start before the step, its loss and the weighted loss terms
+    # (NaN at the steps the terms are not recorded)
+    return np.dtype([
+        ("step", "<i4"),
+        ("loss", "<f4", (starts,)),
+        ("losses", "<f4", (starts, terms)),
+        ("pos", np.dtype(dtype).newbyteorder("<"), (starts, n, 3)),
+    ])
+
+
+class TrajectoryRecorder:
+    # writes the steps of optimize(..., recorder=...) to path: MAGIC, the length of the JSON header (uint32),
+    # the header (the arrays of the items, the carriage and the boxes when calculate_optimal_placement describes
+    # them), then fixed-size frames appended as they come, so the file is memory-mapped by Trajectory and a
+    # killed run keeps its steps
+    # dtype - "float16" (millimetre precision over a 13 m floor is about 4 mm) or "float32" of the positions,
+    # every - steps between frames, terms_every - steps between the loss terms, they cost one loss evaluation
+
+    def __init__(self, path, dtype: str = "float16", every: int = 1, terms_every: int = 20):
+        self.path = path
+        self.dtype = dtype
+        self.every = every
+        self.terms_every = terms_every
+        self.metadata = {}
+        self.file = None
+        self.frame = None
+        self.terms = None
+
+    def describe(self, **metadata):
+        # extra JSON fields of the header, calculate_optimal_placement adds the carriage and the boxes
+        self.metadata.update(metadata)
+
+    def begin(self, items, starts: int, terms: list[str]):
+        # called by optimize before the first step
+        header = dict(self.metadata, version=1, dtype=self.dtype, starts=starts, n=len(items.mass), terms=terms,
+                      mass=np.asarray(items.mass).tolist(), bbox=np.asarray(items.bbox).tolist(),
+                      main_bbox=np.asarray(items.main_bbox).tolist(), stacking=bool(items.stacking))
+        header = json.dumps(header, default=lambda value: value.tolist()).encode()
+        offset = len(MAGIC) + 4 + len(header)
+        header += b" " * (-offset % ALIGNMENT)
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC + np.uint32(len(header)).tobytes() + header)
+        self.frame = np.zeros(1, frame_dtype(self.dtype, starts, len(items.mass), len(terms)))
+        self.terms = terms
+
+    def wants(self, step: int) -> bool:
+        return step % self.every == 0
+
+    def wants_terms(self, step: int) -> bool:
+        return step % self.terms_every == 0
+
+    def record(self, step: int, pos, loss, terms: dict = None):
+        # pos (starts, N, 3) before the step and its loss (starts,), terms - weighted loss terms (starts,) or None
+        frame = self.frame[0]
+        frame["step"] = step
+        frame["loss"] = np.asarray(loss)
+        frame["losses"] = np.nan if terms is None else np.stack([np.asarray(terms[name]) for name in self.terms], -1)
+        frame["pos"] = np.asarray(pos)
+        self.file.write(self.frame.tobytes())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class Trajectory:
+    # a file written by TrajectoryRecorder, frames are memory-mapped and read on access
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a trajectory file")
+            length = int(np.frombuffer(file.read(4), dtype=np.uint32)[0])
+            self.header = json.loads(file.read(length))
+        offset = len(MAGIC) + 4 + length
+        dtype = frame_dtype(self.header["dtype"], self.header["starts"], self.header["n"], len(self.header["terms"]))
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        self.frames = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        self.mass = np.array(self.header["mass"], dtype=np.float32)
+        self.bbox = np.array(self.header["bbox"], dtype=np.float32)
+        self.main_bbox = np.array(self.header["main_bbox"], dtype=np.float32)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def losses(self, k: int) -> dict[str, np.ndarray]:
+        # weighted loss terms of every start at frame k, NaN when they were not recorded
+        values = self.frames[k]["losses"]
+        return {name: values[:, t].copy() for t, name in enumerate(self.header["terms"])}
+
+    def items(self, k: int, start: int = 0):
+        # NumpyItems with the positions of the start at frame k
+        from topology.numpy_backend import NumpyItems
+
+        bbox = self.bbox[start] if self.bbox.ndim > 3 else self.bbox
+        return NumpyItems(self.mass, bbox, self.main_bbox, pos=self.frames[k]["pos"][start].astype(np.float32),
+                          stacking=self.header["stacking"])
+
+
+def replay(path, scene: "Scene" = None, start: int = 0, every: int = 1):
+    # shows the recorded steps of the start through topology.display.Scene, without solving anything again
+    if scene is None:
+        from topology.display import Scene
+        scene = Scene(np.array([1000, 1000]), np.array([[0, 0], [20, 20]]))
+    trajectory = Trajectory(path)
+    for k in range(0, len(trajectory), every):
+        scene.show(trajectory.items(k, start))
+
+
+def frame_svg(trajectory: Trajectory, k: int, start: int = 0, scale: float = 60.0) -> str:
+    # top view of the floor at frame k, the length to the right and the width down, scale pixels per metre
+    items = trajectory.items(k, start)
+    bbox = items.get_abs_bbox()
+    main_bbox = trajectory.main_bbox
+    origin = main_bbox[0, :2] - main_bbox[1, :2] / 2
+    width, height = main_bbox[1, 1] * scale, main_bbox[1, 0] * scale
+    frame = trajectory.frames[k]
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height + 20:.0f}">',
+        f'<rect x="0" y="0" width="{width:.1f}" height="{height:.1f}" fill="none" stroke="#6c757d"/>',
+    ]
+    for center, size in bbox[..., :2]:
+        x, y = (center[1] - size[1] / 2 - origin[1]) * scale, (center[0] - size[0] / 2 - origin[0]) * scale
+        lines.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{size[1] * scale:.1f}" height="{size[0] * scale:.1f}" '
+                     f'fill="#198754" fill-opacity="0.4" stroke="#198754"/>')
+    lines.append(f'<text x="2" y="{height + 15:.0f}" font-size="12">step {frame["step"]}, '
+                 f'loss {frame["loss"][start]:.4f}, overlaps {int(items.overlap_count())}</text>')
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+def write_svg_frames(path, directory, start: int = 0, every: int = 1) -> list[str]:
+    # every every-th frame of the trajectory as directory/step_000000.svg
+    trajectory = Trajectory(path)
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for k in range(0, len(trajectory), every):
+        name = os.path.join(directory, f"step_{trajectory.frames[k]['step']:06d}.svg")
+        with open(name, "w") as file:
+            file.write(frame_svg(trajectory, k, start))
+        written.append(name)
+    return written
+
+
+def describe_placement(platform: "Carriage", boxes: list["Box"]) -> dict:
+    return dict(carriage=asdict(platform), boxes=[asdict(box) for box in boxes])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replays a trajectory recorded by TrajectoryRecorder")
+    parser.add_argument("path")
+    parser.add_argument("--svg", help="directory to write SVG frames to instead of showing them")
+    parser.add_argument("--start", type=int, default=0, help="start of a multi-start run to replay")
+    parser.add_argument("--every", type=int, default=1, help="frames between the replayed ones")
+    args = parser.parse_args()
+    if args.svg:
+        print(f"{len(write_svg_frames(args.path, args.svg, args.start, args.every))} frames written to {args.svg}")
+    else:
+        replay(args.path, start=args.start, every=args.every)
+
+
+if __name__ == '__main__':
+    main()
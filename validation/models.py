@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 
 
 @dataclass
@@ -11,6 +11,18 @@ class Box(Shipment):
     dimensions: tuple[int, int, int]  # in millimeters
     weight: float  # in tons
     coords_of_cg: tuple[int, int, int] = (0, 0, 0)  # in millimeters. Coords of C.G. относительно торцевого борта
+    amount: int = 1  # identical pieces of the same shipment
+    # coords of every piece when amount > 1, coords_of_cg is the first one
+    pieces: tuple[tuple[int, int, int], ...] = field(default=(), repr=False)
+    rotated: bool = False  # turned by 90° on the floor, the length goes across the carriage
+    pieces_rotated: tuple[bool, ...] = field(default=(), repr=False)  # rotated of every piece when amount > 1
+
+    @property
+    def floor_dimensions(self) -> tuple[int, int, int]:
+        # dimensions along the carriage length, across it and in height
+        if self.rotated:
+            return self.dimensions[1], self.dimensions[0], self.dimensions[2]
+        return self.dimensions
 
     @property
     def h_of_cg(self):
@@ -38,6 +50,24 @@ class Carriage:
     s_side_surface_meters: float
 
 
+def expand_pieces(boxes: list[Box]) -> list[Box]:
+    # one box per piece, for the drawing and the formulas which know nothing about amounts
+    expanded = []
+    for box in boxes:
+        if box.amount == 1:
+            expanded.append(box)
+            continue
+        pieces = (box.pieces or (box.coords_of_cg,))[:box.amount]
+        pieces += ((0, 0, 0),) * (box.amount - len(pieces))
+        rotated = (box.pieces_rotated or (box.rotated,))[:box.amount]
+        rotated += (False,) * (box.amount - len(rotated))
+        expanded += [
+            replace(box, coords_of_cg=coords, rotated=turned, amount=1, pieces=(), pieces_rotated=())
+            for coords, turned in zip(pieces, rotated)
+        ]
+    return expanded
+
+
 platform = Carriage(floor_length=13300, floor_width=2870, weight=21, height_from_rails=1310,
                     cg_height_from_rails=800, base_length=9720, length_to_cg=6650, s_side_surface_meters=7)
 box1 = Box(coords_of_cg=(3055, 0, 25), dimensions=(3650, 3320, 1500), weight=6.670)
@@ -5,7 +5,7 @@ from .models import Shipment, Carriage, Order
 class ShipmentForm(forms.ModelForm):
     class Meta:
         model = Shipment
-        fields = ["name", "length", "width", "height", "weight", "order"]
+        fields = ["name", "length", "width", "height", "weight", "amount", "order"]
         # widgets = {'order': forms.HiddenInput()}
 
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,216 @@
+import json
+import threading
+import time
+import traceback
+from dataclasses import replace
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from topology.cache import PlacementCache
+from topology.fleet import plan_fleet
+from topology.main import calculate_optimal_placement
+from topology.options import PlacementOptions
+from topology.pool import SolverPool
+from topology.progress import ProgressChannel
+from topology.result import PlacementResult
+from topology.similarity import PlacementIndex
+from .models import Carriage, Order, PlacementJob, Shipment
+
+placement_cache = PlacementCache(max_entries=settings.PLACEMENT_CACHE_ENTRIES, directory=settings.PLACEMENT_CACHE_DIR,
+                                 max_bytes=settings.PLACEMENT_CACHE_BYTES)
+placement_index = PlacementIndex(path=settings.PLACEMENT_INDEX_PATH, max_entries=settings.PLACEMENT_INDEX_ENTRIES)
+solver_pool = None
+FAILED_MESSAGE = "Не удалось рассчитать расположение грузов."
+
+
+def placement_options() -> PlacementOptions:
+    # the solver options of the settings, the same for a single carriage and for the fleet
+    return PlacementOptions(deadline=settings.PLACEMENT_DEADLINE, init=settings.PLACEMENT_INIT,
+                            seed=settings.PLACEMENT_SEED, rotations=settings.PLACEMENT_ROTATIONS,
+                            stacking=settings.PLACEMENT_STACKING, constraints=settings.PLACEMENT_CONSTRAINTS)
+
+
+def get_solver_pool() -> SolverPool | None:
+    # the pre-warmed solver processes for placements calculated inside the request, started on the first call
+    global solver_pool
+    if solver_pool is None and settings.PLACEMENT_POOL_WORKERS > 0:
+        solver_pool = SolverPool(settings.PLACEMENT_POOL_WORKERS)
+    return solver_pool
+
+
+def calculate_order(order: Order, pool: SolverPool = None, progress=None) -> tuple[PlacementResult, str]:
+    # places the shipments of the order, saves their coordinates and returns the result with the message for the user
+    # progress - callback of the optimizer, see calculate_optimal_placement
+    shipments_data = list(Shipment.objects.filter(order=order))
+    # Input for calculator:
+    boxes = [shipment.to_box for shipment in shipments_data]
+    carriage = order.carriage.to_base_model
+    # the shipments placed before keep their coordinates, only new or resized ones are placed
+    options = replace(placement_options(), incremental=True, pin_placed=settings.PLACEMENT_PIN_PLACED)
+    result = calculate_optimal_placement(platform=carriage, boxes=boxes, options=options, cache=placement_cache,
+                                         index=placement_index, pool=pool,
+                                         pool_timeout=settings.PLACEMENT_POOL_TIMEOUT, progress=progress)
+    # Save output of calculator:
+    for index, box in enumerate(boxes):
+        shipments_data[index].update_coords_from_box(box)
+        shipments_data[index].save()
+    order = Order.objects.get(pk=order.pk)
+    order.calculation_success = True
+    order.save()
+    message = "Координаты размещения грузов на платформе были успешно пересчитаны!"
+    if result.has_overlap:
+        message += f" Внимание: за {round(result.elapsed)} с не удалось устранить пересечения грузов ({result.overlaps})."
+    if not result.within_limits:
+        message += " Внимание: положение центра тяжести грузов не проходит проверку отчёта."
+    return result, message
+
+
+def stale_since():
+    return timezone.now() - timedelta(seconds=settings.PLACEMENT_STALE_AFTER)
+
+
+def is_stale(job: PlacementJob) -> bool:
+    last = job.heartbeat_at or job.started_at
+    return job.status == PlacementJob.RUNNING and last is not None and last < stale_since()
+
+
+def stale_jobs():
+    # running jobs without a heartbeat for PLACEMENT_STALE_AFTER seconds, the worker process died with them
+    since = stale_since()
+    return PlacementJob.objects.filter(Q(heartbeat_at__lt=since) | Q(heartbeat_at=None, started_at__lt=since),
+                                       status=PlacementJob.RUNNING)
+
+
+def fail_jobs(jobs, error: str) -> int:
+    # marks the jobs of the queryset failed the way run_job does, error - what went wrong for the log
+    return jobs.update(status=PlacementJob.FAILED, finished_at=timezone.now(), message=FAILED_MESSAGE, error=error)
+
+
+def requeue_jobs(jobs) -> int:
+    # puts the jobs of the queryset back into the queue, as if they were never claimed
+    return jobs.update(status=PlacementJob.PENDING, started_at=None, heartbeat_at=None)
+
+
+def fail_stale_jobs() -> int:
+    # stale jobs are failed rather than queued again, an order that kills its worker is not retried forever
+    return fail_jobs(stale_jobs(), "the worker stopped sending heartbeats")
+
+
+def calculate_fleet(order: Order, pool: SolverPool = None) -> tuple[dict, str]:
+    # the order spread over the fewest carriages of the catalogue, with the layout and the validation of every one;
+    # nothing is saved, the order keeps its own carriage and coordinates
+    # returns the plan (the JSON of get_order_fleet) and the message for the user
+    shipments_data = list(Shipment.objects.filter(order=order))
+    catalogue = list(Carriage.objects.all())
+    # without a pool the carriages are placed one after another, the worker processes are what runs in parallel
+    plans, unplaced = plan_fleet([carriage.to_base_model for carriage in catalogue],
+                                 [shipment.to_box for shipment in shipments_data],
+                                 fill=settings.PLACEMENT_FLEET_FILL, workers=1, pool=pool,
+                                 pool_timeout=settings.PLACEMENT_POOL_TIMEOUT, options=placement_options())
+    fleet = {
+        "order": order.name,
+        "carriages": [{
+            "carriage": catalogue[plan.carriage].pk,
+            "name": catalogue[plan.carriage].name,
+            "shipments": [{
+                "shipment": shipments_data[k].pk,
+                "name": shipments_data[k].name,
+                "amount": box.amount,
+                "coords_of_cg": [list(coords) for coords in (box.pieces or (box.coords_of_cg,))],
+                "rotated": list(box.pieces_rotated or (box.rotated,)),
+            } for k, box in zip(plan.shipments, plan.boxes)],
+            "overlaps": plan.result.overlaps,
+            "within_limits": plan.result.within_limits,
+            "weight": plan.report.boxes_weight,
+            "longitudinal_bias": plan.report.l_c_shipments,
+            "max_longitudinal_bias": plan.report.max_permissible_l_c_shipments,
+            "height_of_cg": plan.report.h_overall,
+            "transverse_check_needed": plan.report.is_transverse_need_check,
+        } for plan in plans],
+        "unplaced": [{
+            "shipment": shipment.pk,
+            "name": shipment.name,
+            "amount": int(count),
+        } for shipment, count in zip(shipments_data, unplaced) if count > 0],
+    }
+    message = f"Заказ распределён по вагонам: {len(plans)}."
+    if unplaced.any():
+        message += f" Не поместились ни в один вагон: {int(unplaced.sum())} шт."
+    return fleet, message
+
+
+def enqueue(order: Order, kind: str = PlacementJob.ORDER) -> PlacementJob:
+    # the waiting or running job of the order of the kind, a new one if it has none (or only a stale one)
+    fail_stale_jobs()
+    try:
+        with transaction.atomic():
+            return PlacementJob.objects.create(order=order, kind=kind)
+    except IntegrityError:
+        # a concurrent request queued the order first
+        return PlacementJob.objects.get(order=order, kind=kind, status__in=PlacementJob.ACTIVE)
+
+
+def active_job(order: Order, kind: str = PlacementJob.ORDER) -> PlacementJob | None:
+    return PlacementJob.objects.filter(order=order, kind=kind, status__in=PlacementJob.ACTIVE).first()
+
+
+def claim_next() -> PlacementJob | None:
+    # the oldest waiting job, marked running; the conditional update makes sure only one worker gets it
+    fail_stale_jobs()
+    for job in PlacementJob.objects.filter(status=PlacementJob.PENDING).order_by("id")[:10]:
+        claimed = PlacementJob.objects.filter(pk=job.pk, status=PlacementJob.PENDING).update(
+            status=PlacementJob.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def publish_progress(job_id: int, channel: ProgressChannel):
+    # saves the latest progress frame of the job at most every PLACEMENT_PROGRESS_INTERVAL seconds, in its own
+    # thread, so the optimizer never waits for the database; the frames in between are dropped
+    # the heartbeat of the job is saved with every frame, and every PLACEMENT_HEARTBEAT seconds without one
+    try:
+        while (frame := channel.get(settings.PLACEMENT_HEARTBEAT)) is not None or not channel.closed:
+            if frame is None:
+                PlacementJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now())
+                continue
+            PlacementJob.objects.filter(pk=job_id).update(progress=json.dumps(frame), heartbeat_at=timezone.now())
+            time.sleep(settings.PLACEMENT_PROGRESS_INTERVAL)
+    finally:
+        connection.close()
+
+
+def run_job(job_id: int):
+    job = PlacementJob.objects.select_related("order").get(pk=job_id)
+    channel = ProgressChannel()
+    publisher = threading.Thread(target=publish_progress, args=(job_id, channel), daemon=True)
+    publisher.start()
+    try:
+        if job.kind == PlacementJob.FLEET:
+            start = time.perf_counter()
+            fleet, job.message = calculate_fleet(job.order)
+            job.result = json.dumps(fleet)
+            job.overlaps = sum(carriage["overlaps"] for carriage in fleet["carriages"])
+            job.within_limits = all(carriage["within_limits"] for carriage in fleet["carriages"])
+            job.elapsed = time.perf_counter() - start
+        else:
+            result, job.message = calculate_order(job.order, progress=channel.publish)
+            job.overlaps, job.within_limits, job.elapsed = result.overlaps, result.within_limits, result.elapsed
+        job.status = PlacementJob.DONE
+    except Exception:
+        job.error = traceback.format_exc()
+        job.message = FAILED_MESSAGE
+        job.status = PlacementJob.FAILED
+    finally:
+        channel.close()
+        publisher.join()
+    job.finished_at = timezone.now()
+    # the last saved progress frame stays
+    job.save(update_fields=["status", "message", "overlaps", "within_limits", "elapsed", "error", "finished_at",
+                            "result"])
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from topology.pool import worker_threads
+from web_app.jobs import claim_next, fail_jobs, requeue_jobs, run_job
+from web_app.worker import init_worker
+from web_app.models import PlacementJob
+
+
+def start_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=init_worker,
+                               initargs=(worker_threads(workers),))
+
+
+class Command(BaseCommand):
+    help = "Runs the queued placement calculations on a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.PLACEMENT_WORKERS,
+                            help="placements calculated at the same time")
+        parser.add_argument("--poll", type=float, default=settings.PLACEMENT_POLL,
+                            help="seconds between looks at the queue when it is empty")
+        parser.add_argument("--once", action="store_true", help="exit as soon as the queue is empty")
+        parser.add_argument("--requeue", action="store_true",
+                            help="put jobs left running by a stopped worker back into the queue first")
+
+    def finish(self, future, job_id: int) -> bool:
+        # records the end of the job, True if its worker process died
+        error = future.exception()
+        if error is not None:
+            # run_job records failures of the placement itself, this is the worker process failing; when one
+            # process dies all the jobs of the pool fail, it is not known which one killed it
+            fail_jobs(PlacementJob.objects.filter(pk=job_id), repr(error))
+        self.stdout.write(f"job {job_id}: {PlacementJob.objects.get(pk=job_id).status}")
+        return isinstance(error, BrokenProcessPool)
+
+    def handle(self, *args, workers, poll, once, requeue, **options):
+        if requeue:
+            count = requeue_jobs(PlacementJob.objects.filter(status=PlacementJob.RUNNING))
+            self.stdout.write(f"{count} jobs put back into the queue")
+        # the database connection of this process is not shared with the spawned workers
+        connection.close()
+        pool = start_pool(workers)
+        running = {}
+        try:
+            while True:
+                broken = False
+                while not broken and len(running) < workers and (job := claim_next()) is not None:
+                    self.stdout.write(f"job {job.pk}: order {job.order_id}")
+                    try:
+                        running[pool.submit(run_job, job.pk)] = job.pk
+                    except BrokenProcessPool:
+                        # a worker died since the last look, this job never started
+                        requeue_jobs(PlacementJob.objects.filter(pk=job.pk))
+                        broken = True
+                if not running and not broken:
+                    if once:
+                        break
+                    time.sleep(poll)
+                    continue
+                done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    broken |= self.finish(future, running.pop(future))
+                if broken:
+                    # every job left in the broken pool fails as well, then new processes take the queue
+                    self.stdout.write("a worker process died, starting new ones")
+                    for future in wait(running).done:
+                        self.finish(future, running.pop(future))
+                    pool.shutdown(wait=False)
+                    pool = start_pool(workers)
+        finally:
+            pool.shutdown()
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:16
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0001_squashed_0005_order_calculation_success_alter_order_carriage_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='pieces',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AlterField(
+            model_name='shipment',
+            name='amount',
+            field=models.IntegerField(default=1, help_text='Количество (шт)', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0006_shipment_pieces'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='pieces_rotated',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='rotated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
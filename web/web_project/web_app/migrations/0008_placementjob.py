@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0007_shipment_rotated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlacementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, default='')),
+                ('overlaps', models.IntegerField(blank=True, null=True)),
+                ('within_limits', models.BooleanField(blank=True, null=True)),
+                ('elapsed', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='placement_jobs', to='web_app.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'running'))), fields=('order',), name='one_active_placement_job_per_order')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0008_placementjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placementjob',
+            name='progress',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0009_placementjob_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placementjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
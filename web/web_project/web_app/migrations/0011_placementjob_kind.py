@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0010_placementjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='placementjob',
+            name='one_active_placement_job_per_order',
+        ),
+        migrations.AddField(
+            model_name='placementjob',
+            name='kind',
+            field=models.CharField(choices=[('order', 'Расположение грузов'), ('fleet', 'Распределение по вагонам')], default='order', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='placementjob',
+            name='result',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddConstraint(
+            model_name='placementjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'running'))), fields=('order', 'kind'), name='one_active_placement_job_per_order_and_kind'),
+        ),
+    ]
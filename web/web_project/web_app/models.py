@@ -1,5 +1,6 @@
+import numpy as np
 from django.contrib.contenttypes.fields import GenericRelation
-from django.core.validators import int_list_validator
+from django.core.validators import MinValueValidator, int_list_validator
 from django.db import models
 from django.utils import timezone
 
@@ -12,9 +13,14 @@ class Shipment(models.Model):
     width = models.IntegerField(help_text='Ширина (мм)')
     height = models.IntegerField(help_text='Высота (мм)')
     weight = models.FloatField(help_text='Вес (кг)')
-    amount = models.IntegerField(help_text='Количество (шт)', default=1)
+    amount = models.IntegerField(help_text='Количество (шт)', default=1, validators=[MinValueValidator(1)])
     order = models.ForeignKey("Order", on_delete=models.CASCADE)
     coords_of_cg = models.CharField(validators=[int_list_validator], default="0,0,0", max_length=200)
+    # coords of every piece when amount > 1 as packed little-endian int32 triples
+    pieces = models.BinaryField(default=b"", blank=True)
+    # turned by 90° on the floor, for every piece when amount > 1 as one byte per piece
+    rotated = models.BooleanField(default=False)
+    pieces_rotated = models.BinaryField(default=b"", blank=True)
     primary_key = True
 
     # Metadata
@@ -27,10 +33,16 @@ class Shipment(models.Model):
 
     @property
     def to_box(self) -> BoxBase:
-        return BoxBase(dimensions=(int(self.length), int(self.width), int(self.height)), weight=float(self.weight), coords_of_cg=tuple(int(v) for v in (self.coords_of_cg.split(",") or [])))
+        pieces = np.frombuffer(bytes(self.pieces), dtype="<i4").reshape(-1, 3)
+        return BoxBase(dimensions=(int(self.length), int(self.width), int(self.height)), weight=float(self.weight), coords_of_cg=tuple(int(v) for v in (self.coords_of_cg.split(",") or [])),
+                       amount=int(self.amount), pieces=tuple(map(tuple, pieces.tolist())), rotated=bool(self.rotated),
+                       pieces_rotated=tuple(np.frombuffer(bytes(self.pieces_rotated), dtype=np.uint8).astype(bool).tolist()))
 
     def update_coords_from_box(self, box: BoxBase) -> None:
         self.coords_of_cg = ",".join(str(coord) for coord in box.coords_of_cg)
+        self.pieces = np.array(box.pieces, dtype="<i4").tobytes()
+        self.rotated = box.rotated
+        self.pieces_rotated = np.array(box.pieces_rotated, dtype=np.uint8).tobytes()
 
 
 class Carriage(models.Model):
@@ -72,3 +84,47 @@ class Order(models.Model):
     def __str__(self):
         """String for representing the MyModelName object (in Admin site etc.)."""
         return self.name
+
+
+class PlacementJob(models.Model):
+    # one placement calculation of an order run by the placement_worker command: its own carriage ("order") or
+    # the carriages of the catalogue ("fleet"); an order has at most one job of a kind waiting or running at
+    # a time, repeated "calculate" clicks get that job back
+    ORDER = "order"
+    FLEET = "fleet"
+    KINDS = [(ORDER, "Расположение грузов"), (FLEET, "Распределение по вагонам")]
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "В очереди"), (RUNNING, "Выполняется"), (DONE, "Готово"), (FAILED, "Ошибка")]
+    ACTIVE = (PENDING, RUNNING)
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="placement_jobs")
+    kind = models.CharField(max_length=16, choices=KINDS, default=ORDER)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # saved by the worker every PLACEMENT_HEARTBEAT seconds while the job runs, see jobs.stale_jobs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    message = models.TextField(blank=True, default="")  # shown on the order page once the job is done
+    overlaps = models.IntegerField(null=True, blank=True)
+    within_limits = models.BooleanField(null=True, blank=True)
+    elapsed = models.FloatField(null=True, blank=True)  # seconds of the placement itself
+    error = models.TextField(blank=True, default="")
+    # JSON of the latest topology.progress.progress_frame of the running optimizer, streamed to the order page
+    progress = models.TextField(blank=True, default="")
+    # JSON of the plan of a finished "fleet" job, see jobs.calculate_fleet
+    result = models.TextField(blank=True, default="")
+
+    # Metadata
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=["order", "kind"], condition=models.Q(status__in=("pending", "running")),
+                                    name="one_active_placement_job_per_order_and_kind"),
+        ]
+
+    def __str__(self):
+        return f"{self.order} ({self.status})"
@@ -1,3 +1,111 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .jobs import FAILED_MESSAGE, claim_next, enqueue
+from .models import Carriage, Order, PlacementJob
+
+
+def make_order(name="Заказ") -> Order:
+    carriage = Carriage.objects.create(name="Платформа", floor_length=13400, floor_width=2870, weight=21,
+                                       height_from_rails=1310, cg_height_from_rails=800, base_length=9720,
+                                       s_side_surface_meters=7)
+    return Order.objects.create(name=name, carriage=carriage)
+
+
+def go_stale(job: PlacementJob):
+    # the worker of the job stopped sending heartbeats long ago
+    long_ago = timezone.now() - timedelta(hours=1)
+    PlacementJob.objects.filter(pk=job.pk).update(status=PlacementJob.RUNNING, started_at=long_ago,
+                                                  heartbeat_at=long_ago)
+
+
+class EnqueueTests(TestCase):
+    def setUp(self):
+        self.order = make_order()
+
+    def test_repeated_clicks_get_the_active_job(self):
+        job = enqueue(self.order)
+        self.assertEqual(enqueue(self.order).pk, job.pk)
+        PlacementJob.objects.filter(pk=job.pk).update(status=PlacementJob.RUNNING, heartbeat_at=timezone.now())
+        self.assertEqual(enqueue(self.order).pk, job.pk)
+        self.assertEqual(PlacementJob.objects.filter(order=self.order).count(), 1)
+
+    def test_kinds_are_queued_separately(self):
+        job = enqueue(self.order)
+        fleet = enqueue(self.order, PlacementJob.FLEET)
+        self.assertNotEqual(fleet.pk, job.pk)
+        self.assertEqual(enqueue(self.order, PlacementJob.FLEET).pk, fleet.pk)
+
+    def test_finished_job_is_not_reused(self):
+        # the constraint only covers the waiting and running jobs
+        for status in (PlacementJob.DONE, PlacementJob.FAILED):
+            job = enqueue(self.order)
+            PlacementJob.objects.filter(pk=job.pk).update(status=status, finished_at=timezone.now())
+            self.assertNotEqual(enqueue(self.order).pk, job.pk)
+            PlacementJob.objects.filter(order=self.order, status=PlacementJob.PENDING).delete()
+
+    def test_stale_job_is_failed_and_replaced(self):
+        job = enqueue(self.order)
+        go_stale(job)
+        new = enqueue(self.order)
+        self.assertNotEqual(new.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlacementJob.FAILED)
+        self.assertEqual(job.message, FAILED_MESSAGE)
+        self.assertIsNotNone(job.finished_at)
+
+
+class ClaimTests(TestCase):
+    def test_claims_the_oldest_waiting_job(self):
+        first = enqueue(make_order("Первый"))
+        second = enqueue(make_order("Второй"))
+        self.assertEqual(claim_next().pk, first.pk)
+        job = claim_next()
+        self.assertEqual(job.pk, second.pk)
+        self.assertEqual(job.status, PlacementJob.RUNNING)
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertIsNone(claim_next())
+
+    def test_stale_job_is_failed_not_claimed(self):
+        job = enqueue(make_order())
+        go_stale(job)
+        self.assertIsNone(claim_next())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlacementJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_recent_heartbeat_is_not_stale(self):
+        job = enqueue(make_order())
+        claim_next()
+        enqueue(job.order)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlacementJob.RUNNING)
+
+
+@override_settings(PLACEMENT_PROGRESS_INTERVAL=0.01, PLACEMENT_EVENTS_DURATION=0.05)
+class PlacementJobEventsTests(TestCase):
+    def setUp(self):
+        self.job = enqueue(make_order())
+
+    def events(self) -> list[str]:
+        response = self.client.get(reverse("get_placement_job_events", kwargs={"pk": self.job.pk}))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return b"".join(response.streaming_content).decode().split("\n\n")[:-1]
+
+    def test_waiting_job_stream_ends_with_retry(self):
+        events = self.events()
+        self.assertTrue(events[-1].startswith("event: retry\n"))
+        self.assertTrue(all(event == ": waiting" for event in events[:-1]))
+
+    def test_finished_job_stream_ends_with_done(self):
+        PlacementJob.objects.filter(pk=self.job.pk).update(status=PlacementJob.DONE, progress='{"step": 1}')
+        self.assertEqual(self.events(), ['data: {"step": 1}', 'event: done\ndata: "done"'])
+
+    def test_stale_job_stream_ends_with_failed(self):
+        go_stale(self.job)
+        self.assertEqual(self.events(), ['event: done\ndata: "failed"'])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, PlacementJob.FAILED)
@@ -1,14 +1,21 @@
+import json
+import time
+
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, DetailView, ListView, UpdateView
 
 from documentgen.drawing import generate_drawing
 from documentgen.validation_report import generate_pdf_report_bytes
-from topology.main import calculate_optimal_placement
+from topology.pool import WorkerDied
+from validation.models import expand_pieces
 from .forms import CarriageForm, OrderForm, ShipmentForm
-from .models import Carriage, Order, Shipment
+from .jobs import (FAILED_MESSAGE, calculate_fleet, calculate_order, enqueue, fail_stale_jobs, get_solver_pool,
+                   is_stale)
+from .models import Carriage, Order, PlacementJob, Shipment
 
 
 class ShipmentListView(ListView):
@@ -43,6 +50,15 @@ class ShipmentUpdateView(UpdateView):
     template_name = 'shipment/shipment_form.html'
     context_object_name = 'shipment'
 
+    def form_valid(self, form):
+        # a resized shipment no longer fits its old place and is placed again like a new one
+        if {"length", "width", "height"} & set(form.changed_data):
+            form.instance.coords_of_cg = Shipment._meta.get_field("coords_of_cg").default
+            form.instance.pieces = Shipment._meta.get_field("pieces").default
+            form.instance.rotated = Shipment._meta.get_field("rotated").default
+            form.instance.pieces_rotated = Shipment._meta.get_field("pieces_rotated").default
+        return super().form_valid(form)
+
     def get_success_url(self):
         order_id = self.kwargs["order_id"]
         order = Order.objects.get(pk=order_id)
@@ -94,6 +110,7 @@ class OrderDetailView(DetailView):
         context = self.get_context_data(object=self.object)
         shipments = Shipment.objects.filter(order=self.object)
         context["shipments"] = shipments
+        context["placement_job"] = PlacementJob.objects.filter(order=self.object, kind=PlacementJob.ORDER).last()
         if "success_message" in request.session:
             context["success_message"] = request.session["success_message"]
             del request.session["success_message"]
@@ -117,27 +134,113 @@ class OrderUpdateView(UpdateView):
 
 def update_shipment_coordinates(request, pk: int):
     order = Order.objects.get(pk=pk)
-    shipments_data = list(Shipment.objects.filter(order=order))
-    # Input for calculator:
-    boxes = [shipment.to_box for shipment in shipments_data]
-    carriage = order.carriage.to_base_model
-    calculate_optimal_placement(platform=carriage, boxes=boxes)
-    # Save output of calculator:
-    for index, box in enumerate(boxes):
-        shipments_data[index].update_coords_from_box(box)
-        shipments_data[index].save()
-    order = Order.objects.get(pk=pk)
-    order.calculation_success = True
-    order.save()
-    request.session['success_message'] = "Координаты размещения грузов на платформе были успешно пересчитаны!"
+    if settings.PLACEMENT_BACKGROUND:
+        # the placement_worker command calculates it, the order page follows the job
+        enqueue(order)
+        request.session['success_message'] = "Расчёт расположения грузов поставлен в очередь."
+        return redirect(reverse('order_detail', kwargs={'pk': pk}))
+    try:
+        _, request.session['success_message'] = calculate_order(order, get_solver_pool())
+    except (TimeoutError, WorkerDied):
+        request.session['success_message'] = FAILED_MESSAGE
     return redirect(reverse('order_detail', kwargs={'pk': pk}))
 
 
+def job_status(job: PlacementJob) -> dict:
+    return {
+        "id": job.pk,
+        "order": job.order_id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "heartbeat_at": job.heartbeat_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def get_placement_job_status(request, pk: int):
+    return JsonResponse(job_status(get_object_or_404(PlacementJob, pk=pk)))
+
+
+def get_placement_job_result(request, pk: int):
+    # the outcome and the saved coordinates of a finished job, 202 while it is still waiting or running
+    job = get_object_or_404(PlacementJob, pk=pk)
+    if job.status in PlacementJob.ACTIVE:
+        return JsonResponse(job_status(job), status=202)
+    if job.kind == PlacementJob.FLEET:
+        return JsonResponse(dict(job_status(job), message=job.message, overlaps=job.overlaps,
+                                 within_limits=job.within_limits, elapsed=job.elapsed,
+                                 fleet=json.loads(job.result) if job.result else None))
+    shipments = Shipment.objects.filter(order=job.order) if job.status == PlacementJob.DONE else []
+    return JsonResponse(dict(job_status(job), message=job.message, overlaps=job.overlaps,
+                             within_limits=job.within_limits, elapsed=job.elapsed, shipments=[{
+                                 "shipment": shipment.pk,
+                                 "name": shipment.name,
+                                 "coords_of_cg": [list(coords) for coords in
+                                                  (shipment.to_box.pieces or (shipment.to_box.coords_of_cg,))],
+                                 "rotated": list(shipment.to_box.pieces_rotated or (shipment.rotated,)),
+                             } for shipment in shipments]))
+
+
+def placement_job_events(job: PlacementJob):
+    # server-sent events of the job: a progress frame whenever the worker saved a new one, a comment line
+    # to keep the connection open otherwise, and a "done" event with the status once the job is finished
+    # (a job whose worker died is failed first); after PLACEMENT_EVENTS_DURATION seconds the stream ends with
+    # a "retry" event and the browser opens a new one, a request never holds a server thread for long
+    sent = None
+    end = time.monotonic() + settings.PLACEMENT_EVENTS_DURATION
+    while True:
+        job.refresh_from_db(fields=["status", "progress", "started_at", "heartbeat_at"])
+        if is_stale(job):
+            fail_stale_jobs()
+            continue
+        if job.progress and job.progress != sent:
+            sent = job.progress
+            yield f"data: {sent}\n\n"
+        elif job.status in PlacementJob.ACTIVE:
+            yield ": waiting\n\n"
+        if job.status not in PlacementJob.ACTIVE:
+            yield f"event: done\ndata: {json.dumps(job.status)}\n\n"
+            return
+        if time.monotonic() >= end:
+            yield f"event: retry\nretry: {settings.PLACEMENT_EVENTS_RETRY}\ndata: {json.dumps(job.status)}\n\n"
+            return
+        time.sleep(settings.PLACEMENT_PROGRESS_INTERVAL)
+
+
+def get_placement_job_events(request, pk: int):
+    response = StreamingHttpResponse(placement_job_events(get_object_or_404(PlacementJob, pk=pk)),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx would hold the frames back in its buffer
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def get_order_fleet(request, pk: int):
+    # the order spread over the fewest carriages of the catalogue, see jobs.calculate_fleet; in the background
+    # the request queues a "fleet" job (or joins the waiting one) and answers 202 with its status, the plan is
+    # polled from its result URL like the placement of the order
+    order = get_object_or_404(Order, pk=pk)
+    if settings.PLACEMENT_BACKGROUND:
+        job = enqueue(order, PlacementJob.FLEET)
+        url = reverse('get_placement_job_result', kwargs={'pk': job.pk})
+        response = JsonResponse(dict(job_status(job), result=url), status=202)
+        response["Location"] = url
+        return response
+    try:
+        fleet, _ = calculate_fleet(order, get_solver_pool())
+    except (TimeoutError, WorkerDied):
+        return JsonResponse({"order": order.name, "error": "Не удалось распределить заказ по вагонам."}, status=503)
+    return JsonResponse(fleet)
+
+
 def get_order_drawing(request, pk: int):
     order = Order.objects.get(pk=pk)
     shipments_data = Shipment.objects.filter(order=order)
     # Input for drawer:
-    boxes = [shipment.to_box for shipment in shipments_data]
+    boxes = expand_pieces([shipment.to_box for shipment in shipments_data])
     carriage = order.carriage.to_base_model
     # Output of drawer:
     file = generate_drawing(boxes=boxes, carriage=carriage)
@@ -153,7 +256,7 @@ def get_order_validation_report(request, pk: int):
     order = Order.objects.get(pk=pk)
     shipments_data = Shipment.objects.filter(order=order)
     # Input for drawer:
-    boxes = [shipment.to_box for shipment in shipments_data]
+    boxes = expand_pieces([shipment.to_box for shipment in shipments_data])
     carriage = order.carriage.to_base_model
     # Output of drawer:
     file = generate_pdf_report_bytes(order=order, boxes=boxes, carriage=carriage)
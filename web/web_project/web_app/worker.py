@@ -0,0 +1,10 @@
+import django
+
+from topology.pool import prepare_worker
+
+
+def init_worker(threads: int):
+    # initializer of the placement_worker processes, they are prepared like the SolverPool ones; a spawned process
+    # imports this module before Django is set up, so it must not import the models
+    django.setup()
+    prepare_worker(threads)
@@ -126,3 +126,50 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Placement calculation
+# Seconds the optimizer may spend inside the "calculate" request, the best feasible layout found so far is saved
+PLACEMENT_DEADLINE = 10
+# Shipments that already have coordinates keep them and only new or resized ones are placed
+PLACEMENT_PIN_PLACED = False
+# "constructive" starts new shipments from the first-fit-decreasing layout instead of random positions
+PLACEMENT_INIT = "constructive"
+# Seed of the random start positions, the same order always gets the same layout
+PLACEMENT_SEED = 0
+# Solved layouts are kept in memory and on disk, resubmitting an unchanged order returns the stored layout
+PLACEMENT_CACHE_ENTRIES = 128
+PLACEMENT_CACHE_DIR = BASE_DIR / 'placement_cache'
+PLACEMENT_CACHE_BYTES = 64 * 1024 * 1024
+# Solved orders, new orders start from the layout of the most similar one
+PLACEMENT_INDEX_PATH = BASE_DIR / 'placement_index.json'
+PLACEMENT_INDEX_ENTRIES = 1000
+# Sets of 0°/90° floor orientations of the shipments tried at once, 1 keeps every shipment as entered
+PLACEMENT_ROTATIONS = 4
+# Shipments may be put on top of each other, the center of mass of the cargo is kept under MAX_HEIGHT
+PLACEMENT_STACKING = False
+# "lagrangian" or "penalty" keeps the center of mass within the limits of the validation report while placing
+PLACEMENT_CONSTRAINTS = "lagrangian"
+# "Calculate" only queues the order, the placement_worker command calculates it with PLACEMENT_WORKERS processes
+# and looks for new jobs every PLACEMENT_POLL seconds; False calculates it inside the request
+PLACEMENT_BACKGROUND = True
+PLACEMENT_WORKERS = 2
+PLACEMENT_POLL = 1.0
+# Seconds between the progress frames of a running job saved by the worker and sent to the order page
+PLACEMENT_PROGRESS_INTERVAL = 0.5
+# Seconds between the heartbeats of a running job, and without one after which its worker is taken for dead:
+# the job fails and the order can be queued again
+PLACEMENT_HEARTBEAT = 5
+PLACEMENT_STALE_AFTER = 60
+# Seconds a progress stream of the order page stays open, the browser reconnects after PLACEMENT_EVENTS_RETRY ms;
+# every open stream holds a server thread, serve the site threaded (runserver, gunicorn --threads) or over ASGI
+PLACEMENT_EVENTS_DURATION = 60
+PLACEMENT_EVENTS_RETRY = 1000
+# Pre-warmed solver processes started with the server for placements calculated inside the request
+# (PLACEMENT_BACKGROUND = False), 0 - calculated in the request thread itself; seconds the request waits for
+# a placement (all the carriages of a fleet together) from the pool, a worker stuck on it is replaced
+PLACEMENT_POOL_WORKERS = 0
+PLACEMENT_POOL_TIMEOUT = 120
+# Orders spread over the carriage catalogue: share of every floor the bin packing fills; the carriages are
+# placed by a "fleet" job of the placement_worker, or on the pool inside the request like the order itself
+PLACEMENT_FLEET_FILL = 0.85
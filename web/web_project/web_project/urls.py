@@ -20,8 +20,8 @@ from django.views.generic import RedirectView
 
 from web_app.views import CarriageCreateView, CarriageDetailView, CarriageListView, CarriageUpdateView, \
     OrderCreateView, OrderDetailView, OrderListView, OrderUpdateView, ShipmentCreateView, \
-    ShipmentDetailView, ShipmentUpdateView, get_order_drawing, get_order_validation_report, \
-    update_shipment_coordinates
+    ShipmentDetailView, ShipmentUpdateView, get_order_drawing, get_order_fleet, get_order_validation_report, \
+    get_placement_job_events, get_placement_job_result, get_placement_job_status, update_shipment_coordinates
 from django.urls import path
 
 urlpatterns = [
@@ -41,5 +41,9 @@ urlpatterns = [
     path('orders/<int:pk>/edit/', OrderUpdateView.as_view(), name='order_edit'),
     path('orders/<int:pk>/drawing/', get_order_drawing, name='get_order_drawing'),
     path('orders/<int:pk>/validation-report/', get_order_validation_report, name='get_order_validation_report'),
+    path('orders/<int:pk>/fleet/', get_order_fleet, name='get_order_fleet'),
+    path('placement-jobs/<int:pk>/', get_placement_job_status, name='get_placement_job_status'),
+    path('placement-jobs/<int:pk>/result/', get_placement_job_result, name='get_placement_job_result'),
+    path('placement-jobs/<int:pk>/events/', get_placement_job_events, name='get_placement_job_events'),
     # Другие URL-маршруты вашего приложения...
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_project.settings')
 
 application = get_wsgi_application()
+
+# the pre-warmed solver processes start with the server, not with the first request
+from web_app.jobs import get_solver_pool  # noqa: E402
+
+get_solver_pool()